@@ -0,0 +1,345 @@
+import os
+import stat
+import zlib
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict, List, Set, Tuple, Union
+
+from ._elf import ELF_MAGIC, get_needed_libraries
+
+# mksquashfs compresses files in blocks of this size by default
+_block_size = 128 * 1024
+
+# large files are estimated from evenly spaced samples, which keeps the analysis of large AppDirs quick
+_max_sampled_blocks = 8
+
+# number of files inspected per task
+_files_per_chunk = 64
+
+# only the beginning of every sampled block is compressed, deflate's window is just as large, so the ratio is similar
+_sample_size = 32 * 1024
+
+
+def _scan_directory(path: str) -> Tuple[List[Tuple[str, os.stat_result]], List[str]]:
+    """
+    :return: non-directory entries with their lstat() results, subdirectories
+    """
+
+    files = []
+    subdirs = []
+
+    with os.scandir(path) as it:
+        for entry in it:
+            if entry.is_dir(follow_symlinks=False):
+                subdirs.append(entry.path)
+            else:
+                files.append((entry.path, entry.stat(follow_symlinks=False)))
+
+    return files, subdirs
+
+
+def walk_parallel(root: str, workers: int = None) -> List[Tuple[str, os.stat_result]]:
+    """
+    Collect all non-directory entries below root, scanning directories in parallel. This helps on cold caches and
+    network filesystems, where most of the time is spent waiting for the filesystem.
+
+    :return: paths of the entries with their lstat() results, in no particular order
+    """
+
+    rv = []
+
+    with ThreadPoolExecutor(workers) as executor:
+        pending = {executor.submit(_scan_directory, root)}
+
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                files, subdirs = future.result()
+                rv += files
+                pending |= {executor.submit(_scan_directory, subdir) for subdir in subdirs}
+
+    return rv
+
+
+def _inspect_file(path: str, size: int) -> Tuple[int, Union[List[str], None]]:
+    """
+    Estimate how well a file compresses, and read the libraries it depends on if it is an ELF file.
+
+    The estimate compresses samples of the file's blocks with zlib (like mksquashfs with its default gzip compression,
+    but with the fastest level). It is a rough upper bound, as mksquashfs also packs the tails of small files
+    together, and removes duplicates.
+
+    :return: estimated compressed size, names of the needed libraries or None if the file is not an ELF file
+    """
+
+    blocks = (size + _block_size - 1) // _block_size
+
+    if blocks <= _max_sampled_blocks:
+        indices = range(blocks)
+    else:
+        indices = [i * blocks // _max_sampled_blocks for i in range(_max_sampled_blocks)]
+
+    sampled = 0
+    compressed = 0
+    is_elf = False
+
+    with open(path, "rb") as f:
+        for index in indices:
+            f.seek(index * _block_size)
+            data = f.read(_sample_size)
+
+            if index == 0:
+                is_elf = data[:4] == ELF_MAGIC
+
+            sampled += len(data)
+            # mksquashfs stores blocks uncompressed if compressing them doesn't help
+            compressed += min(len(zlib.compress(data, 1)), len(data))
+
+    estimate = round(size * compressed / sampled) if sampled else 0
+
+    return estimate, get_needed_libraries(path) if is_elf else None
+
+
+def _is_library(path: str) -> bool:
+    filename = os.path.basename(path)
+    return filename.endswith(".so") or ".so." in filename
+
+
+def _find_chains(roots: List[str], dependencies: Dict[str, List[str]]) -> Dict[str, List[str]]:
+    """
+    :return: ELF file -> shortest chain of ELF files which leads to it, starting at one of the roots
+    """
+
+    rv = {root: [root] for root in roots}
+    queue = deque(roots)
+
+    while queue:
+        path = queue.popleft()
+
+        for dep in dependencies[path]:
+            if dep not in rv:
+                rv[dep] = rv[path] + [dep]
+                queue.append(dep)
+
+    return rv
+
+
+def _get_closure(path: str, dependencies: Dict[str, List[str]]) -> Set[str]:
+    """
+    :return: the ELF file and all the files it depends on, directly or indirectly
+    """
+
+    rv = {path}
+    stack = [path]
+
+    while stack:
+        for dep in dependencies[stack.pop()]:
+            if dep not in rv:
+                rv.add(dep)
+                stack.append(dep)
+
+    return rv
+
+
+def _analyze_libraries(files: Dict[str, dict], symlinks: Dict[str, str]) -> Dict[str, dict]:
+    """
+    Resolve the libraries needed by the ELF files in the AppDir (by file name, like linuxdeploy deploys them), and
+    find out why each library is there.
+
+    :param files: relative path -> file info of all regular files
+    :param symlinks: relative path -> relative path of the target of all symlinks within the AppDir
+    :return: relative path -> size, needed libraries, size including all libraries it pulls in (closure_size) and the
+        shortest chain of ELF files which leads to the library (chain)
+    """
+
+    elf_files = {path: info for path, info in files.items() if info["needed"] is not None}
+
+    by_name = {}
+
+    for path in sorted(elf_files):
+        by_name.setdefault(os.path.basename(path), path)
+
+    # libraries are usually referenced by their SONAME, which is a symlink to the actual file
+    for path, target in sorted(symlinks.items()):
+        if target in elf_files:
+            by_name.setdefault(os.path.basename(path), target)
+
+    # files linked without SONAME are referenced by the path they were linked with
+    dependencies = {
+        path: sorted({by_name[os.path.basename(i)] for i in info["needed"] if os.path.basename(i) in by_name} - {path})
+        for path, info in elf_files.items()
+    }
+
+    # the ELF files nothing depends on are the entry points, e.g., the main binary or plugins
+    needed_by_anything = {dep for deps in dependencies.values() for dep in deps}
+    chains = _find_chains(sorted((path for path in elf_files if path not in needed_by_anything)), dependencies)
+
+    rv = {}
+
+    for path, info in elf_files.items():
+        if not _is_library(path):
+            continue
+
+        rv[path] = {
+            "size": info["size"],
+            "needed": info["needed"],
+            "closure_size": sum((elf_files[i]["size"] for i in _get_closure(path, dependencies))),
+            "chain": chains.get(path, []),
+        }
+
+    return rv
+
+
+def _collect_files(appdir: str, workers: int = None) -> Tuple[Dict[str, dict], Dict[str, str]]:
+    """
+    :return: relative path -> size of all regular files, relative path -> target of all symlinks
+    """
+
+    files = {}
+    symlinks = {}
+    seen_inodes = set()
+
+    prefix_length = len(appdir) + 1
+
+    for path, path_stat in walk_parallel(appdir, workers):
+        relpath = path[prefix_length:]
+
+        if stat.S_ISLNK(path_stat.st_mode):
+            symlinks[relpath] = os.path.normpath(os.path.join(os.path.dirname(relpath), os.readlink(path)))
+            continue
+
+        if not stat.S_ISREG(path_stat.st_mode):
+            continue
+
+        inode = (path_stat.st_dev, path_stat.st_ino)
+
+        files[relpath] = {
+            "size": path_stat.st_size,
+            "hardlink": inode in seen_inodes,
+        }
+
+        seen_inodes.add(inode)
+
+    return files, symlinks
+
+
+def _inspect_files(appdir: str, files: Dict[str, dict], workers: int = None):
+    """
+    Add the compressed size estimate and the needed libraries to the file infos.
+    """
+
+    def inspect_chunk(relpaths: List[str]) -> list:
+        return [_inspect_file(os.path.join(appdir, relpath), files[relpath]["size"]) for relpath in relpaths]
+
+    relpaths = list(files.keys())
+
+    # most files are small, so they're inspected in chunks to keep the overhead of the thread pool low
+    chunks = []
+
+    for start in range(0, len(relpaths), _files_per_chunk):
+        end = start + _files_per_chunk
+        chunks.append(relpaths[start:end])
+
+    with ThreadPoolExecutor(workers) as executor:
+        for chunk, results in zip(chunks, executor.map(inspect_chunk, chunks)):
+            for relpath, (estimate, needed) in zip(chunk, results):
+                files[relpath]["estimated_compressed_size"] = estimate
+                files[relpath]["needed"] = needed
+
+
+def _sum_directories(files: Dict[str, dict]) -> Dict[str, dict]:
+    """
+    :return: relative path -> size and estimated compressed size of every directory including its subdirectories,
+        "." is the AppDir itself
+    """
+
+    rv = {".": {"size": 0, "estimated_compressed_size": 0}}
+
+    for relpath, info in files.items():
+        if info["hardlink"]:
+            continue
+
+        dirname = os.path.dirname(relpath)
+
+        while True:
+            directory = rv.setdefault(dirname or ".", {"size": 0, "estimated_compressed_size": 0})
+            directory["size"] += info["size"]
+            directory["estimated_compressed_size"] += info["estimated_compressed_size"]
+
+            if not dirname:
+                break
+
+            dirname = os.path.dirname(dirname)
+
+    return rv
+
+
+def analyze_appdir(appdir: str, workers: int = None) -> dict:
+    """
+    Analyze size and composition of an AppDir.
+
+    Sizes are apparent file sizes. Hardlinked files are only counted once in the totals, symlinks are not counted.
+
+    :return: JSON serializable report
+    """
+
+    appdir = os.path.abspath(appdir)
+
+    files, symlinks = _collect_files(appdir, workers)
+    _inspect_files(appdir, files, workers)
+
+    directories = _sum_directories(files)
+
+    return {
+        "path": appdir,
+        "file_count": len(files),
+        "symlink_count": len(symlinks),
+        "total_size": directories["."]["size"],
+        "estimated_compressed_size": directories["."]["estimated_compressed_size"],
+        "directories": directories,
+        "files": {relpath: info["size"] for relpath, info in files.items()},
+        "libraries": _analyze_libraries(files, symlinks),
+    }
+
+
+def diff_reports(old: dict, new: dict) -> dict:
+    """
+    Compare two reports created by analyze_appdir().
+
+    :return: JSON serializable diff, the lists of changes are sorted by the absolute size difference
+    """
+
+    def diff_sizes(old_sizes: Dict[str, int], new_sizes: Dict[str, int]) -> List[dict]:
+        rv = []
+
+        for path in set(old_sizes) | set(new_sizes):
+            old_size = old_sizes.get(path, None)
+            new_size = new_sizes.get(path, None)
+
+            if old_size != new_size:
+                rv.append(
+                    {
+                        "path": path,
+                        "old_size": old_size,
+                        "new_size": new_size,
+                        "difference": (new_size or 0) - (old_size or 0),
+                    }
+                )
+
+        return sorted(rv, key=lambda i: (-abs(i["difference"]), i["path"]))
+
+    return {
+        "old_path": old["path"],
+        "new_path": new["path"],
+        "old_total_size": old["total_size"],
+        "new_total_size": new["total_size"],
+        "difference": new["total_size"] - old["total_size"],
+        "directories": diff_sizes(
+            {path: info["size"] for path, info in old["directories"].items()},
+            {path: info["size"] for path, info in new["directories"].items()},
+        ),
+        "files": diff_sizes(old["files"], new["files"]),
+        "added_libraries": sorted(set(new["libraries"]) - set(old["libraries"])),
+        "removed_libraries": sorted(set(old["libraries"]) - set(new["libraries"])),
+    }
@@ -0,0 +1,164 @@
+import errno
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+from typing import List
+
+from ._logging import get_logger
+
+# written into the artifacts directory after every build
+MANIFEST_FILENAME = "appimagecraft-artifacts.json"
+
+# see linux/fs.h
+_FICLONE = 0x40049409
+
+# errors which indicate that a method is not supported in this situation (e.g., source and destination are on different
+# filesystems), so the next method should be tried
+_UNSUPPORTED_ERRNOS = {errno.EXDEV, errno.EOPNOTSUPP, errno.ENOTTY, errno.EINVAL, errno.EPERM, errno.ENOSYS}
+
+
+class Artifact:
+    def __init__(self, path: str, size: int, sha256: str, sha512: str, method: str):
+        self.path = path
+        self.size = size
+        self.sha256 = sha256
+        self.sha512 = sha512
+        # how the file was transferred into the artifacts directory (rename, reflink or copy)
+        self.method = method
+
+    def to_dict(self) -> dict:
+        return {
+            "path": self.path,
+            "filename": os.path.basename(self.path),
+            "size": self.size,
+            "sha256": self.sha256,
+            "sha512": self.sha512,
+        }
+
+
+class _Hashers:
+    def __init__(self):
+        self.sha256 = hashlib.sha256()
+        self.sha512 = hashlib.sha512()
+
+    def update(self, data: bytes):
+        self.sha256.update(data)
+        self.sha512.update(data)
+
+
+def _hash_file(path: str, hashers: _Hashers):
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            hashers.update(chunk)
+
+
+def _reflink(src: str, dest: str):
+    with open(src, "rb") as src_file, open(dest, "wb") as dest_file:
+        try:
+            fcntl.ioctl(dest_file.fileno(), _FICLONE, src_file.fileno())
+        except OSError:
+            dest_file.close()
+            os.unlink(dest)
+            raise
+
+
+def _copy_and_hash(src: str, dest: str, hashers: _Hashers):
+    with open(src, "rb") as src_file, open(dest, "wb") as dest_file:
+        for chunk in iter(lambda: src_file.read(1024 * 1024), b""):
+            hashers.update(chunk)
+            dest_file.write(chunk)
+
+
+def transfer_artifact(src: str, dest: str) -> Artifact:
+    """
+    Move file into the artifacts directory as cheaply as possible, and calculate its checksums.
+
+    Renaming is tried first, then cloning the file (FICLONE, on filesystems with reflink support, e.g., btrfs or XFS).
+    A hardlink would not help here: it only works where renaming works, too. Only if neither works, the file is
+    copied, and its checksums are calculated while copying. This way, the file is read at most once.
+    """
+
+    logger = get_logger("artifacts")
+
+    hashers = _Hashers()
+
+    method = None
+
+    for method_name, func in [("rename", os.rename), ("reflink", _reflink)]:
+        try:
+            func(src, dest)
+        except OSError as e:
+            if e.errno not in _UNSUPPORTED_ERRNOS:
+                raise
+
+            logger.debug("Could not {} {} to {}: {}".format(method_name, src, dest, e))
+            continue
+
+        method = method_name
+        break
+
+    if method is None:
+        method = "copy"
+        _copy_and_hash(src, dest, hashers)
+
+    else:
+        _hash_file(dest, hashers)
+
+    # AppImages need to stay executable
+    if method in ["reflink", "copy"]:
+        shutil.copymode(src, dest)
+
+    if method != "rename":
+        os.unlink(src)
+
+    logger.debug("Transferred artifact {} to {} ({})".format(src, dest, method))
+
+    return Artifact(dest, os.path.getsize(dest), hashers.sha256.hexdigest(), hashers.sha512.hexdigest(), method)
+
+
+def write_checksum_file(artifact: Artifact) -> str:
+    """
+    Write a sidecar file <artifact>.sha256 in the format used by sha256sum, so it can be verified with sha256sum -c.
+
+    :return: path to checksum file
+    """
+
+    path = artifact.path + ".sha256"
+
+    with open(path, "w") as f:
+        f.write("{}  {}\n".format(artifact.sha256, os.path.basename(artifact.path)))
+
+    return path
+
+
+def write_manifest(artifacts: List[Artifact], artifacts_dir: str) -> str:
+    """
+    Write JSON manifest listing the artifacts of a build into the artifacts directory.
+
+    :return: path to manifest
+    """
+
+    path = os.path.join(artifacts_dir, MANIFEST_FILENAME)
+
+    with open(path, "w") as f:
+        json.dump({"artifacts": [a.to_dict() for a in artifacts]}, f, indent=4)
+
+    return path
+
+
+def read_manifest(artifacts_dir: str) -> List[dict]:
+    """
+    :return: artifact entries from the manifest in the artifacts directory
+    :raises OSError: if the manifest could not be read
+    :raises ValueError: if the manifest is invalid
+    """
+
+    with open(os.path.join(artifacts_dir, MANIFEST_FILENAME)) as f:
+        data = json.load(f)
+
+    try:
+        return list(data["artifacts"])
+    except (KeyError, TypeError):
+        raise ValueError("invalid artifacts manifest")
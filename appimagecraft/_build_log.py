@@ -0,0 +1,384 @@
+import collections
+import gzip
+import os
+import shutil
+import subprocess
+import sys
+import time
+from typing import BinaryIO, Callable, List, Union
+
+from ._logging import get_logger
+from ._trace import STAGE_MARKER, STAGE_MARKERS_ENV_VAR
+from ._util import parse_size
+
+# written into the artifacts directory
+LOG_FILENAME = "appimagecraft-build.log"
+
+_STAGE_MARKER = STAGE_MARKER.encode()
+
+# lines longer than this are split, so a process writing lots of data without any newline can't exhaust the memory
+_MAX_LINE_LENGTH = 64 * 1024
+
+
+class _ZstdFile:
+    """
+    Write-only file which is compressed by the zstd tool. Compressing in a separate process takes the load off the
+    process reading the build output.
+    """
+
+    def __init__(self, path: str, zstd_path: str):
+        self._proc = subprocess.Popen([zstd_path, "-q", "-f", "-o", path], stdin=subprocess.PIPE)
+
+    def write(self, data: bytes):
+        self._proc.stdin.write(data)
+
+    def close(self):
+        self._proc.stdin.close()
+        self._proc.wait()
+
+
+class RotatingLogFile:
+    """
+    Log file which is rotated once it reaches max_size (uncompressed), keeping at most max_files files:
+    <path>, <path>.1, ..., <path>.<max_files - 1> (plus the compression's extension), where <path>.1 is the most recent
+    rotated file.
+    """
+
+    _extensions = {
+        "none": "",
+        "gzip": ".gz",
+        "zstd": ".zst",
+    }
+
+    def __init__(self, path: str, compression: str = "none", max_size: int = None, max_files: int = 1):
+        if compression not in self._extensions:
+            raise ValueError("invalid compression: {}".format(compression))
+
+        self._logger = get_logger("build_log")
+
+        self._zstd_path = None
+
+        if compression == "zstd":
+            self._zstd_path = shutil.which("zstd")
+
+            if not self._zstd_path:
+                self._logger.warning("Could not find zstd, compressing build log with gzip instead")
+                compression = "gzip"
+
+        self._path = path
+        self._compression = compression
+        self._max_size = max_size
+        self._max_files = max(1, max_files)
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+        # files of previous builds must not be mixed up with the new ones
+        for index in range(self._max_files):
+            try:
+                os.unlink(self.get_path(index))
+            except FileNotFoundError:
+                pass
+
+        self._file = self._open()
+        self._written = 0
+
+    def get_path(self, index: int = 0) -> str:
+        return "{}{}{}".format(self._path, ".{}".format(index) if index else "", self._extensions[self._compression])
+
+    def _open(self):
+        path = self.get_path()
+
+        if self._compression == "gzip":
+            return gzip.open(path, "wb", compresslevel=6)
+
+        if self._compression == "zstd":
+            return _ZstdFile(path, self._zstd_path)
+
+        return open(path, "wb")
+
+    def _rotate(self):
+        self._file.close()
+
+        for index in reversed(range(self._max_files - 1)):
+            try:
+                os.replace(self.get_path(index), self.get_path(index + 1))
+            except FileNotFoundError:
+                pass
+
+        self._file = self._open()
+        self._written = 0
+
+    def write(self, data: bytes):
+        if self._max_size is not None and self._written > 0 and self._written + len(data) > self._max_size:
+            self._rotate()
+
+        self._file.write(data)
+        self._written += len(data)
+
+    def close(self):
+        self._file.close()
+
+
+class BuildLog:
+    """
+    Captures the output of the build script. The output is passed through to the terminal, and written to a log file
+    in which every line is prefixed with a timestamp and the stage it belongs to. The last lines are kept in a ring
+    buffer, so they can be shown along with the failing stage when the build fails. Memory usage is bounded regardless
+    of the amount of output.
+
+    The build log can be configured with the build_log key in the config:
+
+    - false: don't write a log file (the tail is still shown in case of failures)
+    - a dict with the keys compression (none, gzip or zstd, default: none), max_size (size after which the log file is
+      rotated, default: 256M), max_files (number of files to keep, default: 4) and tail_lines (default: 50)
+    """
+
+    _default_max_size = "256M"
+    _default_max_files = 4
+    _default_tail_lines = 50
+
+    def __init__(
+        self,
+        path: Union[str, None],
+        compression: str = "none",
+        max_size: Union[str, int] = None,
+        max_files: int = None,
+        tail_lines: int = None,
+    ):
+        if max_size is None:
+            max_size = self._default_max_size
+
+        if max_files is None:
+            max_files = self._default_max_files
+
+        if tail_lines is None:
+            tail_lines = self._default_tail_lines
+
+        self._path = path
+        self._compression = compression
+        self._max_size = parse_size(max_size)
+        self._max_files = int(max_files)
+
+        # opened when the command is run
+        self._log_file = None
+
+        self._tail = collections.deque(maxlen=int(tail_lines))
+
+        # stages the build is currently in, innermost last
+        self._stages = []
+
+        # incomplete last line of output, and how much of it has been passed through already
+        self._pending = b""
+        self._echoed = 0
+
+        # timestamp and stage prefixed to the lines in the log file
+        self._prefix = None
+
+        # timestamps are formatted only once per second
+        self._last_second = None
+        self._formatted_second = None
+
+    @classmethod
+    def from_config(cls, config: dict, artifacts_dir: str):
+        log_config = config.get("build_log", None)
+
+        if log_config is None:
+            log_config = {}
+
+        if log_config is False:
+            return cls(None)
+
+        if not isinstance(log_config, dict):
+            raise ValueError("build_log: must be either false or a dict")
+
+        invalid_keys = set(log_config.keys()) - {"compression", "max_size", "max_files", "tail_lines"}
+        if invalid_keys:
+            raise ValueError("Invalid key in build_log: {}".format(list(invalid_keys)[0]))
+
+        return cls(os.path.join(artifacts_dir, LOG_FILENAME), **log_config)
+
+    def get_path(self) -> Union[str, None]:
+        if self._log_file is None:
+            return None
+
+        return self._log_file.get_path()
+
+    def current_stage(self) -> Union[str, None]:
+        """
+        :return: innermost stage the build is in, e.g., the one it failed in
+        """
+
+        if not self._stages:
+            return None
+
+        return self._stages[-1]
+
+    def tail(self) -> List[str]:
+        return [line.decode(errors="replace") for line in self._tail]
+
+    def _format_timestamp(self) -> bytes:
+        now = time.time()
+        second = int(now)
+
+        if second != self._last_second:
+            self._last_second = second
+            self._formatted_second = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(second))
+
+        return "{}.{:03d}".format(self._formatted_second, int((now - second) * 1000)).encode()
+
+    def _handle_marker(self, line: bytes):
+        try:
+            _, phase, name = line.decode(errors="replace").split(" ", 2)
+        except ValueError:
+            return
+
+        if phase == "B":
+            self._stages.append(name)
+
+        elif phase == "E":
+            # close everything up to the matching stage, like read_spans does
+            while self._stages:
+                if self._stages.pop() == name:
+                    break
+
+    def _add_output(self, lines: List[bytes]):
+        lines = [line.rstrip(b"\r") for line in lines]
+
+        self._tail.extend(lines)
+
+        if self._log_file is not None:
+            if self._prefix is None:
+                stage = (self.current_stage() or "-").encode()
+                self._prefix = b"".join([self._format_timestamp(), b" [", stage, b"] "])
+
+            self._log_file.write(b"".join((b"".join([self._prefix, line, b"\n"]) for line in lines)))
+
+    def add_line(self, line: bytes) -> bool:
+        """
+        Process a line of output (without the trailing newline).
+
+        :return: whether the line is part of the build's output (and not a stage marker)
+        """
+
+        if line.startswith(_STAGE_MARKER):
+            self._handle_marker(line.rstrip(b"\r"))
+            self._prefix = None
+            return False
+
+        self._add_output([line])
+
+        return True
+
+    @staticmethod
+    def _could_be_marker(data: bytes) -> bool:
+        return data.startswith(_STAGE_MARKER) or _STAGE_MARKER.startswith(data)
+
+    def _process_chunk(self, chunk: bytes) -> bytes:
+        """
+        Process chunk of output.
+
+        :return: data to pass through to the terminal
+        """
+
+        # all lines of a chunk have been received at the same time, so the prefix is created once per chunk
+        self._prefix = None
+
+        data = self._pending + chunk
+
+        lines = data.split(b"\n")
+        pending = lines.pop()
+        echoed = self._echoed
+
+        # lines are processed one by one only if the stage changes within the chunk
+        if _STAGE_MARKER in data:
+            output = [line for line in lines if self.add_line(line)]
+        else:
+            output = lines
+            self._add_output(lines)
+
+        rv = []
+
+        # only the first line can have been passed through partially, markers are never passed through
+        if output:
+            rv.append(b"\n".join(output)[echoed:] + b"\n")
+            echoed = 0
+
+        if len(pending) > _MAX_LINE_LENGTH:
+            self.add_line(pending)
+            rv.append(pending[echoed:])
+            pending = b""
+            echoed = 0
+
+        # incomplete lines like progress indicators are shown right away, unless they might be a marker
+        if pending and not self._could_be_marker(pending):
+            rv.append(pending[echoed:])
+            echoed = len(pending)
+
+        self._pending = pending
+        self._echoed = echoed
+
+        return b"".join(rv)
+
+    def run(
+        self,
+        command: List[str],
+        env: dict = None,
+        on_start: Callable[[int], None] = None,
+        output: BinaryIO = None,
+    ) -> int:
+        """
+        Run command, capturing its stdout and stderr.
+
+        :param on_start: called with the pid of the command once it has been started
+        :param output: stream the output is passed through to (default: stdout)
+        :return: exit code of command
+        """
+
+        if env is None:
+            env = os.environ
+
+        env = dict(env)
+        env[STAGE_MARKERS_ENV_VAR] = "1"
+
+        if self._path is not None:
+            self._log_file = RotatingLogFile(self._path, self._compression, self._max_size, self._max_files)
+
+        proc = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, env=env)
+
+        out = output if output is not None else sys.stdout.buffer
+
+        self._pending = b""
+        self._echoed = 0
+
+        try:
+            if on_start is not None:
+                on_start(proc.pid)
+
+            fd = proc.stdout.fileno()
+
+            while True:
+                chunk = os.read(fd, 64 * 1024)
+
+                if not chunk:
+                    break
+
+                # the output is passed through once per chunk rather than per line, which keeps the overhead low
+                # for builds producing lots of output
+                out.write(self._process_chunk(chunk))
+                out.flush()
+
+            # the last line is terminated, so it ends up in the log as well
+            if self._pending:
+                out.write(self._process_chunk(b"\n"))
+                out.flush()
+
+            return proc.wait()
+
+        finally:
+            proc.stdout.close()
+
+            # in case we're interrupted, the build script receives the signal as well
+            proc.wait()
+
+            if self._log_file is not None:
+                self._log_file.close()
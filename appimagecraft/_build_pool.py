@@ -0,0 +1,348 @@
+import argparse
+import json
+import logging
+import os
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import BinaryIO, Callable, List
+
+from ._artifacts import MANIFEST_FILENAME, read_manifest
+from .builders.jobs import MAX_JOBS_ENV_VAR
+from ._logging import get_logger
+from ._util import format_size, print_table
+
+
+class BuildJob:
+    """
+    A single build run by a BuildPool.
+
+    prepare() is called in the worker thread and returns the command to run, run() runs it, passing its output through
+    to the given stream, and finish() is called with the command's exit status and returns the paths of the artifacts
+    the build produced.
+
+    :param name: name used to prefix the output and in the summary
+    :param artifacts_dir: directory the artifacts end up in
+    """
+
+    def __init__(self, name: str, artifacts_dir: str, cwd: str = None):
+        self.name = name
+        self.artifacts_dir = artifacts_dir
+        self.cwd = cwd
+
+    def prepare(self) -> List[str]:
+        raise NotImplementedError
+
+    def run(self, command: List[str], env: dict, output: BinaryIO) -> int:
+        proc = subprocess.Popen(
+            command,
+            cwd=self.cwd,
+            env=env,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            stdin=subprocess.DEVNULL,
+        )
+
+        try:
+            for line in proc.stdout:
+                output.write(line)
+
+            return proc.wait()
+
+        finally:
+            proc.stdout.close()
+            proc.wait()
+
+    def finish(self, returncode: int) -> List[str]:
+        raise NotImplementedError
+
+
+class AppImageCraftBuildJob(BuildJob):
+    """
+    Runs appimagecraft in a child process.
+
+    :param args: arguments for appimagecraft (e.g., ["build", "-b", "cmake"])
+    """
+
+    def __init__(self, name: str, args: List[str], artifacts_dir: str, cwd: str = None):
+        super().__init__(name, artifacts_dir, cwd)
+
+        self.args = args
+
+        self._start = None
+
+    def prepare(self) -> List[str]:
+        self._start = time.time()
+
+        return [sys.executable, "-m", "appimagecraft"] + self.args
+
+    def finish(self, returncode: int) -> List[str]:
+        # appimagecraft lists the artifacts of a build in a manifest
+        try:
+            if os.path.getmtime(os.path.join(self.artifacts_dir, MANIFEST_FILENAME)) >= self._start:
+                return [a["path"] for a in read_manifest(self.artifacts_dir)]
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+
+        # fallback: artifacts are moved, so their mtime is the time they were created during the build
+        rv = []
+
+        if os.path.isdir(self.artifacts_dir):
+            for filename in sorted(os.listdir(self.artifacts_dir)):
+                path = os.path.join(self.artifacts_dir, filename)
+
+                if os.path.isfile(path) and os.path.getmtime(path) >= self._start:
+                    rv.append(path)
+
+        return rv
+
+
+def get_build_args(args: argparse.Namespace, artifacts_dir: str) -> List[str]:
+    """
+    Translate the command line arguments of a command running several builds (e.g., matrix) into arguments for the
+    appimagecraft build commands it runs, so that all builds are run with the same options.
+
+    :param artifacts_dir: the build's artifacts directory, files like the trace are written in there, too
+    """
+
+    rv = []
+
+    if args.loglevel == logging.DEBUG:
+        rv.append("--debug")
+
+    for flag, dest in [
+        ("--log-timestamps", "log_timestamps"),
+        ("--keep-build-dir", "keep_build_dir"),
+        ("--incremental", "incremental"),
+        ("--sync-cleanup", "sync_cleanup"),
+    ]:
+        if getattr(args, dest, False):
+            rv.append(flag)
+
+    for option, dest in [
+        ("--build-root", "build_root"),
+        ("--min-free-space", "min_free_space"),
+        ("--resource-profile-interval", "resource_profile_interval"),
+    ]:
+        value = getattr(args, dest, None)
+
+        if value is not None:
+            rv += [option, str(value)]
+
+    # every build writes its own file, named like the one passed on the command line
+    for option, dest in [
+        ("--trace-file", "trace_file"),
+        ("--resource-profile", "resource_profile"),
+    ]:
+        value = getattr(args, dest, None)
+
+        if value is not None:
+            rv += [option, os.path.join(artifacts_dir, os.path.basename(value))]
+
+    for dest, enable_flag, disable_flag in [
+        ("appdir_cache", "--appdir-cache", "--no-appdir-cache"),
+        ("appimage_cache", "--appimage-cache", "--no-appimage-cache"),
+    ]:
+        value = getattr(args, dest, None)
+
+        if value is not None:
+            rv.append(enable_flag if value else disable_flag)
+
+    return rv
+
+
+class BuildJobResult:
+    def __init__(self, job: BuildJob, returncode: int, duration: float, artifacts: List[str], error: str = None):
+        self.job = job
+        # None if the job has been skipped
+        self.returncode = returncode
+        self.duration = duration
+        self.artifacts = artifacts
+        self.error = error
+
+    def succeeded(self) -> bool:
+        return self.returncode == 0
+
+    def skipped(self) -> bool:
+        return self.returncode is None
+
+    def status(self) -> str:
+        if self.skipped():
+            return "skipped"
+
+        if self.succeeded():
+            return "ok"
+
+        return "failed ({})".format(self.returncode)
+
+    def artifacts_size(self) -> int:
+        return sum((os.path.getsize(path) for path in self.artifacts if os.path.isfile(path)))
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.job.name,
+            "status": self.status(),
+            "returncode": self.returncode,
+            "duration": round(self.duration, 3),
+            "error": self.error,
+            "artifacts": [
+                {"path": path, "size": os.path.getsize(path)} for path in self.artifacts if os.path.isfile(path)
+            ],
+        }
+
+
+class _PrefixedOutput:
+    """
+    Stream which prints the output of a build line by line, prefixed with the build's name. Incomplete lines are held
+    back until they are complete, so the output of concurrent builds doesn't get mixed up within a line.
+    """
+
+    def __init__(self, print_prefixed: Callable[[str, str], None], prefix: str):
+        self._print_prefixed = print_prefixed
+        self._prefix = prefix
+        self._pending = b""
+
+    def write(self, data: bytes):
+        lines = (self._pending + data).split(b"\n")
+        self._pending = lines.pop()
+
+        for line in lines:
+            self._print_prefixed(self._prefix, line.decode(errors="replace") + "\n")
+
+    def flush(self):
+        pass
+
+    def close(self):
+        if self._pending:
+            self.write(b"\n")
+
+
+class BuildPool:
+    """
+    Runs builds concurrently, prefixing every line of their output with the job name.
+
+    The CPU budget (by default, all cores) is split evenly across the concurrent builds, so the machine is not
+    overcommitted. The share is passed to the children as an upper limit for the job policy (see JobPolicy), so the
+    projects' own settings (e.g., memory_per_job) still apply.
+
+    In fail-fast mode, no new builds are started once a build has failed.
+    """
+
+    def __init__(self, max_parallel: int, cpu_budget: int = None, fail_fast: bool = False):
+        if max_parallel < 1:
+            raise ValueError("number of parallel builds must be at least 1")
+
+        if cpu_budget is None:
+            cpu_budget = os.cpu_count() or 1
+
+        if cpu_budget < 1:
+            raise ValueError("CPU budget must be at least 1")
+
+        self._max_parallel = max_parallel
+        self._cpu_budget = cpu_budget
+        self._fail_fast = fail_fast
+
+        self._output_lock = threading.Lock()
+        self._abort = threading.Event()
+
+        self._logger = get_logger("build_pool")
+
+    def _get_child_env(self) -> dict:
+        env = dict(os.environ)
+
+        env[MAX_JOBS_ENV_VAR] = str(max(1, self._cpu_budget // self._max_parallel))
+
+        return env
+
+    def _print_prefixed(self, prefix: str, line: str):
+        with self._output_lock:
+            sys.stdout.write("[{}] {}".format(prefix, line))
+            sys.stdout.flush()
+
+    def _run_job(self, job: BuildJob) -> BuildJobResult:
+        if self._abort.is_set():
+            self._logger.warning("Skipping build {} due to previous failure".format(job.name))
+            return BuildJobResult(job, None, 0, [])
+
+        start = time.time()
+
+        self._logger.info("Starting build {}".format(job.name))
+
+        output = _PrefixedOutput(self._print_prefixed, job.name)
+
+        try:
+            command = job.prepare()
+
+            try:
+                returncode = job.run(command, self._get_child_env(), output)
+            finally:
+                output.close()
+
+            artifacts = job.finish(returncode)
+
+        except Exception as e:
+            self._logger.error("Build {} failed: {}".format(job.name, e))
+
+            if self._fail_fast:
+                self._abort.set()
+
+            return BuildJobResult(job, 1, time.time() - start, [], error=str(e))
+
+        duration = time.time() - start
+
+        if returncode == 0:
+            self._logger.info("Build {} finished after {:.1f} s".format(job.name, duration))
+        else:
+            self._logger.error("Build {} failed with exit status {}".format(job.name, returncode))
+
+            if self._fail_fast:
+                self._abort.set()
+
+        return BuildJobResult(job, returncode, duration, artifacts)
+
+    def run(self, jobs: List[BuildJob]) -> List[BuildJobResult]:
+        with ThreadPoolExecutor(max_workers=self._max_parallel) as executor:
+            return list(executor.map(self._run_job, jobs))
+
+
+def get_default_parallel_builds(jobs_count: int, cpu_budget: int = None) -> int:
+    """
+    Guess a sensible number of concurrent builds. Every build gets at least four cores, which keeps the compile steps
+    fast, while the mostly sequential steps (configuring, packaging) of other builds can fill the remaining gaps.
+    """
+
+    if cpu_budget is None:
+        cpu_budget = os.cpu_count() or 1
+
+    return max(1, min(jobs_count, cpu_budget // 4))
+
+
+def print_summary_table(results: List[BuildJobResult]):
+    rows = [("build", "status", "duration", "artifacts", "size")]
+
+    for result in results:
+        rows.append(
+            (
+                result.job.name,
+                result.status(),
+                "{:.1f} s".format(result.duration),
+                str(len(result.artifacts)),
+                format_size(result.artifacts_size()),
+            )
+        )
+
+    print_table(rows)
+
+
+def write_report(results: List[BuildJobResult], path: str):
+    data = {
+        "builds": [r.to_dict() for r in results],
+        "succeeded": sum((1 for r in results if r.succeeded())),
+        "failed": sum((1 for r in results if not r.succeeded() and not r.skipped())),
+        "skipped": sum((1 for r in results if r.skipped())),
+    }
+
+    with open(path, "w") as f:
+        json.dump(data, f, indent=4)
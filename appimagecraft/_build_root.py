@@ -0,0 +1,278 @@
+import hashlib
+import json
+import os
+from typing import List, Union
+
+from ._logging import get_logger
+from ._util import format_size, get_cache_root, parse_size
+
+# special value for the build root, see BuildRootPolicy
+AUTO = "auto"
+
+# file in the cache root in which the sizes of previous builds are recorded
+_BUILD_SIZES_FILENAME = "build-sizes.json"
+
+_TMPFS_DIR = "/dev/shm"
+
+
+class InsufficientSpaceError(Exception):
+    pass
+
+
+def _get_project_key(project_root_dir: str, builder_name: str) -> str:
+    return hashlib.sha256("{}\0{}".format(os.path.abspath(project_root_dir), builder_name).encode()).hexdigest()
+
+
+def _read_build_sizes() -> dict:
+    try:
+        with open(os.path.join(get_cache_root(), _BUILD_SIZES_FILENAME)) as f:
+            return dict(json.load(f))
+    except (OSError, ValueError, TypeError):
+        return {}
+
+
+def get_directory_size(path: str) -> int:
+    """
+    :return: disk usage of all files within directory, in bytes
+    """
+
+    rv = 0
+
+    for dirpath, dirnames, filenames in os.walk(path):
+        for filename in filenames:
+            try:
+                rv += os.lstat(os.path.join(dirpath, filename)).st_blocks * 512
+            except OSError:
+                pass
+
+    return rv
+
+
+def record_build_size(project_root_dir: str, builder_name: str, size: int):
+    """
+    Remember size of a build directory, which is used to estimate the size of later builds of the same project.
+    """
+
+    sizes = _read_build_sizes()
+    sizes[_get_project_key(project_root_dir, builder_name)] = size
+
+    path = os.path.join(get_cache_root(), _BUILD_SIZES_FILENAME)
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    with open(path + ".tmp.{}".format(os.getpid()), "w") as f:
+        json.dump(sizes, f)
+
+    os.rename(path + ".tmp.{}".format(os.getpid()), path)
+
+
+def _get_mount_options(path: str) -> Union[tuple, None]:
+    """
+    :return: filesystem type and mount options of the mount point path is on, or None if unknown
+    """
+
+    path = os.path.realpath(path)
+
+    best_match = None
+
+    try:
+        with open("/proc/mounts") as f:
+            for line in f:
+                try:
+                    _, mount_point, fs_type, options = line.split()[:4]
+                except ValueError:
+                    continue
+
+                # later entries override earlier ones mounted on the same mount point
+                if path == mount_point or path.startswith(mount_point.rstrip("/") + "/"):
+                    if best_match is None or len(mount_point) >= len(best_match[0]):
+                        best_match = (mount_point, fs_type, options.split(","))
+
+    except OSError:
+        return None
+
+    if best_match is None:
+        return None
+
+    return best_match[1], best_match[2]
+
+
+def _get_mem_available() -> Union[int, None]:
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+
+    return None
+
+
+def get_auto_build_roots() -> List[str]:
+    """
+    :return: directories auto mode chooses from, the tmpfs directory and the local fallback
+    """
+
+    return [_TMPFS_DIR, os.path.join(get_cache_root(), "builds")]
+
+
+def get_free_space(path: str) -> int:
+    stat = os.statvfs(path)
+    return stat.f_bavail * stat.f_frsize
+
+
+class BuildRootPolicy:
+    """
+    Decides where temporary build directories are created.
+
+    The build root can be configured with the build_root key in the config (or --build-root):
+
+    - a path: build directories are created in this directory
+    - auto: build on tmpfs (/dev/shm) if there is enough free memory and space on it for an estimate based on earlier
+      builds of the project, otherwise in a local directory in appimagecraft's cache directory
+    - not set: build directories are created in the project root directory
+
+    Either a path/auto, or a dict with the keys path and min_free_space can be specified. Builds refuse to start if
+    the free space in the build root is below min_free_space (default: 1G, 0 disables the check).
+    """
+
+    _default_min_free_space = "1G"
+
+    # used if no earlier build has been recorded
+    _default_size_estimate = "2G"
+
+    # tmpfs is only used if it can hold the estimated build size plus this factor
+    _headroom = 1.5
+
+    def __init__(self, config: Union[str, dict, None] = None):
+        if config is None:
+            config = {}
+
+        if isinstance(config, str):
+            config = {"path": config}
+
+        if not isinstance(config, dict):
+            raise ValueError("build_root: must be either a path, auto or a dict")
+
+        invalid_keys = set(config.keys()) - {"path", "min_free_space"}
+        if invalid_keys:
+            raise ValueError("Invalid key in build_root: {}".format(list(invalid_keys)[0]))
+
+        self._path = config.get("path", None)
+
+        min_free_space = config.get("min_free_space", None)
+
+        if min_free_space is None:
+            min_free_space = self._default_min_free_space
+
+        self._min_free_space = parse_size(min_free_space)
+
+        self._logger = get_logger("build_root")
+
+    @classmethod
+    def from_config(cls, config: dict, path: str = None, min_free_space: str = None):
+        """
+        Create policy from the build_root section of the project config. Values specified on the command line take
+        precedence.
+        """
+
+        build_root_config = config.get("build_root", None)
+
+        if not isinstance(build_root_config, dict):
+            build_root_config = {"path": build_root_config} if build_root_config is not None else {}
+
+        build_root_config = dict(build_root_config)
+
+        if path is not None:
+            build_root_config["path"] = path
+
+        if min_free_space is not None:
+            build_root_config["min_free_space"] = min_free_space
+
+        return cls(build_root_config)
+
+    def estimate_build_size(self, project_root_dir: str, builder_name: str) -> int:
+        try:
+            return int(_read_build_sizes()[_get_project_key(project_root_dir, builder_name)])
+        except (KeyError, ValueError, TypeError):
+            return parse_size(self._default_size_estimate)
+
+    def _tmpfs_is_suitable(self, estimate: int) -> bool:
+        mount = _get_mount_options(_TMPFS_DIR)
+
+        if mount is None or mount[0] != "tmpfs":
+            self._logger.debug("{} is not a tmpfs".format(_TMPFS_DIR))
+            return False
+
+        # the build scripts must be executable
+        if "noexec" in mount[1]:
+            self._logger.debug("{} is mounted with noexec".format(_TMPFS_DIR))
+            return False
+
+        required = int(estimate * self._headroom)
+
+        # tmpfs lives in memory, so it's not only the space on the filesystem which matters
+        mem_available = _get_mem_available()
+
+        if mem_available is None or mem_available < required:
+            self._logger.debug("not enough memory available for building on tmpfs")
+            return False
+
+        if get_free_space(_TMPFS_DIR) < required:
+            self._logger.debug("not enough space available on {}".format(_TMPFS_DIR))
+            return False
+
+        return True
+
+    def is_auto(self) -> bool:
+        return self._path == AUTO
+
+    def get_search_dirs(self, project_root_dir: str) -> List[str]:
+        """
+        :return: all directories build directories of the project may have been created in
+        """
+
+        rv = [os.path.abspath(project_root_dir)]
+
+        if self._path is not None and not self.is_auto():
+            rv.append(os.path.abspath(os.path.join(project_root_dir, os.path.expanduser(self._path))))
+
+        return rv
+
+    def get_build_root(self, project_root_dir: str, builder_name: str) -> str:
+        """
+        Determine directory to create the build directory in, and make sure there's enough free space in it.
+
+        :raises InsufficientSpaceError: if the free space is below the configured threshold
+        """
+
+        if self._path is None:
+            rv = project_root_dir
+
+        elif self.is_auto():
+            estimate = self.estimate_build_size(project_root_dir, builder_name)
+
+            self._logger.debug("estimated build size: {}".format(format_size(estimate)))
+
+            tmpfs_dir, local_dir = get_auto_build_roots()
+
+            rv = tmpfs_dir if self._tmpfs_is_suitable(estimate) else local_dir
+
+        else:
+            rv = os.path.join(project_root_dir, os.path.expanduser(self._path))
+
+        rv = os.path.abspath(rv)
+
+        os.makedirs(rv, exist_ok=True)
+
+        free_space = get_free_space(rv)
+
+        if free_space < self._min_free_space:
+            raise InsufficientSpaceError(
+                "only {} of free space in {}, at least {} required (see min_free_space)".format(
+                    format_size(free_space), rv, format_size(self._min_free_space)
+                )
+            )
+
+        return rv
@@ -0,0 +1,180 @@
+import fcntl
+import os
+import shutil
+import subprocess
+import sys
+import time
+import uuid
+from typing import List
+
+from ._logging import get_logger
+
+# prefix of the auto-generated build directories, see make_temporary_build_dir
+BUILD_DIR_PREFIX = ".appimagecraft-build-"
+
+# build directories are moved into this directory (next to them, so it's on the same filesystem) before they're removed
+TRASH_DIRNAME = ".appimagecraft-trash"
+
+# held (flock) by the process using a build directory, so gc won't remove directories of running builds
+LOCK_FILENAME = ".appimagecraft-lock"
+
+# directories which have been created very recently might not have been locked yet
+_GRACE_PERIOD = 60
+
+# build dir -> file object of lock file
+_locks = {}
+
+# run by the background process, which removes the trash directory as well once it's empty
+# appimagecraft isn't imported in the child, which keeps its startup cheap
+_REMOVAL_CODE = """
+import os, shutil, sys
+shutil.rmtree(sys.argv[1], ignore_errors=True)
+try:
+    os.rmdir(os.path.dirname(sys.argv[1]))
+except OSError:
+    pass
+"""
+
+
+class BuildDirInUseError(Exception):
+    pass
+
+
+def lock_build_dir(build_dir: str):
+    """
+    Mark build directory as in use. The lock is held until the build directory is disposed of, or the process exits.
+
+    :raises BuildDirInUseError: if another process uses the build directory
+    """
+
+    if build_dir in _locks:
+        return
+
+    f = open(os.path.join(build_dir, LOCK_FILENAME), "w")
+
+    try:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        f.close()
+        raise BuildDirInUseError("build directory {} is in use by another process".format(build_dir))
+
+    _locks[build_dir] = f
+
+
+def holds_build_dir_lock(build_dir: str) -> bool:
+    return build_dir in _locks
+
+
+def _unlock_build_dir(build_dir: str):
+    f = _locks.pop(build_dir, None)
+
+    if f is not None:
+        f.close()
+
+
+def is_build_dir_in_use(build_dir: str) -> bool:
+    try:
+        if time.time() - os.stat(build_dir).st_mtime < _GRACE_PERIOD:
+            return True
+    except FileNotFoundError:
+        return False
+
+    try:
+        with open(os.path.join(build_dir, LOCK_FILENAME)) as f:
+            try:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return True
+
+    except FileNotFoundError:
+        # directories of crashed runs which did not get to lock the directory
+        pass
+
+    return False
+
+
+def _remove_in_background(path: str):
+    # the child process is started in a new session, so it keeps running after appimagecraft has exited, and doesn't
+    # receive the terminal's signals (e.g., Ctrl-C)
+    subprocess.Popen(
+        [sys.executable, "-c", _REMOVAL_CODE, path],
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True,
+        close_fds=True,
+    )
+
+
+def move_to_trash(path: str) -> str:
+    """
+    Move directory into the trash directory next to it. This is a cheap rename, regardless of its size.
+
+    :return: new path
+    """
+
+    trash_dir = os.path.join(os.path.dirname(os.path.abspath(path)), TRASH_DIRNAME)
+    os.makedirs(trash_dir, exist_ok=True)
+
+    # the names of build directories are unique anyway, but directories might be moved into the trash by other means
+    rv = os.path.join(trash_dir, "{}-{}".format(os.path.basename(path), uuid.uuid4().hex[:8]))
+
+    os.rename(path, rv)
+
+    return rv
+
+
+def dispose_build_dir(build_dir: str, background: bool = True):
+    """
+    Remove build directory. By default, the directory is moved into the trash, and removed in a detached background
+    process, so that the caller doesn't have to wait for potentially hundreds of thousands of files to be deleted.
+    If that fails, or background is False, the directory is removed synchronously.
+    """
+
+    logger = get_logger("cleanup")
+
+    _unlock_build_dir(build_dir)
+
+    path = build_dir
+
+    if background:
+        try:
+            path = move_to_trash(build_dir)
+            _remove_in_background(path)
+            logger.debug("Removing {} in the background".format(path))
+            return
+
+        except OSError as e:
+            logger.warning("Could not remove build directory in the background, removing it now: {}".format(e))
+
+    shutil.rmtree(path)
+
+
+def find_leftover_build_dirs(root_dir: str) -> List[str]:
+    """
+    Find auto-generated build directories and trash contents in a directory which can be removed. Directories which are
+    in use by running builds are skipped.
+    """
+
+    rv = []
+
+    try:
+        filenames = sorted(os.listdir(root_dir))
+    except FileNotFoundError:
+        return rv
+
+    for filename in filenames:
+        path = os.path.join(root_dir, filename)
+
+        if filename.startswith(BUILD_DIR_PREFIX) and os.path.isdir(path) and not os.path.islink(path):
+            if not is_build_dir_in_use(path):
+                rv.append(path)
+
+        elif filename == TRASH_DIRNAME:
+            # everything in here has been left behind by interrupted background removals
+            try:
+                rv += [os.path.join(path, i) for i in sorted(os.listdir(path))]
+            except NotADirectoryError:
+                pass
+
+    return rv
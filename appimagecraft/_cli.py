@@ -2,12 +2,12 @@ import argparse
 import logging
 import os.path
 import sys
-import tempfile
 import textwrap
+from typing import Tuple, Union
 
-from .parsers import AppImageCraftYMLParser
-from . import _logging
-from .commands import *  # noqa
+from . import _logging, commands, parsers
+from ._build_root import BuildRootPolicy, InsufficientSpaceError
+from ._util import get_config_arch, get_incremental_build_dir, make_temporary_build_dir, override_arch
 
 
 def parse_args():
@@ -40,6 +40,138 @@ def parse_args():
         help="Path to build directory (default: auto-generated)",
     )
 
+    parser.add_argument(
+        "--arch",
+        dest="archs",
+        action="append",
+        help="Override AppImage architecture from config (matrix command: may be specified more than once)",
+    )
+
+    parser.add_argument(
+        "--artifacts-dir",
+        nargs="?",
+        dest="artifacts_dir",
+        help="Directory to move artifacts into (default: project root directory)",
+    )
+
+    parser.add_argument(
+        "--check",
+        dest="check",
+        action="store_true",
+        default=False,
+        help="Only check whether the scripts in the build directory are up to date, exit non-zero if they are stale "
+        "(genscripts command only)",
+    )
+
+    parser.add_argument(
+        "--trace-file",
+        nargs="?",
+        dest="trace_file",
+        help="Write build stage timings to file in Chrome trace event format (build, matrix and batch commands, "
+        "matrix and batch write one file per build into its artifacts directory)",
+    )
+
+    parser.add_argument(
+        "--resource-profile",
+        nargs="?",
+        dest="resource_profile",
+        help="Sample CPU, memory and I/O usage of the build and write the samples and a per stage summary to file "
+        "(build, matrix and batch commands, matrix and batch write one file per build into its artifacts directory)",
+    )
+
+    parser.add_argument(
+        "--resource-profile-interval",
+        nargs="?",
+        dest="resource_profile_interval",
+        type=float,
+        help="Time between two samples of the resource usage in seconds (build, matrix and batch commands, "
+        "default: 0.5)",
+    )
+
+    parser.add_argument(
+        "--parallel-builds",
+        nargs="?",
+        dest="parallel_builds",
+        type=int,
+        help="Maximum number of builds to run concurrently (matrix and batch commands only)",
+    )
+
+    parser.add_argument(
+        "--cpu-budget",
+        nargs="?",
+        dest="cpu_budget",
+        type=int,
+        help="Number of cores to split across concurrent builds (matrix and batch commands only, default: all)",
+    )
+
+    parser.add_argument(
+        "--fail-fast",
+        dest="fail_fast",
+        action="store_const",
+        const=True,
+        default=False,
+        help="Do not start further builds once a build has failed (matrix and batch commands only)",
+    )
+
+    parser.add_argument(
+        "--report",
+        nargs="?",
+        dest="report_path",
+        help="Path to write a JSON report to (matrix, batch, pack-compare, analyze and bench-artifact commands only)",
+    )
+
+    parser.add_argument(
+        "--max-growth",
+        nargs="?",
+        dest="max_growth",
+        help="Fail if the AppDir grew by more than this compared to the previous report, e.g., 5%% or 10M "
+        "(analyze command only)",
+    )
+
+    parser.add_argument(
+        "--runs",
+        nargs="?",
+        dest="bench_runs",
+        type=int,
+        help="Number of cold and warm launches to measure (bench-artifact command only, default: 10)",
+    )
+
+    parser.add_argument(
+        "--launch-mode",
+        nargs="?",
+        dest="launch_mode",
+        choices=["extract-and-run", "extracted", "fuse"],
+        help="How to launch the AppImage: let the runtime extract it on every launch, run the AppRun of an extracted "
+        "copy, or mount it with FUSE (bench-artifact command only, default: extract-and-run)",
+    )
+
+    parser.add_argument(
+        "--ld-statistics",
+        dest="ld_statistics",
+        action="store_true",
+        default=False,
+        help="Record the dynamic linker's statistics (LD_DEBUG=statistics) in an extra launch "
+        "(bench-artifact command only)",
+    )
+
+    parser.add_argument(
+        "--keep-build-dir",
+        dest="keep_build_dir",
+        action="store_const",
+        const=True,
+        default=False,
+        help="Do not remove the build directory after building",
+    )
+
+    parser.add_argument(
+        "--incremental",
+        dest="incremental",
+        action="store_const",
+        const=True,
+        default=False,
+        help="Reuse a persistent per-builder build directory for incremental builds (implies --keep-build-dir)",
+    )
+
     parser.add_argument(
         "--list-commands",
         dest="list_commands",
@@ -85,6 +217,87 @@ def parse_args():
         help="Force colored output",
     )
 
+    parser.add_argument(
+        "--build-root",
+        nargs="?",
+        dest="build_root",
+        help="Directory to create auto-generated build directories in, or auto to pick tmpfs or a local cache "
+        "directory depending on the available space (default: project root directory)",
+    )
+
+    parser.add_argument(
+        "--min-free-space",
+        nargs="?",
+        dest="min_free_space",
+        help="Refuse to build if the build root has less free space, e.g., 5G (default: 1G, 0 disables the check)",
+    )
+
+    parser.add_argument(
+        "--sync-cleanup",
+        dest="sync_cleanup",
+        action="store_true",
+        default=False,
+        help="Remove the build directory before exiting instead of in a background process",
+    )
+
+    parser.add_argument(
+        "--appdir-cache",
+        dest="appdir_cache",
+        action="store_const",
+        const=True,
+        default=None,
+        help="Restore AppDirs built from the same sources and config from the cache instead of running the builder "
+        "(default: appdir_cache setting in config)",
+    )
+
+    parser.add_argument(
+        "--no-appdir-cache",
+        dest="appdir_cache",
+        action="store_const",
+        const=False,
+        help="Always run the builder, even if appdir_cache is enabled in the config",
+    )
+
+    parser.add_argument(
+        "--appimage-cache",
+        dest="appimage_cache",
+        action="store_const",
+        const=True,
+        default=None,
+        help="Reuse AppImages built from the same AppDir and packaging inputs instead of running linuxdeploy "
+        "(default: appimage.cache setting in config)",
+    )
+
+    parser.add_argument(
+        "--no-appimage-cache",
+        dest="appimage_cache",
+        action="store_const",
+        const=False,
+        help="Always run linuxdeploy, even if appimage.cache is enabled in the config",
+    )
+
+    parser.add_argument(
+        "--dry-run",
+        dest="dry_run",
+        action="store_true",
+        default=False,
+        help="Only show which directories would be removed (gc command only)",
+    )
+
+    parser.add_argument(
+        "--max-cache-size",
+        nargs="?",
+        dest="max_cache_size",
+        help="Maximum size per cache when pruning, e.g., 512M or 2G (cache command only)",
+    )
+
+    parser.add_argument(
+        "--max-cache-age",
+        nargs="?",
+        dest="max_cache_age",
+        help="Remove cache entries unused for longer than this, e.g., 12h or 30d (cache command only)",
+    )
+
     parser.add_argument(
         "command",
         nargs="?",
@@ -92,14 +305,30 @@ def parse_args():
         default="build",
     )
 
+    parser.add_argument(
+        "command_args",
+        nargs="*",
+        help="Arguments for the command (e.g., cache list|prune|warm)",
+    )
+
     args = parser.parse_args()
 
     if args.list_commands:
         commands = """
             Available commands:
-                build:       build current project
-                genscripts:  generate build scripts in current directory
-                setup:       setup appimagecraft for this project (interactively)
+                build:          build current project
+                genscripts:     generate build scripts in current directory
+                setup:          setup appimagecraft for this project (interactively)
+                cache:          manage shared caches (cache list, cache prune, cache warm)
+                matrix:         build with several builders and/or architectures concurrently (matrix [builder...])
+                batch:          build all projects found in a directory tree (batch [directory])
+                gc:             remove build directories left behind by interrupted builds (gc [directory...])
+                pack-compare:   pack an AppDir with several squashfs settings and compare the results
+                                (pack-compare <AppDir> [zstd:19:1M...])
+                analyze:        report size and composition of an AppDir or AppImage, and compare it to a
+                                previous report (analyze <AppDir|build dir|AppImage> [previous.json])
+                bench-artifact: measure cold and warm startup time of an AppImage
+                                (bench-artifact <AppImage> [-- <smoke command arguments...>])
         """
 
         print(textwrap.dedent(commands).strip("\n"))
@@ -109,69 +338,93 @@ def parse_args():
     return args
 
 
-def run():
-    args = parse_args()
+def _run_standalone_command(command_class_name: str, args: argparse.Namespace):
+    try:
+        getattr(commands, command_class_name)(args).run()
+    except KeyboardInterrupt:
+        _logging.get_logger("cli").critical("process interrupted by user")
+        sys.exit(1)
 
-    # setup
-    _logging.setup(
-        args.loglevel,
-        with_timestamps=args.log_timestamps,
-        force_colors=args.force_colors,
-        log_locations=args.log_message_locations,
-    )
 
-    # get logger for CLI
+def _load_config(args: argparse.Namespace) -> dict:
     logger = _logging.get_logger("cli")
 
-    yml_parser = AppImageCraftYMLParser(args.config_file)
+    yml_parser = parsers.AppImageCraftYMLParser(args.config_file)
     config = yml_parser.data()
 
     logger.info("Building project {}".format(config["project"]["name"]))
 
-    command_name = getattr(args, "command", None)
+    archs = getattr(args, "archs", None)
 
-    if command_name is None:
-        command_name = "build"
+    if archs:
+        if len(archs) > 1:
+            logger.critical("--arch may be specified only once, use the matrix command to build for multiple archs")
+            sys.exit(1)
 
-    commands_classes_map = {
-        "build": BuildCommand,
-        "genscripts": GenerateScriptsCommand,
-        # "setup": SetupCommand,
-    }
+        config = override_arch(config, archs[0])
 
-    # project root dir = location of config file
-    project_root_dir = os.path.abspath(os.path.dirname(args.config_file))
+    return config
 
-    # set up args
-    build_dir = getattr(args, "build_dir", None)
+
+def _get_builder_name(args: argparse.Namespace, config: dict) -> str:
     builder_name = getattr(args, "builder_name", None)
 
-    # set default values
     if builder_name is None:
         try:
             # use first builder as fallback
             builder_name = list(config["build"].keys())[0]
         except KeyError:
-            logger.critical("no builder configured in config file")
+            _logging.get_logger("cli").critical("no builder configured in config file")
             sys.exit(1)
 
-    if build_dir is None:
-        if command_name != "build":
-            # commands like genscripts aren't very helpful if the user doesn't take care of managing the build
-            # directory; they want to call the scripts, after all
-            logger.critical(
-                "cannot use auto-generated build dir with commands other than build, "
-                "please specify build dir with -d/--build-dir"
-            )
-            sys.exit(1)
-        else:
-            build_dir = tempfile.mkdtemp(
-                prefix=".appimagecraft-build-{}-".format(builder_name),
-                dir=os.path.dirname(args.config_file),
-            )
+    return builder_name
+
+
+def _get_build_dir(
+    args: argparse.Namespace, config: dict, command_name: str, project_root_dir: str, builder_name: str
+) -> Tuple[str, Union[BuildRootPolicy, None]]:
+    """
+    :return: absolute path to the build dir, build root policy the build dir has been created with (if any)
+    """
+
+    logger = _logging.get_logger("cli")
+
+    build_dir = getattr(args, "build_dir", None)
+
+    if build_dir is not None:
+        return os.path.abspath(build_dir), None
+
+    if command_name != "build":
+        # commands like genscripts aren't very helpful if the user doesn't take care of managing the build
+        # directory; they want to call the scripts, after all
+        logger.critical(
+            "cannot use auto-generated build dir with commands other than build, "
+            "please specify build dir with -d/--build-dir"
+        )
+        sys.exit(1)
 
-    # make sure build_dir is absolute
-    build_dir = os.path.abspath(build_dir)
+    if args.incremental:
+        return get_incremental_build_dir(args.config_file, builder_name, get_config_arch(config)), None
+
+    try:
+        build_root_policy = BuildRootPolicy.from_config(config, args.build_root, args.min_free_space)
+        build_root = build_root_policy.get_build_root(project_root_dir, builder_name)
+    except ValueError as e:
+        logger.critical("Invalid build root configuration: {}".format(e))
+        sys.exit(1)
+    except InsufficientSpaceError as e:
+        logger.critical("Not enough free space for build: {}".format(e))
+        sys.exit(1)
+
+    return make_temporary_build_dir(build_root, builder_name), build_root_policy
+
+
+def _prepare_build_dir(args: argparse.Namespace, command_name: str, build_dir: str):
+    # checking whether the scripts are up to date must not have any side effects
+    if command_name == "genscripts" and args.check:
+        return
+
+    logger = _logging.get_logger("cli")
 
     # make sure build dir exists
     if not os.path.isdir(build_dir):
@@ -179,25 +432,83 @@ def run():
         os.mkdir(build_dir)
 
     logger.info("Building in directory {}".format(build_dir))
-    logger.info("Building with builder {}".format(builder_name))
 
     # ensure correct permissions on build dir
     os.chmod(build_dir, 0o755)
 
-    # get command instance
-    command = None
 
-    try:
-        command_class = commands_classes_map[command_name]
-    except KeyError:
-        pass
-    else:
-        command = command_class(config, project_root_dir, build_dir, builder_name)
+def run():
+    args = parse_args()
 
-    if command is None:
+    # setup
+    _logging.setup(
+        args.loglevel,
+        with_timestamps=args.log_timestamps,
+        force_colors=args.force_colors,
+        log_locations=args.log_message_locations,
+    )
+
+    # get logger for CLI
+    logger = _logging.get_logger("cli")
+
+    command_name = getattr(args, "command", None)
+
+    if command_name is None:
+        command_name = "build"
+
+    # these commands don't operate on a single project's build directory, and take care of parsing configs themselves
+    # commands are referred to by class name, so that only the command in use needs to be imported
+    standalone_commands_classes_map = {
+        "cache": "CacheCommand",
+        "matrix": "MatrixCommand",
+        "batch": "BatchCommand",
+        "gc": "GcCommand",
+        "pack-compare": "PackCompareCommand",
+        "analyze": "AnalyzeCommand",
+        "bench-artifact": "BenchArtifactCommand",
+    }
+
+    if command_name in standalone_commands_classes_map:
+        _run_standalone_command(standalone_commands_classes_map[command_name], args)
+        return
+
+    commands_classes_map = {
+        "build": "BuildCommand",
+        "genscripts": "GenerateScriptsCommand",
+        # "setup": "SetupCommand",
+    }
+
+    config = _load_config(args)
+
+    if command_name not in commands_classes_map:
         logger.critical("No such command: {}".format(command_name))
         sys.exit(1)
 
+    # project root dir = location of config file
+    project_root_dir = os.path.abspath(os.path.dirname(args.config_file))
+
+    builder_name = _get_builder_name(args, config)
+
+    command = getattr(commands, commands_classes_map[command_name])(config, project_root_dir, None, builder_name)
+
+    # invalid arguments are reported before a build dir is created
+    try:
+        command.configure(args)
+    except ValueError as e:
+        logger.critical("{}".format(e))
+        sys.exit(1)
+
+    build_dir, build_root_policy = _get_build_dir(args, config, command_name, project_root_dir, builder_name)
+    command.set_build_dir(build_dir)
+
+    # the recorded sizes are used to estimate whether later builds fit on tmpfs
+    if build_root_policy is not None and build_root_policy.is_auto():
+        command.set_record_build_size(True)
+
+    _prepare_build_dir(args, command_name, build_dir)
+
+    logger.info("Building with builder {}".format(builder_name))
+
     try:
         command.run()
     except NotImplementedError as e:
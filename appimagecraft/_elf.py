@@ -0,0 +1,182 @@
+import struct
+from typing import BinaryIO, List, Union
+
+ELF_MAGIC = b"\x7fELF"
+
+# program header types
+_PT_LOAD = 1
+_PT_DYNAMIC = 2
+
+# dynamic section tags
+_DT_NULL = 0
+_DT_NEEDED = 1
+_DT_STRTAB = 5
+
+# struct formats for 32-bit and 64-bit files (without byte order)
+_formats = {
+    1: {
+        "header": "HHIIIIIHHHHHH",
+        "program_header": "IIIIIIII",
+        "dynamic_entry": "iI",
+    },
+    2: {
+        "header": "HHIQQQIHHHHHH",
+        "program_header": "IIQQQQQQ",
+        "dynamic_entry": "qQ",
+    },
+}
+
+
+class ElfFile:
+    """
+    Minimal ELF parser, which reads just what appimagecraft needs: the libraries a file depends on, and the size of the
+    ELF part of a file (AppImages append their payload to the runtime, which is an ELF file).
+
+    :raises ValueError: if the file is not a valid ELF file
+    """
+
+    def __init__(self, f: BinaryIO):
+        self._f = f
+
+        f.seek(0)
+        ident = f.read(16)
+
+        if len(ident) < 16 or ident[:4] != ELF_MAGIC or ident[4] not in _formats or ident[5] not in (1, 2):
+            raise ValueError("not an ELF file")
+
+        self._formats = _formats[ident[4]]
+        self._byte_order = "<" if ident[5] == 1 else ">"
+
+        (
+            _,
+            _,
+            _,
+            _,
+            self._phoff,
+            self._shoff,
+            _,
+            _,
+            self._phentsize,
+            self._phnum,
+            self._shentsize,
+            self._shnum,
+            _,
+        ) = self._unpack(self._formats["header"], 16)
+
+    def _unpack(self, fmt: str, offset: int) -> tuple:
+        fmt = self._byte_order + fmt
+        size = struct.calcsize(fmt)
+
+        self._f.seek(offset)
+        data = self._f.read(size)
+
+        if len(data) < size:
+            raise ValueError("unexpected end of file")
+
+        return struct.unpack(fmt, data)
+
+    def _program_headers(self) -> List[tuple]:
+        """
+        :return: (type, offset, vaddr, filesz) of every program header
+        """
+
+        rv = []
+
+        for i in range(self._phnum):
+            fields = self._unpack(self._formats["program_header"], self._phoff + i * self._phentsize)
+
+            # the flags are at a different position in 32-bit files
+            if self._formats is _formats[1]:
+                p_type, p_offset, p_vaddr, _, p_filesz = fields[:5]
+            else:
+                p_type, _, p_offset, p_vaddr, _, p_filesz = fields[:6]
+
+            rv.append((p_type, p_offset, p_vaddr, p_filesz))
+
+        return rv
+
+    def _read_string(self, offset: int) -> str:
+        self._f.seek(offset)
+
+        data = b""
+
+        while b"\0" not in data:
+            chunk = self._f.read(256)
+
+            if not chunk:
+                raise ValueError("unterminated string")
+
+            data += chunk
+
+        return data.split(b"\0", 1)[0].decode(errors="replace")
+
+    def get_needed(self) -> List[str]:
+        """
+        :return: DT_NEEDED entries, i.e., the names of the libraries the file depends on directly
+        """
+
+        program_headers = self._program_headers()
+
+        dynamic = [i for i in program_headers if i[0] == _PT_DYNAMIC]
+
+        # statically linked
+        if not dynamic:
+            return []
+
+        _, dynamic_offset, _, dynamic_size = dynamic[0]
+
+        entry_size = struct.calcsize(self._byte_order + self._formats["dynamic_entry"])
+
+        needed_offsets = []
+        strtab_address = None
+
+        for i in range(dynamic_size // entry_size):
+            tag, value = self._unpack(self._formats["dynamic_entry"], dynamic_offset + i * entry_size)
+
+            if tag == _DT_NULL:
+                break
+            elif tag == _DT_NEEDED:
+                needed_offsets.append(value)
+            elif tag == _DT_STRTAB:
+                strtab_address = value
+
+        if strtab_address is None:
+            return []
+
+        # the string table is referenced by its virtual address, which needs to be mapped to a file offset
+        for p_type, p_offset, p_vaddr, p_filesz in program_headers:
+            if p_type == _PT_LOAD and p_vaddr <= strtab_address < p_vaddr + p_filesz:
+                strtab_offset = strtab_address - p_vaddr + p_offset
+                break
+        else:
+            raise ValueError("string table is not part of any segment")
+
+        return [self._read_string(strtab_offset + i) for i in needed_offsets]
+
+    def get_size(self) -> int:
+        """
+        :return: size of the ELF part of the file, assuming the section headers are at its end (the AppImage runtime
+            makes the same assumption to find its payload)
+        """
+
+        return self._shoff + self._shentsize * self._shnum
+
+
+def is_elf_file(path: str) -> bool:
+    try:
+        with open(path, "rb") as f:
+            return f.read(4) == ELF_MAGIC
+    except OSError:
+        return False
+
+
+def get_needed_libraries(path: str) -> Union[List[str], None]:
+    """
+    :return: names of the libraries an ELF file depends on directly, or None if the file is not a (valid) ELF file
+    """
+
+    try:
+        with open(path, "rb") as f:
+            return ElfFile(f).get_needed()
+    except (OSError, ValueError, struct.error):
+        return None
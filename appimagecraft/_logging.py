@@ -1,5 +1,5 @@
-import coloredlogs
 import logging
+import sys
 
 
 def setup(loglevel=logging.INFO, with_timestamps=False, force_colors=False, log_locations=False):
@@ -11,21 +11,29 @@ def setup(loglevel=logging.INFO, with_timestamps=False, force_colors=False, log_
     if log_locations:
         fmt = "%(pathname)s:%(lineno)d:\n" + fmt
 
-    # basic logging setup
-    styles = coloredlogs.DEFAULT_FIELD_STYLES
-    styles["pathname"] = {
-        "color": "magenta",
-    }
-    styles["levelname"] = {
-        "color": "cyan",
-    }
+    # without a terminal, coloredlogs wouldn't use colors anyway (e.g., in CI or when run by the matrix command)
+    # importing it takes a considerable amount of the startup time, so we use plain logging in this case
+    if not force_colors and not sys.stderr.isatty():
+        logging.basicConfig(level=loglevel, format=fmt, datefmt="%Y-%m-%d %H:%M:%S")
 
-    kwargs = dict(fmt=fmt, styles=styles)
+    else:
+        import coloredlogs
 
-    if force_colors:
-        kwargs["isatty"] = True
+        # basic logging setup
+        styles = coloredlogs.DEFAULT_FIELD_STYLES
+        styles["pathname"] = {
+            "color": "magenta",
+        }
+        styles["levelname"] = {
+            "color": "cyan",
+        }
 
-    coloredlogs.install(loglevel, **kwargs)
+        kwargs = dict(fmt=fmt, styles=styles)
+
+        if force_colors:
+            kwargs["isatty"] = True
+
+        coloredlogs.install(loglevel, **kwargs)
 
     # set up logger
     logger = logging.getLogger("main")
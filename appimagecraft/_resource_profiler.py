@@ -0,0 +1,591 @@
+import bisect
+import json
+import os
+import threading
+from typing import Dict, List, Tuple, Union
+
+from ._logging import get_logger
+from ._trace import Span, current_timestamp
+from ._util import format_size
+
+# columns of the samples, cpu_time, read_bytes and written_bytes are cumulative counters
+SAMPLE_COLUMNS = ["timestamp", "cpu_time", "rss", "read_bytes", "written_bytes", "processes"]
+
+_TIMESTAMP, _CPU_TIME, _RSS, _READ_BYTES, _WRITTEN_BYTES, _PROCESSES = range(len(SAMPLE_COLUMNS))
+
+_clock_ticks = os.sysconf("SC_CLK_TCK")
+_page_size = os.sysconf("SC_PAGE_SIZE")
+
+
+def _read_stat(pid: Union[int, str]) -> Union[List[str], None]:
+    """
+    :return: fields of /proc/<pid>/stat following the command name (i.e., starting with the state), None if the
+        process does not exist (anymore)
+    """
+
+    try:
+        with open("/proc/{}/stat".format(pid)) as f:
+            data = f.read()
+    except OSError:
+        return None
+
+    # the command name may contain spaces and parentheses
+    start = data.rindex(")") + 2
+
+    return data[start:].split()
+
+
+def _get_ppid(pid: int) -> Union[int, None]:
+    fields = _read_stat(pid)
+
+    if fields is None:
+        return None
+
+    return int(fields[1])
+
+
+def _read_io(pid: int) -> Tuple[int, int]:
+    """
+    :return: bytes read from and written to storage by the process and the children it has waited for
+    """
+
+    values = {}
+
+    try:
+        with open("/proc/{}/io".format(pid)) as f:
+            for line in f:
+                key, value = line.split(":")
+                values[key] = int(value)
+
+    # the kernel might have been built without I/O accounting
+    except (OSError, ValueError):
+        pass
+
+    return values.get("read_bytes", 0), values.get("write_bytes", 0)
+
+
+def _read_key_value_file(path: str) -> Dict[str, int]:
+    rv = {}
+
+    with open(path) as f:
+        for line in f:
+            key, value = line.split()
+            rv[key] = int(value)
+
+    return rv
+
+
+def get_memory_total() -> Union[int, None]:
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemTotal:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+
+    return None
+
+
+class ProcessTreeSampler:
+    """
+    Samples the resource usage of a process and all its descendants from /proc.
+
+    The CPU time and I/O of an exited process are added to its parent's counters once the parent has waited for it,
+    so summing up the counters of all processes in the tree (including the ones of the children they have waited for)
+    yields the totals of the whole tree. Only processes which leave the tree (e.g., daemons) are lost. The RSS is the
+    sum of the RSS of all processes, i.e., memory shared between processes is counted several times.
+    """
+
+    method = "proc"
+
+    def __init__(self, pid: int):
+        self._pid = pid
+
+    def _find_tree(self) -> Dict[int, List[str]]:
+        """
+        :return: pid -> stat fields of the root process and all its descendants
+        """
+
+        stats = {}
+        children = {}
+
+        for entry in os.listdir("/proc"):
+            if not entry.isdigit():
+                continue
+
+            fields = _read_stat(entry)
+
+            if fields is None:
+                continue
+
+            pid = int(entry)
+            stats[pid] = fields
+            children.setdefault(int(fields[1]), []).append(pid)
+
+        rv = {}
+        stack = [self._pid]
+
+        while stack:
+            pid = stack.pop()
+
+            if pid in stats:
+                rv[pid] = stats[pid]
+                stack += children.get(pid, [])
+
+        return rv
+
+    def sample(self) -> Union[list, None]:
+        """
+        :return: sample without timestamp (see SAMPLE_COLUMNS), None if the root process has exited
+        """
+
+        tree = self._find_tree()
+
+        if not tree:
+            return None
+
+        cpu_ticks = 0
+        rss_pages = 0
+        read_bytes = 0
+        written_bytes = 0
+
+        for pid, fields in tree.items():
+            # utime, stime, cutime and cstime
+            cpu_ticks += sum((int(i) for i in fields[11:15]))
+            rss_pages += int(fields[21])
+
+            read, written = _read_io(pid)
+            read_bytes += read
+            written_bytes += written
+
+        return [cpu_ticks / _clock_ticks, rss_pages * _page_size, read_bytes, written_bytes, len(tree)]
+
+
+class CgroupSampler:
+    """
+    Samples the resource usage of the cgroup (v2) appimagecraft runs in, which is only accurate if the cgroup contains
+    nothing but appimagecraft and the build, e.g., in a container. The kernel accounts for all processes in the cgroup,
+    so nothing gets lost between samples, and shared memory is counted only once. The RSS is approximated by the
+    anonymous and file-mapped memory.
+    """
+
+    method = "cgroup"
+
+    def __init__(self, path: str, baseline_processes: int = 0):
+        self._path = path
+
+        # processes in the cgroup which aren't part of the build, i.e., appimagecraft and its ancestors
+        self._baseline_processes = baseline_processes
+
+    @staticmethod
+    def _find_own_cgroup() -> Union[str, None]:
+        mount_point = None
+
+        with open("/proc/self/mountinfo") as f:
+            for line in f:
+                fields = line.split()
+
+                # the filesystem type follows the separator of the optional fields
+                if fields[fields.index("-") + 1] == "cgroup2":
+                    mount_point = fields[4]
+                    break
+
+        if mount_point is None:
+            return None
+
+        with open("/proc/self/cgroup") as f:
+            for line in f:
+                if line.startswith("0::"):
+                    return os.path.join(mount_point, line.rstrip("\n")[3:].lstrip("/"))
+
+        return None
+
+    @staticmethod
+    def _is_own_process(pid: int, ancestors: List[int]) -> bool:
+        """
+        :return: whether the process is appimagecraft, one of its ancestors or one of its descendants
+        """
+
+        if pid in ancestors:
+            return True
+
+        while pid is not None and pid > 1:
+            pid = _get_ppid(pid)
+
+            if pid == ancestors[0]:
+                return True
+
+        return False
+
+    @classmethod
+    def create(cls) -> Union["CgroupSampler", None]:
+        """
+        :return: sampler, None if cgroup v2 accounting is not available, or if other processes share the cgroup
+        """
+
+        try:
+            path = cls._find_own_cgroup()
+
+            if path is None:
+                return None
+
+            for filename in ["cpu.stat", "memory.stat", "io.stat"]:
+                if not os.path.exists(os.path.join(path, filename)):
+                    return None
+
+            if _read_key_value_file(os.path.join(path, "cgroup.stat")).get("nr_descendants", 0) > 0:
+                return None
+
+            ancestors = [os.getpid()]
+
+            while ancestors[-1] > 1:
+                ppid = _get_ppid(ancestors[-1])
+
+                if ppid is None or ppid == 0:
+                    break
+
+                ancestors.append(ppid)
+
+            sampler = cls(path)
+            procs = sampler._read_procs()
+
+            if not all((cls._is_own_process(pid, ancestors) for pid in procs)):
+                return None
+
+            return cls(path, len([pid for pid in procs if pid in ancestors]))
+
+        except (OSError, ValueError):
+            return None
+
+    def _read_procs(self) -> List[int]:
+        with open(os.path.join(self._path, "cgroup.procs")) as f:
+            return [int(line) for line in f]
+
+    def _read_io_stat(self) -> Tuple[int, int]:
+        read_bytes = 0
+        written_bytes = 0
+
+        # one line per device: <major>:<minor> rbytes=... wbytes=... rios=...
+        with open(os.path.join(self._path, "io.stat")) as f:
+            for line in f:
+                for field in line.split()[1:]:
+                    key, value = field.split("=")
+
+                    if key == "rbytes":
+                        read_bytes += int(value)
+                    elif key == "wbytes":
+                        written_bytes += int(value)
+
+        return read_bytes, written_bytes
+
+    def sample(self) -> Union[list, None]:
+        """
+        :return: sample without timestamp (see SAMPLE_COLUMNS)
+        """
+
+        cpu_stat = _read_key_value_file(os.path.join(self._path, "cpu.stat"))
+        memory_stat = _read_key_value_file(os.path.join(self._path, "memory.stat"))
+        read_bytes, written_bytes = self._read_io_stat()
+        processes = max(0, len(self._read_procs()) - self._baseline_processes)
+
+        return [
+            cpu_stat["usage_usec"] / 1000000,
+            memory_stat.get("anon", 0) + memory_stat.get("file_mapped", 0),
+            read_bytes,
+            written_bytes,
+            processes,
+        ]
+
+
+class ResourceProfiler:
+    """
+    Samples CPU time, RSS, I/O and the number of processes of the build script and everything it starts in a
+    background thread, using cgroup v2 accounting if possible and /proc otherwise. The samples are assigned to the build
+    stages recorded in the timings file afterwards.
+    """
+
+    default_interval = 0.5
+
+    def __init__(self, interval: float = None):
+        if interval is None:
+            interval = self.default_interval
+
+        if interval <= 0:
+            raise ValueError("interval must be positive")
+
+        self._interval = interval
+
+        self._logger = get_logger("resource_profiler")
+
+        self._sampler = None
+        self._samples = []
+
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def get_method(self) -> Union[str, None]:
+        if self._sampler is None:
+            return None
+
+        return self._sampler.method
+
+    def get_samples(self) -> List[list]:
+        return list(self._samples)
+
+    def _sample(self):
+        try:
+            values = self._sampler.sample()
+        except (OSError, ValueError, KeyError) as e:
+            self._logger.debug("Could not sample resource usage: {}".format(e))
+            return
+
+        if values is not None:
+            self._samples.append([current_timestamp()] + values)
+
+    def _run(self):
+        while True:
+            self._sample()
+
+            if self._stop_event.wait(self._interval):
+                break
+
+    def start(self, pid: int):
+        """
+        Start sampling the process (e.g., the build script) and its descendants.
+        """
+
+        self._sampler = CgroupSampler.create() or ProcessTreeSampler(pid)
+
+        self._logger.debug("Sampling resource usage every {} s using {}".format(self._interval, self.get_method()))
+
+        self._thread = threading.Thread(target=self._run, name="resource-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+
+        self._stop_event.set()
+        self._thread.join()
+        self._thread = None
+
+        # in cgroup mode, the last sample covers the end of the build
+        if self._sampler.method == CgroupSampler.method:
+            self._sample()
+
+
+class _SampleSeries:
+    """
+    Samples ordered by their timestamps, with the counters interpolated between them.
+    """
+
+    def __init__(self, samples: List[list]):
+        self._samples = samples
+        self._timestamps = [sample[_TIMESTAMP] for sample in samples]
+
+    def value_at(self, column: int, timestamp: int) -> float:
+        index = bisect.bisect_left(self._timestamps, timestamp)
+
+        if index == 0:
+            return self._samples[0][column]
+
+        if index == len(self._samples):
+            return self._samples[-1][column]
+
+        before = self._samples[index - 1]
+        after = self._samples[index]
+
+        ratio = (timestamp - before[_TIMESTAMP]) / (after[_TIMESTAMP] - before[_TIMESTAMP])
+
+        return before[column] + (after[column] - before[column]) * ratio
+
+    def difference(self, column: int, start: int, end: int) -> float:
+        # counters can decrease slightly if processes leave the process tree
+        return max(0, self.value_at(column, end) - self.value_at(column, start))
+
+    def between(self, start: int, end: int) -> List[list]:
+        """
+        :return: samples taken between start and end, or the closest sample if the range is shorter than the interval
+        """
+
+        first = bisect.bisect_left(self._timestamps, start)
+        last = bisect.bisect_right(self._timestamps, end)
+
+        rv = self._samples[first:last]
+
+        if not rv:
+            rv = [self._samples[min(first, len(self._samples) - 1)]]
+
+        return rv
+
+
+def _get_innermost_span(spans: List[Span], timestamp: int) -> Union[Span, None]:
+    rv = None
+
+    for span in spans:
+        if span.start <= timestamp <= span.end and (rv is None or span.depth >= rv.depth):
+            rv = span
+
+    return rv
+
+
+def summarize_samples(samples: List[list], spans: List[Span], cpus: int) -> dict:
+    """
+    Summarize the resource usage of the build, both as a whole and per stage. Stages outside the sampled period are
+    left out.
+
+    CPU saturation is the share of the available CPUs' time the build used: 100 % means all CPUs were busy all the
+    time. Peak RSS values are the highest sampled values, short peaks between two samples are not seen.
+
+    :return: JSON serializable summary
+    """
+
+    series = _SampleSeries(samples)
+
+    start = samples[0][_TIMESTAMP]
+    end = samples[-1][_TIMESTAMP]
+
+    peak = max(samples, key=lambda sample: sample[_RSS])
+    peak_span = _get_innermost_span(spans, peak[_TIMESTAMP])
+
+    def get_saturation(cpu_time: float, duration: float) -> float:
+        return cpu_time / duration / cpus if duration > 0 else 0
+
+    stages = []
+
+    for span in spans:
+        # stages run by appimagecraft itself (e.g., generating the scripts) aren't covered by the samples
+        if span.end < start or span.start > end:
+            continue
+
+        cpu_time = series.difference(_CPU_TIME, span.start, span.end)
+        stage_samples = series.between(span.start, span.end)
+
+        stages.append(
+            {
+                "name": span.name,
+                "depth": span.depth,
+                "duration": span.duration(),
+                "cpu_time": cpu_time,
+                "cpu_saturation": get_saturation(cpu_time, span.duration()),
+                "peak_rss": max((sample[_RSS] for sample in stage_samples)),
+                "read_bytes": round(series.difference(_READ_BYTES, span.start, span.end)),
+                "written_bytes": round(series.difference(_WRITTEN_BYTES, span.start, span.end)),
+                "max_processes": max((sample[_PROCESSES] for sample in stage_samples)),
+            }
+        )
+
+    cpu_time = series.difference(_CPU_TIME, start, end)
+
+    return {
+        "cpus": cpus,
+        "memory_total": get_memory_total(),
+        "cpu_time": cpu_time,
+        "average_cpu_saturation": get_saturation(cpu_time, (end - start) / 1000000),
+        "peak_rss": peak[_RSS],
+        "peak_rss_stage": peak_span.name if peak_span is not None else None,
+        "read_bytes": round(series.difference(_READ_BYTES, start, end)),
+        "written_bytes": round(series.difference(_WRITTEN_BYTES, start, end)),
+        "max_processes": max((sample[_PROCESSES] for sample in samples)),
+        "stages": stages,
+    }
+
+
+def format_summary(summary: dict) -> List[str]:
+    """
+    Format summary created by summarize_samples() as a plain text table, nested stages are indented.
+    """
+
+    rows = [("stage", "CPU", "peak RSS", "read", "written", "processes")]
+
+    for stage in summary["stages"]:
+        rows.append(
+            (
+                "  " * stage["depth"] + stage["name"],
+                "{:.1f} %".format(stage["cpu_saturation"] * 100),
+                format_size(stage["peak_rss"]),
+                format_size(stage["read_bytes"]),
+                format_size(stage["written_bytes"]),
+                str(stage["max_processes"]),
+            )
+        )
+
+    widths = [max((len(row[i]) for row in rows)) for i in range(len(rows[0]))]
+
+    rv = []
+
+    for row in rows:
+        cells = [row[0].ljust(widths[0])] + [value.rjust(width) for value, width in zip(row[1:], widths[1:])]
+        rv.append("  ".join(cells))
+
+    peak = "Peak RSS: {}".format(format_size(summary["peak_rss"]))
+
+    if summary["memory_total"]:
+        peak += " ({:.1f} % of the memory)".format(summary["peak_rss"] / summary["memory_total"] * 100)
+
+    if summary["peak_rss_stage"] is not None:
+        peak += " in stage {}".format(summary["peak_rss_stage"])
+
+    rv.append(peak)
+    rv.append(
+        "Average CPU saturation: {:.1f} % of {} CPUs ({:.1f} s CPU time)".format(
+            summary["average_cpu_saturation"] * 100, summary["cpus"], summary["cpu_time"]
+        )
+    )
+
+    return rv
+
+
+def get_trace_counters(samples: List[list]) -> List[Tuple[int, Dict[str, float]]]:
+    """
+    :return: timestamp -> values of counter tracks for the Chrome trace event format: CPUs in use since the previous
+        sample, RSS in MiB and number of processes
+    """
+
+    rv = []
+
+    for previous, sample in zip(samples, samples[1:]):
+        duration = (sample[_TIMESTAMP] - previous[_TIMESTAMP]) / 1000000
+        cpu_time = max(0, sample[_CPU_TIME] - previous[_CPU_TIME])
+
+        rv.append(
+            (
+                sample[_TIMESTAMP],
+                {
+                    "CPUs in use": round(cpu_time / duration, 2) if duration > 0 else 0,
+                    "RSS (MiB)": round(sample[_RSS] / 1024 / 1024, 1),
+                    "processes": sample[_PROCESSES],
+                },
+            )
+        )
+
+    return rv
+
+
+def write_profile(path: str, method: str, interval: float, samples: List[list], summary: dict):
+    """
+    Write the samples and their summary as JSON. To keep the file compact, the samples are stored as lists of values
+    (see SAMPLE_COLUMNS), timestamps relative to the first sample in seconds.
+    """
+
+    start = samples[0][_TIMESTAMP]
+
+    compact_samples = []
+
+    for sample in samples:
+        compact_sample = [round((sample[_TIMESTAMP] - start) / 1000000, 3), round(sample[_CPU_TIME], 3)]
+        compact_sample += sample[_RSS:]
+        compact_samples.append(compact_sample)
+
+    data = {
+        "method": method,
+        "interval": interval,
+        "start": start,
+        "columns": SAMPLE_COLUMNS,
+        "samples": compact_samples,
+        "summary": summary,
+    }
+
+    with open(path, "w") as f:
+        json.dump(data, f, separators=(",", ":"))
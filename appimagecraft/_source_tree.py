@@ -0,0 +1,157 @@
+import fnmatch
+import hashlib
+import os
+import subprocess
+from typing import Union
+
+from ._logging import get_logger
+
+# files written into the project root directory by appimagecraft (build directories, artifacts, logs, reports) and its
+# configs must not affect the hash
+# the relevant parts of the config end up in the generated scripts, which are hashed separately
+# the project's own files named appimagecraft-* must be hashed, so only the names appimagecraft uses are excluded
+_EXCLUDED_PATTERNS = [
+    ".appimagecraft-*",
+    "appimagecraft-artifacts.json",
+    "appimagecraft-batch.json",
+    "appimagecraft-build.log",
+    "appimagecraft-build.log.*",
+    "appimagecraft-manifest.json",
+    "appimagecraft.yml",
+    "*.AppImage",
+    "*.AppImage.*",
+]
+
+
+def _is_excluded(relpath: str) -> bool:
+    for part in relpath.split(os.sep):
+        if any((fnmatch.fnmatch(part, pattern) for pattern in _EXCLUDED_PATTERNS)):
+            return True
+
+    return False
+
+
+def _git(root_dir: str, *args) -> bytes:
+    return subprocess.check_output(["git", "-C", root_dir] + list(args), stderr=subprocess.DEVNULL)
+
+
+def _stat_fingerprint(path: str) -> bytes:
+    try:
+        stat = os.lstat(path)
+    except FileNotFoundError:
+        return b"deleted"
+
+    return "{} {}".format(stat.st_size, stat.st_mtime_ns).encode()
+
+
+def _fingerprint_modified_path(path: str) -> bytes:
+    # git reports modified submodules as a whole, editing files inside them doesn't change the directory's stat
+    if os.path.isdir(path) and os.path.exists(os.path.join(path, ".git")):
+        return (_hash_git_tree(path) or _hash_file_index(path)).encode()
+
+    return _stat_fingerprint(path)
+
+
+def _hash_git_tree(root_dir: str) -> Union[str, None]:
+    """
+    Hash the files tracked by git in their committed state, plus the size and mtime of files which have been modified
+    or are untracked. git keeps track of modifications itself, so the files don't have to be read. Modified submodules
+    are hashed the same way.
+
+    :return: hash, or None if root_dir is not in a git repository (or git is not available)
+    """
+
+    try:
+        toplevel = _git(root_dir, "rev-parse", "--show-toplevel").decode().strip()
+
+        # one line per file: <mode> <type> <object>\t<path relative to root_dir>
+        tree = _git(root_dir, "ls-tree", "-r", "-z", "HEAD", "--", ".")
+
+        # paths are relative to the repository root
+        status = _git(root_dir, "status", "--porcelain", "-z", "--untracked-files=all", "--", ".")
+
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+    hasher = hashlib.sha256()
+
+    for entry in tree.split(b"\0"):
+        if not entry:
+            continue
+
+        _, path = entry.split(b"\t", 1)
+
+        if not _is_excluded(os.fsdecode(path)):
+            hasher.update(entry)
+            hasher.update(b"\0")
+
+    entries = iter(status.split(b"\0"))
+
+    for entry in entries:
+        if not entry:
+            continue
+
+        # renames and copies are followed by the original path, which we don't need
+        if entry[:1] in (b"R", b"C"):
+            next(entries, None)
+
+        path = os.path.join(toplevel, os.fsdecode(entry[3:]))
+
+        if _is_excluded(os.path.relpath(path, root_dir)):
+            continue
+
+        hasher.update(entry)
+        hasher.update(_fingerprint_modified_path(path))
+        hasher.update(b"\0")
+
+    return "git-" + hasher.hexdigest()
+
+
+def _hash_file_index(root_dir: str) -> str:
+    """
+    Hash the paths, sizes and mtimes of all files in the directory tree.
+    """
+
+    hasher = hashlib.sha256()
+
+    for dirpath, dirnames, filenames in os.walk(root_dir):
+        reldir = os.path.relpath(dirpath, root_dir)
+
+        dirnames[:] = sorted(
+            (d for d in dirnames if d != ".git" and not _is_excluded(os.path.normpath(os.path.join(reldir, d))))
+        )
+
+        for filename in sorted(filenames):
+            relpath = os.path.normpath(os.path.join(reldir, filename))
+
+            if _is_excluded(relpath):
+                continue
+
+            hasher.update(os.fsencode(relpath))
+            hasher.update(b" ")
+            hasher.update(_stat_fingerprint(os.path.join(dirpath, filename)))
+            hasher.update(b"\0")
+
+    return "index-" + hasher.hexdigest()
+
+
+def get_source_tree_hash(root_dir: str) -> str:
+    """
+    Calculate a hash of the source tree which changes whenever a file is changed, added or removed. If the directory is
+    in a git repository, git's data is used, which is much faster than walking through the tree. Otherwise, an index of
+    the paths, sizes and mtimes of all files is hashed. In both cases, the contents of the files are never read.
+
+    Files ignored by git are not taken into account.
+    """
+
+    logger = get_logger("source_tree")
+
+    rv = _hash_git_tree(root_dir)
+
+    if rv is None:
+        logger.debug("{} is not in a git repository, hashing file index".format(root_dir))
+        rv = _hash_file_index(root_dir)
+
+    logger.debug("source tree hash of {}: {}".format(root_dir, rv))
+
+    return rv
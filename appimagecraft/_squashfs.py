@@ -0,0 +1,223 @@
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+from typing import List, Tuple, Union
+
+from ._build_root import get_directory_size
+from ._util import format_size, parse_size
+
+
+class SquashfsSettings:
+    """
+    Settings for the squashfs image the AppDir is packed into.
+
+    The compression is passed to linuxdeploy's AppImage output plugin (as $LDAI_COMP). The plugin doesn't provide a
+    way to pass any other options to mksquashfs, so if a compression level, block size or number of processors is set,
+    the generated scripts pack the AppDir themselves.
+    """
+
+    compressions = ["gzip", "xz", "zstd"]
+
+    # mksquashfs doesn't support compression levels for xz
+    _level_ranges = {
+        "gzip": (1, 9),
+        "zstd": (1, 22),
+    }
+
+    _min_block_size = 4 * 1024
+    _max_block_size = 1024 * 1024
+
+    def __init__(
+        self,
+        compression: str = None,
+        level: int = None,
+        block_size: Union[str, int] = None,
+        processors: int = None,
+    ):
+        """
+        :raises ValueError: in case a setting is invalid
+        """
+
+        if compression is not None and compression not in self.compressions:
+            raise ValueError(
+                "invalid compression: {} (must be one of {})".format(compression, ", ".join(self.compressions))
+            )
+
+        if level is not None:
+            level = int(level)
+
+            try:
+                min_level, max_level = self._level_ranges[compression]
+            except KeyError:
+                raise ValueError(
+                    "compression level requires compression to be one of {}".format(
+                        ", ".join(self._level_ranges.keys())
+                    )
+                )
+
+            if not min_level <= level <= max_level:
+                raise ValueError(
+                    "invalid compression level for {}: {} (must be {}-{})".format(
+                        compression, level, min_level, max_level
+                    )
+                )
+
+        if block_size is not None:
+            block_size = parse_size(block_size)
+
+            # mksquashfs only supports powers of two
+            if not self._min_block_size <= block_size <= self._max_block_size or block_size & (block_size - 1):
+                raise ValueError(
+                    "invalid block size: {} (must be a power of two between {} and {})".format(
+                        block_size, format_size(self._min_block_size), format_size(self._max_block_size)
+                    )
+                )
+
+        if processors is not None:
+            processors = int(processors)
+
+            if processors < 1:
+                raise ValueError("invalid number of processors: {}".format(processors))
+
+        self.compression = compression
+        self.level = level
+        self.block_size = block_size
+        self.processors = processors
+
+    @classmethod
+    def from_config(cls, config: Union[dict, None]):
+        """
+        :param config: squashfs section in the appimage section of the config
+        """
+
+        if config is None:
+            config = {}
+
+        if not isinstance(config, dict):
+            raise ValueError("appimage.squashfs: must be a dict")
+
+        invalid_keys = set(config.keys()) - {"compression", "level", "block_size", "processors"}
+        if invalid_keys:
+            raise ValueError("Invalid key in appimage.squashfs: {}".format(list(invalid_keys)[0]))
+
+        return cls(**config)
+
+    @classmethod
+    def parse(cls, spec: str):
+        """
+        Parse specification like zstd, zstd:19 or zstd:19:1M:4 (<compression>[:<level>[:<block size>[:<processors>]]]).
+        Fields can be left empty to use the default, e.g., xz::1M.
+        """
+
+        fields = spec.split(":")
+
+        if len(fields) > 4:
+            raise ValueError("Invalid squashfs settings: {}".format(spec))
+
+        fields = [field or None for field in fields] + [None] * (4 - len(fields))
+
+        return cls(*fields)
+
+    def needs_custom_packing(self) -> bool:
+        """
+        :return: whether the settings can't be passed to linuxdeploy's AppImage output plugin
+        """
+
+        return any((i is not None for i in [self.level, self.block_size, self.processors]))
+
+    def get_mksquashfs_args(self) -> List[str]:
+        rv = []
+
+        if self.compression is not None:
+            rv += ["-comp", self.compression]
+
+        if self.level is not None:
+            rv += ["-Xcompression-level", str(self.level)]
+
+        if self.block_size is not None:
+            rv += ["-b", str(self.block_size)]
+
+        if self.processors is not None:
+            rv += ["-processors", str(self.processors)]
+
+        return rv
+
+    @staticmethod
+    def _format_block_size(block_size: Union[int, None]) -> Union[str, None]:
+        if block_size is None:
+            return None
+
+        for unit, factor in [("M", 1024 * 1024), ("K", 1024)]:
+            if block_size % factor == 0:
+                return "{}{}".format(block_size // factor, unit)
+
+        return str(block_size)
+
+    def __str__(self):
+        fields = [self.compression, self.level, self._format_block_size(self.block_size), self.processors]
+
+        # omit trailing defaults
+        while fields and fields[-1] is None:
+            fields.pop()
+
+        return ":".join(("" if i is None else str(i) for i in fields)) or "default"
+
+
+def pack_appdir(appdir: str, image_path: str, settings: SquashfsSettings) -> float:
+    """
+    Pack AppDir into a squashfs image the same way appimagetool does.
+
+    :return: time it took in seconds
+    """
+
+    command = ["mksquashfs", appdir, image_path, "-root-owned", "-noappend", "-quiet", "-no-progress"]
+    command += settings.get_mksquashfs_args()
+
+    start = time.monotonic()
+    subprocess.check_call(command, stdout=subprocess.DEVNULL)
+
+    return time.monotonic() - start
+
+
+def unpack_image(image_path: str, dest: str, offset: int = 0):
+    """
+    Extract squashfs image with unsquashfs.
+
+    :param offset: offset of the image within the file, e.g., the size of an AppImage's runtime
+    """
+
+    command = ["unsquashfs", "-q", "-n", "-d", dest]
+
+    if offset:
+        command += ["-o", str(offset)]
+
+    subprocess.check_call(command + [image_path], stdout=subprocess.DEVNULL)
+
+
+def measure_unpacking(image_path: str) -> Tuple[float, int]:
+    """
+    Extract squashfs image into a temporary directory, which approximates how quickly the AppImage's contents can be
+    read at runtime.
+
+    :return: time it took in seconds, size of the extracted files in bytes
+    """
+
+    tmpdir = tempfile.mkdtemp(prefix="appimagecraft-unpack-")
+
+    try:
+        dest = os.path.join(tmpdir, "root")
+
+        start = time.monotonic()
+        unpack_image(image_path, dest)
+        duration = time.monotonic() - start
+
+        return duration, get_directory_size(dest)
+
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+def find_missing_squashfs_tools() -> List[str]:
+    return [tool for tool in ["mksquashfs", "unsquashfs"] if shutil.which(tool) is None]
@@ -0,0 +1,262 @@
+import os
+import re
+import shutil
+import signal
+import subprocess
+import tempfile
+import threading
+import time
+from typing import Dict, List, Union
+
+# ways to launch an AppImage
+LAUNCH_MODES = ["extract-and-run", "extracted", "fuse"]
+
+# metrics recorded for every run, see StartupRun
+METRICS = ["wall_time", "cpu_time", "major_page_faults", "minor_page_faults", "bytes_read"]
+
+PERCENTILES = [50, 90, 95, 99]
+
+
+class SmokeCommandError(Exception):
+    pass
+
+
+class StartupRun:
+    """
+    Measurements of a single launch of an AppImage. Resource usage includes all processes the launched process has
+    waited for (e.g., the ones started by AppRun scripts).
+    """
+
+    def __init__(self, wall_time: float, rusage):
+        self.wall_time = wall_time
+        self.cpu_time = rusage.ru_utime + rusage.ru_stime
+        self.major_page_faults = rusage.ru_majflt
+        self.minor_page_faults = rusage.ru_minflt
+        # the kernel counts blocks of 512 bytes, only reads which actually hit the disk are counted
+        self.bytes_read = rusage.ru_inblock * 512
+
+    def to_dict(self) -> dict:
+        return {metric: getattr(self, metric) for metric in METRICS}
+
+
+def evict_from_page_cache(path: str):
+    """
+    Drop the pages of a file, or of all files in a directory, from the page cache, so that the next launch has to read
+    them from disk again. Unlike dropping all caches, this doesn't require root privileges.
+    """
+
+    if os.path.isdir(path) and not os.path.islink(path):
+        for dirpath, dirnames, filenames in os.walk(path):
+            for filename in filenames:
+                evict_from_page_cache(os.path.join(dirpath, filename))
+
+        return
+
+    try:
+        fd = os.open(path, os.O_RDONLY | os.O_NOFOLLOW)
+    except OSError:
+        return
+
+    try:
+        # dirty pages, e.g., of freshly extracted files, can't be dropped
+        os.fdatasync(fd)
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+    except OSError:
+        pass
+
+    finally:
+        os.close(fd)
+
+
+def run_once(command: List[str], env: Dict[str, str], cwd: str, timeout: float) -> StartupRun:
+    """
+    Launch command and wait for it to exit.
+
+    :raises SmokeCommandError: if the command fails or times out
+    """
+
+    with tempfile.TemporaryFile() as stderr:
+        start = time.monotonic()
+
+        # a new session allows for killing all processes the command has started on timeout
+        proc = subprocess.Popen(
+            command,
+            env=env,
+            cwd=cwd,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=stderr,
+            start_new_session=True,
+        )
+
+        def kill():
+            try:
+                os.killpg(proc.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+
+        timer = threading.Timer(timeout, kill)
+        timer.start()
+
+        try:
+            # unlike Popen.wait(), wait4() reports the resource usage of the process
+            _, status, rusage = os.wait4(proc.pid, 0)
+        finally:
+            timer.cancel()
+
+        wall_time = time.monotonic() - start
+
+        proc.returncode = os.waitstatus_to_exitcode(status)
+
+        if proc.returncode != 0:
+            stderr.seek(0)
+            output = stderr.read().decode(errors="replace").strip()
+
+            if proc.returncode == -signal.SIGKILL and wall_time >= timeout:
+                message = "timed out after {} s".format(timeout)
+            else:
+                message = "exited with code {}".format(proc.returncode)
+
+            raise SmokeCommandError("{}{}".format(message, ": {}".format(output[-2000:]) if output else ""))
+
+    return StartupRun(wall_time, rusage)
+
+
+_ld_statistics_pattern = re.compile(r"^\s*(\d+):\s+(.+?):\s+(\d+)(?: cycles)?(?: \(.*\))?\s*$")
+
+
+def parse_ld_statistics(path: str) -> Dict[str, Dict[str, int]]:
+    """
+    Parse the output of the dynamic linker with LD_DEBUG=statistics.
+
+    :return: pid -> statistic (e.g., "total startup time in dynamic loader") -> value (cycles or counts)
+    """
+
+    rv = {}
+
+    with open(path, errors="replace") as f:
+        for line in f:
+            match = _ld_statistics_pattern.match(line)
+
+            if match:
+                pid, name, value = match.groups()
+                rv.setdefault(pid, {})[name] = int(value)
+
+    return rv
+
+
+def percentile(values: List[float], percent: float) -> Union[float, None]:
+    """
+    Calculate percentile with linear interpolation between the closest ranks.
+    """
+
+    if not values:
+        return None
+
+    values = sorted(values)
+
+    rank = (len(values) - 1) * percent / 100
+    lower = int(rank)
+    upper = min(lower + 1, len(values) - 1)
+
+    return values[lower] + (values[upper] - values[lower]) * (rank - lower)
+
+
+def summarize(runs: List[StartupRun]) -> Dict[str, dict]:
+    """
+    :return: metric -> min, max, mean and percentiles (p50, p90...)
+    """
+
+    rv = {}
+
+    for metric in METRICS:
+        values = [getattr(run, metric) for run in runs]
+
+        summary = {
+            "min": min(values),
+            "max": max(values),
+            "mean": sum(values) / len(values),
+        }
+
+        for percent in PERCENTILES:
+            summary["p{}".format(percent)] = percentile(values, percent)
+
+        rv[metric] = summary
+
+    return rv
+
+
+class AppImageLauncher:
+    """
+    Launches an AppImage in one of the LAUNCH_MODES:
+
+    - extract-and-run: the runtime extracts the AppImage into a temporary directory on every launch, works without FUSE
+    - extracted: the AppImage is extracted once, and its AppRun is launched directly, works without FUSE
+    - fuse: the runtime mounts the AppImage, requires FUSE
+    """
+
+    def __init__(self, appimage: str, mode: str, args: List[str]):
+        if mode not in LAUNCH_MODES:
+            raise ValueError("invalid launch mode: {} (must be one of {})".format(mode, ", ".join(LAUNCH_MODES)))
+
+        self._appimage = os.path.abspath(appimage)
+        self._mode = mode
+        self._args = args
+
+        self._tmpdir = None
+
+    def __enter__(self):
+        self._tmpdir = tempfile.mkdtemp(prefix="appimagecraft-bench-")
+
+        if self._mode == "extracted":
+            # like this, the AppImage's runtime takes care of extracting it, no matter which kind of image it contains
+            subprocess.check_call(
+                [self._appimage, "--appimage-extract"],
+                cwd=self._tmpdir,
+                stdout=subprocess.DEVNULL,
+            )
+
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        shutil.rmtree(self._tmpdir, ignore_errors=True)
+
+    def get_cold_paths(self) -> List[str]:
+        """
+        :return: paths to evict from the page cache before a cold launch
+        """
+
+        if self._mode == "extracted":
+            return [self.get_appdir()]
+
+        return [self._appimage]
+
+    def get_appdir(self) -> str:
+        return os.path.join(self._tmpdir, "squashfs-root")
+
+    def run(self, timeout: float, extra_env: Dict[str, str] = None) -> StartupRun:
+        env = dict(os.environ)
+
+        if self._mode == "extracted":
+            command = [os.path.join(self.get_appdir(), "AppRun")]
+
+            # the runtime sets these for the AppRun, too
+            env.update(
+                {
+                    "APPDIR": self.get_appdir(),
+                    "APPIMAGE": self._appimage,
+                    "ARGV0": self._appimage,
+                    "OWD": self._tmpdir,
+                }
+            )
+
+        elif self._mode == "extract-and-run":
+            command = [self._appimage, "--appimage-extract-and-run"]
+
+        else:
+            command = [self._appimage]
+
+        if extra_env:
+            env.update(extra_env)
+
+        return run_once(command + self._args, env, self._tmpdir, timeout)
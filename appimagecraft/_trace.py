@@ -0,0 +1,178 @@
+import json
+import os
+import time
+from typing import Dict, List, Tuple
+
+# file in the build directory the generated scripts record the begin and end of build stages in
+# every line has the format "<B|E> <timestamp in microseconds> <stage name>"
+TIMINGS_FILENAME = "timings.log"
+
+# if this environment variable is set, the trace functions also print "<marker> <B|E> <stage name>" lines to stderr,
+# which allows for telling which stage output belongs to while capturing it (see _build_log)
+STAGE_MARKERS_ENV_VAR = "APPIMAGECRAFT_STAGE_MARKERS"
+STAGE_MARKER = "@@appimagecraft-stage@@"
+
+
+def generate_trace_functions() -> List[str]:
+    """
+    Generate shell functions trace_begin <stage> and trace_end <stage> which record timestamps in the timings file.
+    """
+
+    rv = ["# record begin and end of build stages, appimagecraft uses this data to show where the time is spent"]
+
+    for function_name, phase in [("trace_begin", "B"), ("trace_end", "E")]:
+        record = 'echo "{} $(date +%s%6N) $1" >> "$BUILD_DIR"/{}'.format(phase, TIMINGS_FILENAME)
+        marker = '[ -z "${{{}:-}}" ] || echo "{} {} $1" >&2'.format(STAGE_MARKERS_ENV_VAR, STAGE_MARKER, phase)
+
+        rv.append("{}() {{ {}; {}; }}".format(function_name, record, marker))
+
+    rv.append("")
+
+    return rv
+
+
+def record_event(build_dir: str, phase: str, name: str):
+    """
+    Record event in timings file from Python, e.g., for stages run by appimagecraft itself.
+
+    :param phase: B (begin) or E (end)
+    """
+
+    with open(os.path.join(build_dir, TIMINGS_FILENAME), "a") as f:
+        f.write("{} {} {}\n".format(phase, current_timestamp(), name))
+
+
+class Span:
+    def __init__(self, name: str, start: int, depth: int):
+        self.name = name
+        self.start = start
+        self.end = None
+        self.depth = depth
+        # set if the stage has not finished, e.g., because the build failed there
+        self.incomplete = False
+
+    def duration(self) -> float:
+        """
+        :return: duration in seconds
+        """
+
+        return (self.end - self.start) / 1000000
+
+
+def current_timestamp() -> int:
+    """
+    :return: current time in microseconds, like the timestamps in the timings file
+    """
+
+    return int(time.time() * 1000000)
+
+
+def read_spans(path: str, end_timestamp: int = None) -> List[Span]:
+    """
+    Parse timings file into a list of spans, ordered by their start. Stages which have been started but not finished
+    are marked as incomplete.
+
+    :param end_timestamp: timestamp to close unfinished stages with (default: last recorded timestamp)
+    """
+
+    spans = []
+    stack = []
+
+    last_timestamp = None
+
+    with open(path) as f:
+        for line in f:
+            try:
+                phase, timestamp, name = line.rstrip("\n").split(" ", 2)
+                timestamp = int(timestamp)
+            except ValueError:
+                continue
+
+            last_timestamp = timestamp
+
+            if phase == "B":
+                span = Span(name, timestamp, len(stack))
+                spans.append(span)
+                stack.append(span)
+
+            elif phase == "E":
+                # close everything up to the matching span, in case an inner stage didn't record its end
+                while stack:
+                    span = stack.pop()
+                    span.end = timestamp
+
+                    if span.name == name:
+                        break
+
+                    span.incomplete = True
+
+    if end_timestamp is None:
+        end_timestamp = last_timestamp
+
+    for span in stack:
+        span.end = end_timestamp
+        span.incomplete = True
+
+    return spans
+
+
+def write_trace_events(spans: List[Span], path: str, counters: List[Tuple[int, Dict[str, float]]] = None):
+    """
+    Write spans in the Chrome trace event format, which can be loaded into, e.g., Perfetto or chrome://tracing.
+
+    :param counters: timestamp -> values shown as counter tracks along with the spans (e.g., the resource usage)
+    """
+
+    events = []
+
+    for span in spans:
+        events.append(
+            {
+                "name": span.name,
+                "cat": "build",
+                "ph": "X",
+                "ts": span.start,
+                "dur": span.end - span.start,
+                "pid": 1,
+                "tid": 1,
+                "args": {"incomplete": span.incomplete},
+            }
+        )
+
+    for timestamp, values in counters or []:
+        for name, value in values.items():
+            events.append(
+                {"name": name, "cat": "resources", "ph": "C", "ts": timestamp, "pid": 1, "args": {name: value}}
+            )
+
+    with open(path, "w") as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f, indent=4)
+
+
+def format_breakdown(spans: List[Span]) -> List[str]:
+    """
+    Format spans as a plain text table, nested stages are indented.
+    """
+
+    total = sum((s.end - s.start for s in spans if s.depth == 0))
+
+    name_width = max([len(s.name) + 2 * s.depth for s in spans] + [5])
+
+    rv = []
+
+    for span in spans:
+        percentage = 100 * (span.end - span.start) / total if total else 0
+
+        rv.append(
+            "{:<{}}  {:>9.2f} s  {:>5.1f} %{}".format(
+                "  " * span.depth + span.name,
+                name_width,
+                span.duration(),
+                percentage,
+                "  (incomplete)" if span.incomplete else "",
+            )
+        )
+
+    rv.append("{:<{}}  {:>9.2f} s".format("total", name_width, total / 1000000))
+
+    return rv
@@ -1,6 +1,11 @@
+import importlib
 import os.path
+import platform
+import re
+import sys
+import tempfile
 
-from typing import List
+from typing import Dict, List, Union
 
 
 def assert_not_none(data):
@@ -8,10 +13,82 @@ def assert_not_none(data):
         raise ValueError("data must not be None")
 
 
+def make_lazy_getattr(package_name: str, attributes: Dict[str, str]):
+    """
+    Create a module level __getattr__ (see PEP 562) which imports the submodule defining an attribute on first access.
+    This way, importing a package is cheap, and only the code actually needed by a command is loaded.
+
+    :param package_name: name of the package (i.e., __name__)
+    :param attributes: attribute name -> name of the submodule defining it, relative to the package
+    """
+
+    def __getattr__(name: str):
+        try:
+            module_name = attributes[name]
+        except KeyError:
+            raise AttributeError("module {} has no attribute {}".format(package_name, name))
+
+        value = getattr(importlib.import_module(module_name, package_name), name)
+
+        # subsequent lookups don't have to go through this function
+        setattr(sys.modules[package_name], name, value)
+
+        return value
+
+    return __getattr__
+
+
 def get_appdir_path(build_dir: str):
     return os.path.abspath(os.path.join(build_dir, "AppDir"))
 
 
+def make_temporary_build_dir(root_dir: str, builder_name: str):
+    build_dir = tempfile.mkdtemp(prefix=".appimagecraft-build-{}-".format(builder_name), dir=root_dir)
+
+    # ensure correct permissions on build dir
+    os.chmod(build_dir, 0o755)
+
+    return os.path.abspath(build_dir)
+
+
+def get_incremental_build_dir(config_file: str, builder_name: str, arch: str):
+    """
+    Get stable build directory for incremental builds. As there is one directory per config file, builder and
+    architecture, switching between them does not invalidate the others' build trees (nor does it reuse a build tree
+    configured for another architecture).
+
+    :param config_file: path to the config file, the directory is created next to it
+    """
+
+    config_name = os.path.splitext(os.path.basename(config_file))[0]
+
+    return os.path.abspath(
+        os.path.join(
+            os.path.dirname(config_file),
+            ".appimagecraft-incremental-{}-{}-{}".format(config_name, builder_name, arch),
+        )
+    )
+
+
+def get_config_arch(config: dict) -> str:
+    """
+    :return: architecture the AppImage is built for, the current machine's architecture unless configured otherwise
+    """
+
+    return (config.get("appimage", None) or {}).get("arch", None) or platform.machine()
+
+
+def override_arch(config: dict, arch: str) -> dict:
+    """
+    Create copy of config which builds the AppImage for the given architecture.
+    """
+
+    rv = dict(config)
+    rv["appimage"] = dict(config.get("appimage", None) or {}, arch=arch)
+
+    return rv
+
+
 def convert_kv_list_to_dict(data: List[str]) -> dict:
     assert_not_none(data)
 
@@ -29,3 +106,106 @@ def convert_kv_list_to_dict(data: List[str]) -> dict:
         rv[k] = v
 
     return rv
+
+
+def get_cache_root() -> str:
+    """
+    Fetch appimagecraft's shared cache directory. Follows the XDG base directory specification, but can be overridden
+    with $APPIMAGECRAFT_CACHE_DIR.
+
+    Generated scripts evaluate the equivalent CACHE_ROOT_SHELL_EXPR, so both always agree on the location.
+    """
+
+    cache_dir = os.environ.get("APPIMAGECRAFT_CACHE_DIR", None)
+
+    if cache_dir:
+        return os.path.abspath(cache_dir)
+
+    xdg_cache_home = os.environ.get("XDG_CACHE_HOME", None) or os.path.join(os.path.expanduser("~"), ".cache")
+
+    return os.path.abspath(os.path.join(xdg_cache_home, "appimagecraft"))
+
+
+# shell equivalent of get_cache_root(), used in generated scripts
+CACHE_ROOT_SHELL_EXPR = "${APPIMAGECRAFT_CACHE_DIR:-${XDG_CACHE_HOME:-$HOME/.cache}/appimagecraft}"
+
+
+_size_units = {
+    "": 1,
+    "k": 1024,
+    "m": 1024**2,
+    "g": 1024**3,
+    "t": 1024**4,
+}
+
+
+def parse_size(data: Union[str, int]) -> int:
+    """
+    Parse human readable size specification like 512M or 2G (binary units) into a number of bytes.
+
+    :raises ValueError: in case the value cannot be parsed
+    """
+
+    if isinstance(data, int):
+        return data
+
+    match = re.match(r"^\s*(\d+(?:\.\d+)?)\s*([kmgt]?)(?:i?b)?\s*$", str(data), re.IGNORECASE)
+
+    if not match:
+        raise ValueError("Invalid size: {}".format(data))
+
+    return int(float(match.group(1)) * _size_units[match.group(2).lower()])
+
+
+def format_size(size: int) -> str:
+    value = float(size)
+
+    for unit in ["B", "KiB", "MiB", "GiB"]:
+        if abs(value) < 1024:
+            return "{:.1f} {}".format(value, unit) if unit != "B" else "{} B".format(int(value))
+
+        value /= 1024
+
+    return "{:.1f} TiB".format(value)
+
+
+_duration_units = {
+    "": 1,
+    "s": 1,
+    "m": 60,
+    "h": 60 * 60,
+    "d": 24 * 60 * 60,
+    "w": 7 * 24 * 60 * 60,
+}
+
+
+def parse_duration(data: Union[str, int]) -> int:
+    """
+    Parse duration specification like 90s, 12h or 30d into a number of seconds.
+
+    :raises ValueError: in case the value cannot be parsed
+    """
+
+    if isinstance(data, int):
+        return data
+
+    match = re.match(r"^\s*(\d+)\s*([smhdw]?)\s*$", str(data), re.IGNORECASE)
+
+    if not match:
+        raise ValueError("Invalid duration: {}".format(data))
+
+    return int(match.group(1)) * _duration_units[match.group(2).lower()]
+
+
+def print_table(rows: List[tuple]):
+    """
+    Print rows of strings as a table with aligned columns. The first row is treated as the header.
+    """
+
+    widths = [max((len(row[i]) for row in rows)) for i in range(len(rows[0]))]
+
+    for index, row in enumerate(rows):
+        print("  ".join((value.ljust(width) for value, width in zip(row, widths))).rstrip())
+
+        if index == 0:
+            print("  ".join(("-" * width for width in widths)))
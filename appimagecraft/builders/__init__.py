@@ -1,18 +1,32 @@
+from .._util import make_lazy_getattr
 from .base import BuilderBase
-from .cmake import CMakeBuilder
-from .autotools import AutotoolsBuilder
-from .qmake import QMakeBuilder
-from .script import ScriptBuilder
+
+# builders are imported on first use, usually only the one selected by the user is needed
+__getattr__ = make_lazy_getattr(
+    __name__,
+    {
+        "CMakeBuilder": ".cmake",
+        "AutotoolsBuilder": ".autotools",
+        "QMakeBuilder": ".qmake",
+        "ScriptBuilder": ".script",
+    },
+)
 
 
 def get_builder_by_name(name: str, config: dict) -> BuilderBase:
     if name == "cmake":
+        from .cmake import CMakeBuilder
+
         return CMakeBuilder.from_dict(config)
 
     if name == "qmake":
+        from .qmake import QMakeBuilder
+
         return QMakeBuilder.from_dict(config)
 
     if name == "script":
+        from .script import ScriptBuilder
+
         return ScriptBuilder.from_dict(config)
 
     raise ValueError("could not find matching builder for name: {}".format(name))
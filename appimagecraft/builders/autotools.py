@@ -96,25 +96,46 @@ class AutotoolsBuilder(BuilderBase):
                 ]
             )
 
+        compiler_cache = self._get_compiler_cache()
+
+        if compiler_cache is not None:
+            generator.add_lines(compiler_cache.generate_setup_lines())
+            generator.add_lines(compiler_cache.generate_env_wrapper_lines())
+
         if "configure" in self._builder_config:
             generator.add_lines(
-                ["# set up build directory with configure", self._generate_configure_command(project_root_dir), ""]
+                [
+                    "# set up build directory with configure",
+                    "trace_begin configure",
+                    self._generate_configure_command(project_root_dir),
+                    "trace_end configure",
+                    "",
+                ]
             )
         else:
             generator.add_lines(
                 ["# configure: section not found, not generating configure call (this might be intentional)" ""]
             )
 
+        generator.add_lines(self._get_job_policy().generate_lines())
+
         generator.add_lines(
             [
                 "# build project",
-                "make -j $(nproc)",
+                "trace_begin compile",
+                'make "${parallel_args[@]}"',
+                "trace_end compile",
                 "",
                 "# install binaries into AppDir (requires correct CMake install(...) configuration)",
+                "trace_begin install",
                 "make install DESTDIR={}".format(shlex.quote(get_appdir_path(build_dir))),
+                "trace_end install",
             ]
         )
 
+        if compiler_cache is not None:
+            generator.add_lines(compiler_cache.generate_stats_lines())
+
         generator.build_file()
 
         return os.path.basename(script_path)
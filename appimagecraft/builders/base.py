@@ -1,4 +1,8 @@
 import os
+from typing import Optional
+
+from .compiler_cache import CompilerCache
+from .jobs import JobPolicy
 
 
 class BuilderBase:
@@ -20,6 +24,21 @@ class BuilderBase:
 
         return source_dir
 
+    def get_source_dir(self, project_root_dir: str) -> str:
+        """
+        :return: directory the builder builds from, which may be outside the project root directory
+        """
+
+        return self._get_source_dir(project_root_dir)
+
+    # compiler cache (ccache, sccache) configured for this builder (or globally), if any
+    def _get_compiler_cache(self) -> Optional[CompilerCache]:
+        return CompilerCache.from_builder_config(self._builder_config)
+
+    # policy for the number of parallel jobs, configured for this builder (or globally)
+    def _get_job_policy(self) -> JobPolicy:
+        return JobPolicy.from_builder_config(self._builder_config)
+
     @staticmethod
     def from_dict(data: dict):
         raise NotImplementedError
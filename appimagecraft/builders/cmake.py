@@ -11,12 +11,51 @@ from . import BuilderBase
 class CMakeBuilder(BuilderBase):
     _script_filename = "build-cmake.sh"
 
+    # generators we know how to build with
+    # the build and install steps are generator agnostic, but some generators need some special treatment
+    _supported_generators = ["Unix Makefiles", "Ninja", "Ninja Multi-Config"]
+
     def __init__(self, config: dict = None):
         super().__init__(config)
 
         for cmake_arg in self._get_cmake_extra_variables().keys():
             self._validate_cmake_arg_name(cmake_arg)
 
+        generator = self._get_generator()
+
+        if generator is not None and generator not in self._supported_generators:
+            raise ValueError("Unsupported CMake generator: {}".format(generator))
+
+        # fail early on invalid values
+        self._get_job_policy()
+
+        for component in self._get_install_components():
+            if not re.match(r"^[\w.+-]+$", component):
+                raise ValueError("install component in invalid format: {}".format(component))
+
+    # in case no generator is specified, we let CMake decide (respects $CMAKE_GENERATOR, too)
+    def _get_generator(self) -> Union[str, None]:
+        return self._builder_config.get("generator", None)
+
+    def _is_multi_config(self) -> bool:
+        generator = self._get_generator()
+        return generator is not None and "Multi-Config" in generator
+
+    def _get_install_components(self) -> list:
+        components = self._builder_config.get("install_components", None) or []
+
+        if not isinstance(components, list):
+            raise ValueError("install_components: must be list")
+
+        return components
+
+    # multi-config generators ignore CMAKE_BUILD_TYPE, the configuration is selected when building and installing
+    def _generate_config_args(self) -> list:
+        if not self._is_multi_config():
+            return []
+
+        return ["--config", shlex.quote(self._get_cmake_extra_variables()["CMAKE_BUILD_TYPE"])]
+
     def _get_cmake_extra_variables(self) -> dict:
         default_vars = {
             "CMAKE_INSTALL_PREFIX": "/usr",
@@ -25,6 +64,12 @@ class CMakeBuilder(BuilderBase):
             "CMAKE_INSTALL_LIBDIR": "/usr/lib",
         }
 
+        compiler_cache = self._get_compiler_cache()
+
+        if compiler_cache is not None:
+            for lang in ["C", "CXX"]:
+                default_vars["CMAKE_{}_COMPILER_LAUNCHER".format(lang)] = compiler_cache.tool()
+
         data = self._builder_config.get("extra_variables", None) or {}
 
         # allow for KEY=Value scheme for extra_variables
@@ -60,6 +105,11 @@ class CMakeBuilder(BuilderBase):
     def _generate_cmake_command(self, project_root_dir: str):
         args = ["cmake"]
 
+        generator = self._get_generator()
+
+        if generator is not None:
+            args += ["-G", shlex.quote(generator)]
+
         for key, value in self._get_cmake_extra_variables().items():
             self._validate_cmake_arg_name(key)
             escaped_value = shlex.quote(value)
@@ -74,6 +124,115 @@ class CMakeBuilder(BuilderBase):
 
         return " ".join(args)
 
+    def _generate_compiler_cache_setup_lines(self) -> list:
+        compiler_cache = self._get_compiler_cache()
+
+        if compiler_cache is None:
+            return []
+
+        return compiler_cache.generate_setup_lines()
+
+    def _generate_compiler_cache_stats_lines(self) -> list:
+        compiler_cache = self._get_compiler_cache()
+
+        if compiler_cache is None:
+            return []
+
+        return compiler_cache.generate_stats_lines()
+
+    def _generate_compile_lines(self) -> list:
+        # ninja does not support GNU make's jobserver, so we may only join one when building with make
+        generator_name = self._get_generator()
+        allow_jobserver = generator_name is None or "Makefiles" in generator_name
+
+        return self._get_job_policy().generate_lines(allow_jobserver=allow_jobserver) + [
+            "# build project",
+            "trace_begin compile",
+            " ".join(["cmake", "--build", ".", '"${parallel_args[@]}"'] + self._generate_config_args()),
+            "trace_end compile",
+        ]
+
+    def _add_install_lines(self, generator: ProjectAwareBashScriptBuilder, build_dir: str):
+        if not self._builder_config.get("install", True):
+            return
+
+        generator.add_lines(
+            [
+                "",
+                "# install binaries into AppDir (requires correct CMake install(...) configuration)",
+            ]
+        )
+
+        install_command = [
+            "DESTDIR={}".format(shlex.quote(get_appdir_path(build_dir))),
+            "cmake",
+            "--install",
+            ".",
+        ] + self._generate_config_args()
+
+        if self._builder_config.get("strip", False):
+            install_command.append("--strip")
+
+        install_components = self._get_install_components()
+
+        generator.begin_stage("install")
+
+        if install_components:
+            # cmake --install supports only one component per call
+            for component in install_components:
+                generator.add_line(" ".join(install_command + ["--component", shlex.quote(component)]))
+        else:
+            generator.add_line(" ".join(install_command))
+
+        generator.end_stage("install")
+
+    def _add_cpack_lines(self, generator: ProjectAwareBashScriptBuilder):
+        # optional support for CPack
+        # allows projects to also build packages, making use of appimagecraft features like auto-created clean build
+        # directories, Docker container builds, ...
+        cpack_args: dict = self._builder_config.get("cpack", False)
+
+        # caution: must check for non-None value (like False) explicitly, an empty value is allowed and would be
+        # represented as None
+        if cpack_args is False:
+            return
+
+        generator.add_lines(
+            [
+                "",
+                "# build packages with cpack",
+            ]
+        )
+
+        cpack_generators: Union[dict, None] = None
+
+        # cpack needs to know which configuration to package when using multi-config generators
+        cpack_config_args = []
+
+        if self._is_multi_config():
+            cpack_config_args = ["-C", shlex.quote(self._get_cmake_extra_variables()["CMAKE_BUILD_TYPE"])]
+
+        if cpack_args is not None:
+            cpack_generators: dict = cpack_args.get("generators")
+
+        generator.begin_stage("cpack")
+
+        if cpack_generators is not None:
+            if not isinstance(cpack_generators, list):
+                raise ValueError("generators: must be list")
+
+            for gen in cpack_generators:
+                # ensure correct format
+                if not re.match(r"^[A-Z]+$", gen):
+                    raise ValueError("generator in invalid format: {}".format(gen))
+
+                generator.add_line(" ".join(["cpack", "-V"] + cpack_config_args + [shlex.quote(gen)]))
+
+        else:
+            generator.add_line(" ".join(["cpack", "-V"] + cpack_config_args))
+
+        generator.end_stage("cpack")
+
     def generate_build_script(self, project_root_dir: str, build_dir: str) -> str:
         script_path = os.path.join(build_dir, self.__class__._script_filename)
 
@@ -105,6 +264,8 @@ class CMakeBuilder(BuilderBase):
         try_export_env_vars("environment")
         try_export_env_vars("raw_environment", raw=True)
 
+        generator.add_lines(self._generate_compiler_cache_setup_lines())
+
         generator.add_lines(
             [
                 "# make sure we're in the build directory",
@@ -118,66 +279,19 @@ class CMakeBuilder(BuilderBase):
                 "cmake --version",
                 "",
                 "# set up build",
+                "trace_begin configure",
                 self._generate_cmake_command(project_root_dir),
+                "trace_end configure",
                 "",
-                "# build project",
-                # TODO: use cmake --build somehow, also for install call below
-                "# support for the $JOBS environment variable",
-                "# in case $JOBS is not specified, we guess a value",
-                "# we reserve one core outside CI environments",
-                'if [[ -z "$JOBS" ]]; then',
-                '    if [[ -z "$CI" ]]; then',
-                '        JOBS="$(nproc --ignore=1)"',
-                "    else",
-                '        JOBS="$(nproc)"',
-                "    fi",
-                "fi",
-                'make -j "$JOBS"',
             ]
         )
 
-        if self._builder_config.get("install", True):
-            generator.add_lines(
-                [
-                    "",
-                    "# install binaries into AppDir (requires correct CMake install(...) configuration)",
-                    "make install DESTDIR={}".format(shlex.quote(get_appdir_path(build_dir))),
-                ]
-            )
-
-        # optional support for CPack
-        # allows projects to also build packages, making use of appimagecraft features like auto-created clean build
-        # directories, Docker container builds, ...
-        cpack_args: dict = self._builder_config.get("cpack", False)
-
-        # caution: must check for non-None value (like False) explicitly, an empty value is allowed and would be
-        # represented as None
-        if cpack_args is not False:
-            generator.add_lines(
-                [
-                    "",
-                    "# build packages with cpack",
-                ]
-            )
-
-            cpack_generators: Union[dict, None] = None
+        generator.add_lines(self._generate_compile_lines())
 
-            if cpack_args is not None:
-                cpack_generators: dict = cpack_args.get("generators")
+        self._add_install_lines(generator, build_dir)
+        self._add_cpack_lines(generator)
 
-            if cpack_generators is not None:
-                if not isinstance(cpack_generators, list):
-                    raise ValueError("generators: must be list")
-
-                for gen in cpack_generators:
-                    # ensure correct format
-                    if not re.match(r"^[A-Z]+$", gen):
-                        raise ValueError("generator in invalid format: {}".format(gen))
-
-                    generator.add_line("cpack -V {}".format(shlex.quote(gen)))
-
-            else:
-                generator.add_line("cpack -V")
+        generator.add_lines(self._generate_compiler_cache_stats_lines())
 
         generator.build_file()
 
@@ -0,0 +1,154 @@
+import shlex
+from typing import List, Union
+
+from .._util import CACHE_ROOT_SHELL_EXPR, parse_size
+
+
+class CompilerCache:
+    """
+    Compiler launcher configuration (ccache or sccache) shared by all builders.
+
+    Can be configured with just the name of the tool, or a dict which allows for specifying a custom cache dir and a
+    maximum size. By default, the cache is stored in appimagecraft's cache root, as the build dir is thrown away after
+    every build.
+    """
+
+    _supported_tools = ["ccache", "sccache"]
+
+    # environment variables used by the tools to configure the cache directory and size
+    _dir_env_vars = {
+        "ccache": "CCACHE_DIR",
+        "sccache": "SCCACHE_DIR",
+    }
+    _max_size_env_vars = {
+        "ccache": "CCACHE_MAXSIZE",
+        "sccache": "SCCACHE_CACHE_SIZE",
+    }
+
+    # arguments which print the statistics as lines ending in "<whitespace><counter>"
+    _stats_args = {
+        "ccache": "--print-stats",
+        "sccache": "--show-stats",
+    }
+
+    # prints the counters which changed compared to the snapshot passed in the variable before (timestamps are skipped)
+    _stats_diff_awk_program = " ".join(
+        [
+            "function parse(line) {",
+            "if (!match(line, /[[:space:]][0-9]+[[:space:]]*$/)) return 0;",
+            'key = substr(line, 1, RSTART - 1); sub(/[[:space:]]+$/, "", key);',
+            "value = substr(line, RSTART + 1) + 0;",
+            'return key != "" && key !~ /timestamp/;',
+            "}",
+            'BEGIN { n = split(before, lines, "\\n"); for (i = 1; i <= n; i++) if (parse(lines[i])) old[key] = value }',
+            'parse($0) && value != old[key] { printf "    %s: %d\\n", key, value - old[key] }',
+        ]
+    )
+
+    def __init__(self, config: Union[str, dict]):
+        if isinstance(config, str):
+            config = {"tool": config}
+
+        if not isinstance(config, dict):
+            raise ValueError("compiler_cache: must be either the name of a tool or a dict")
+
+        invalid_keys = set(config.keys()) - {"tool", "dir", "max_size"}
+        if invalid_keys:
+            raise ValueError("Invalid key in compiler_cache: {}".format(list(invalid_keys)[0]))
+
+        self._tool = config.get("tool", None) or "ccache"
+
+        if self._tool not in self._supported_tools:
+            raise ValueError("Unsupported compiler cache: {}".format(self._tool))
+
+        self._dir = config.get("dir", None)
+
+        self._max_size = config.get("max_size", None)
+
+        if self._max_size is not None:
+            # fail early on invalid values
+            parse_size(self._max_size)
+
+    @classmethod
+    def from_builder_config(cls, builder_config: dict):
+        """
+        Create compiler cache for builder, if configured.
+
+        :return: compiler cache, or None if the builder shall not use one
+        """
+
+        config = builder_config.get("compiler_cache", None)
+
+        # caution: users may explicitly disable the compiler cache for a single builder with compiler_cache: false
+        if config is None or config is False:
+            return None
+
+        return cls(config)
+
+    def tool(self) -> str:
+        return self._tool
+
+    def generate_setup_lines(self) -> List[str]:
+        """
+        Generate lines which make sure the tool is available and configure the cache directory. If the user has
+        configured the cache dir in the environment already, that value is respected.
+        """
+
+        dir_env_var = self._dir_env_vars[self._tool]
+
+        if self._dir is not None:
+            cache_dir = shlex.quote(self._dir)
+        else:
+            cache_dir = '"${{{}:-{}/{}}}"'.format(dir_env_var, CACHE_ROOT_SHELL_EXPR, self._tool)
+
+        rv = [
+            "# use {} as compiler cache".format(self._tool),
+            "if ! command -v {} &>/dev/null; then".format(self._tool),
+            '    echo "Error: compiler cache {} is not available" >&2'.format(self._tool),
+            "    exit 1",
+            "fi",
+            "{}={}".format(dir_env_var, cache_dir),
+            "export {}".format(dir_env_var),
+        ]
+
+        if self._max_size is not None:
+            max_size_env_var = self._max_size_env_vars[self._tool]
+            rv += [
+                "{}={}".format(max_size_env_var, shlex.quote(str(self._max_size))),
+                "export {}".format(max_size_env_var),
+            ]
+
+        rv += [
+            "# the cache may be shared with concurrent builds, so instead of resetting the statistics, a snapshot is",
+            "# taken and only the difference is shown afterwards",
+            'COMPILER_CACHE_STATS_BEFORE="$({} {} 2>/dev/null || true)"'.format(
+                self._tool, self._stats_args[self._tool]
+            ),
+            "",
+        ]
+
+        return rv
+
+    def generate_env_wrapper_lines(self) -> List[str]:
+        """
+        Generate lines which wrap the compilers configured in $CC and $CXX (or the default ones) with the launcher. Used
+        for build systems which don't have a dedicated launcher setting.
+        """
+
+        return [
+            "# wrap compilers with {}".format(self._tool),
+            'CC="{} ${{CC:-cc}}"'.format(self._tool),
+            'CXX="{} ${{CXX:-c++}}"'.format(self._tool),
+            "export CC CXX",
+            "",
+        ]
+
+    def generate_stats_lines(self) -> List[str]:
+        return [
+            "",
+            "# print the compiler cache statistics of this build",
+            'echo "Compiler cache statistics ({}):"'.format(self._tool),
+            '{} {} 2>/dev/null | awk -v before="$COMPILER_CACHE_STATS_BEFORE" {} || true'.format(
+                self._tool, self._stats_args[self._tool], shlex.quote(self._stats_diff_awk_program)
+            ),
+        ]
@@ -0,0 +1,187 @@
+from typing import List, Union
+
+from .._util import format_size, parse_size
+
+# upper limit for the number of jobs, set for builds which share the machine with others (e.g., by the matrix command)
+MAX_JOBS_ENV_VAR = "APPIMAGECRAFT_MAX_JOBS"
+
+
+class JobPolicy:
+    """
+    Policy for the number of parallel jobs, shared by all builders.
+
+    The policy is evaluated at build time by the generated scripts, which allows for taking the actual number of cores
+    and the available memory into account. It can be configured with a fixed number of jobs, or a dict:
+
+    - per_core: number of jobs per core (e.g., 0.5), by default one core is reserved outside CI environments
+    - memory_per_job: amount of available memory (see MemAvailable in /proc/meminfo) each job needs, e.g., 2G
+    - max: upper limit
+
+    The result is capped by $APPIMAGECRAFT_MAX_JOBS, if set. In any case, $JOBS takes precedence if set.
+    """
+
+    def __init__(self, config: Union[int, dict, None] = None):
+        if config is None:
+            config = {}
+
+        if isinstance(config, int) and not isinstance(config, bool):
+            config = {"count": config}
+
+        if not isinstance(config, dict):
+            raise ValueError("jobs: must be either a number or a dict")
+
+        invalid_keys = set(config.keys()) - {"count", "per_core", "memory_per_job", "max"}
+        if invalid_keys:
+            raise ValueError("Invalid key in jobs: {}".format(list(invalid_keys)[0]))
+
+        self._count = self._parse_positive_int(config, "count")
+        self._max = self._parse_positive_int(config, "max")
+
+        self._per_core = config.get("per_core", None)
+
+        if self._per_core is not None:
+            if not isinstance(self._per_core, (int, float)) or self._per_core <= 0:
+                raise ValueError("jobs: per_core must be a positive number")
+
+        self._memory_per_job = config.get("memory_per_job", None)
+
+        if self._memory_per_job is not None:
+            self._memory_per_job = parse_size(self._memory_per_job)
+
+            if self._memory_per_job <= 0:
+                raise ValueError("jobs: memory_per_job must be positive")
+
+    @staticmethod
+    def _parse_positive_int(config: dict, key: str):
+        value = config.get(key, None)
+
+        if value is None:
+            return None
+
+        if not isinstance(value, int) or isinstance(value, bool) or value < 1:
+            raise ValueError("jobs: {} must be a positive integer".format(key))
+
+        return value
+
+    @classmethod
+    def from_builder_config(cls, builder_config: dict):
+        return cls(builder_config.get("jobs", None))
+
+    def describe(self) -> str:
+        if self._count is not None:
+            return "{} jobs".format(self._count)
+
+        if self._per_core is not None:
+            parts = ["{} job(s) per core".format(self._per_core)]
+        else:
+            parts = ["one job per core (reserving one core outside CI environments)"]
+
+        if self._memory_per_job is not None:
+            parts.append("{} of available memory per job".format(format_size(self._memory_per_job)))
+
+        if self._max is not None:
+            parts.append("at most {} jobs".format(self._max))
+
+        return ", ".join(parts)
+
+    def generate_lines(self, allow_jobserver: bool = True) -> List[str]:
+        """
+        Generate lines which set $JOBS according to the policy, as well as an array $parallel_args which can be passed
+        to make and cmake --build.
+
+        :param allow_jobserver: whether the build tool joins a GNU make jobserver inherited through $MAKEFLAGS (make
+            does, ninja doesn't)
+        """
+
+        rv = [
+            "# determine number of parallel jobs",
+            "# policy: {}".format(self.describe()),
+            "# $JOBS takes precedence if set",
+        ]
+
+        if allow_jobserver:
+            rv.append('jobserver=""')
+
+        rv.append('if [[ -z "$JOBS" ]]; then')
+
+        if allow_jobserver:
+            rv += [
+                "    # when running as part of a larger make build, join its jobserver instead of spawning more jobs",
+                '    if [[ "$MAKEFLAGS" =~ --jobserver-(auth|fds)= ]]; then',
+                "        jobserver=1",
+                "    fi",
+                "",
+            ]
+
+        if self._count is not None:
+            rv.append("    JOBS={}".format(self._count))
+
+        else:
+            if self._per_core is not None:
+                # bash can't handle floats, therefore we calculate with percent
+                rv.append('    JOBS="$(( $(nproc) * {} / 100 ))"'.format(int(round(self._per_core * 100))))
+            else:
+                rv += [
+                    '    if [[ -z "$CI" ]]; then',
+                    '        JOBS="$(nproc --ignore=1)"',
+                    "    else",
+                    '        JOBS="$(nproc)"',
+                    "    fi",
+                ]
+
+            if self._memory_per_job is not None:
+                rv += [
+                    "    # make sure every job has {} of memory available".format(format_size(self._memory_per_job)),
+                    "    memory_jobs=\"$(( $(awk '/^MemAvailable:/ {{ print $2 }}' /proc/meminfo) * 1024 / "
+                    '{} ))"'.format(self._memory_per_job),
+                    '    if [[ "$memory_jobs" -lt "$JOBS" ]]; then',
+                    '        JOBS="$memory_jobs"',
+                    "    fi",
+                ]
+
+            if self._max is not None:
+                rv += [
+                    '    if [[ "$JOBS" -gt {0} ]]; then'.format(self._max),
+                    "        JOBS={}".format(self._max),
+                    "    fi",
+                ]
+
+            rv += [
+                '    if [[ "$JOBS" -lt 1 ]]; then',
+                "        JOBS=1",
+                "    fi",
+            ]
+
+        rv += [
+            "",
+            "    # builds sharing the machine with others get only their share of the cores",
+            '    if [[ -n "${{{0}:-}}" ]] && [[ "$JOBS" -gt "${0}" ]]; then'.format(MAX_JOBS_ENV_VAR),
+            '        JOBS="${}"'.format(MAX_JOBS_ENV_VAR),
+            "    fi",
+            "fi",
+            "export JOBS",
+            "",
+        ]
+
+        # not every script uses $parallel_args (e.g., the script builder just provides it to the user's commands)
+        if allow_jobserver:
+            rv += [
+                "# shellcheck disable=SC2034",
+                'if [[ "$jobserver" != "" ]]; then',
+                '    echo "Joining jobserver of parent make process"',
+                "    parallel_args=()",
+                "else",
+                '    echo "Building with $JOBS parallel jobs"',
+                '    parallel_args=(-j "$JOBS")',
+                "fi",
+                "",
+            ]
+        else:
+            rv += [
+                'echo "Building with $JOBS parallel jobs"',
+                "# shellcheck disable=SC2034",
+                'parallel_args=(-j "$JOBS")',
+                "",
+            ]
+
+        return rv
@@ -26,6 +26,13 @@ class QMakeBuilder(BuilderBase):
 
         # TODO: support for extra variables
 
+        compiler_cache = self._get_compiler_cache()
+
+        if compiler_cache is not None:
+            # command line assignments are evaluated after the mkspec has been loaded, so we can prefix its compilers
+            for var in ["QMAKE_CC", "QMAKE_CXX"]:
+                args.append(shlex.quote("{0}={1} $${0}".format(var, compiler_cache.tool())))
+
         source_dir = self._get_source_dir(project_root_dir)
 
         project_file: str = self._builder_config.get("project_file")
@@ -79,6 +86,11 @@ class QMakeBuilder(BuilderBase):
         try_export_env_vars("environment")
         try_export_env_vars("raw_environment", raw=True)
 
+        compiler_cache = self._get_compiler_cache()
+
+        if compiler_cache is not None:
+            generator.add_lines(compiler_cache.generate_setup_lines())
+
         generator.add_lines(
             [
                 "# make sure we're in the build directory",
@@ -92,16 +104,32 @@ class QMakeBuilder(BuilderBase):
                 "qmake --version",
                 "",
                 "# set up build",
+                "trace_begin configure",
                 self._qenerate_qmake_command(project_root_dir),
+                "trace_end configure",
                 "",
+            ]
+        )
+
+        generator.add_lines(self._get_job_policy().generate_lines())
+
+        generator.add_lines(
+            [
                 "# build project",
-                "make -j $(nproc)",
+                "trace_begin compile",
+                'make "${parallel_args[@]}"',
+                "trace_end compile",
                 "",
                 "# install binaries into AppDir (requires correct qmake install(...) configuration)",
+                "trace_begin install",
                 "make install INSTALL_ROOT={}".format(shlex.quote(get_appdir_path(build_dir))),
+                "trace_end install",
             ]
         )
 
+        if compiler_cache is not None:
+            generator.add_lines(compiler_cache.generate_stats_lines())
+
         generator.build_file()
 
         return os.path.basename(script_path)
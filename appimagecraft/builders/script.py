@@ -22,7 +22,24 @@ class ScriptBuilder(BuilderBase):
         script_path = os.path.join(build_dir, self.__class__._script_filename)
 
         generator = ProjectAwareBashScriptBuilder(script_path, project_root_dir, build_dir)
+
+        compiler_cache = self._get_compiler_cache()
+
+        if compiler_cache is not None:
+            generator.add_lines(compiler_cache.generate_setup_lines())
+            generator.add_lines(compiler_cache.generate_env_wrapper_lines())
+
+        # custom scripts may use $JOBS and $parallel_args
+        generator.add_lines(self._get_job_policy().generate_lines())
+
+        # custom scripts may record their own stages with trace_begin <name> and trace_end <name>
+        generator.begin_stage("commands")
         generator.add_lines(self._builder_config["commands"])
+        generator.end_stage("commands")
+
+        if compiler_cache is not None:
+            generator.add_lines(compiler_cache.generate_stats_lines())
+
         generator.build_file()
 
         return os.path.basename(script_path)
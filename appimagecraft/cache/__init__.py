@@ -0,0 +1,35 @@
+from .._logging import get_logger
+from .appdir import AppDirCache
+from .appimages import AppImageCache
+from .base import CacheBase, CacheEntry
+from .shellcheck import ShellCheckResultCache
+from .tools import ToolCache
+
+
+def get_all_caches() -> list:
+    return [ToolCache(), ShellCheckResultCache(), AppDirCache(), AppImageCache()]
+
+
+def evict_all_caches():
+    """
+    Evict old entries from all caches with their default limits. Failures are logged, but don't raise an exception, as
+    they should never break a build.
+    """
+
+    for cache in get_all_caches():
+        try:
+            cache.evict()
+        except OSError as e:
+            get_logger("cache").warning("Failed to evict old entries from {} cache: {}".format(cache.name, e))
+
+
+__all__ = (
+    "AppDirCache",
+    "AppImageCache",
+    "CacheBase",
+    "CacheEntry",
+    "ShellCheckResultCache",
+    "ToolCache",
+    "get_all_caches",
+    "evict_all_caches",
+)
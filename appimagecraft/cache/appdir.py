@@ -0,0 +1,174 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+from typing import Dict, List, Union
+
+from .base import CacheBase, CacheEntry
+
+
+class AppDirCache(CacheBase):
+    """
+    Content-addressed cache for AppDirs produced by the builders, so that the builder stage can be skipped when the
+    sources, the generated scripts and the relevant environment are unchanged.
+
+    Every entry is a directory named after the key, which contains the AppDir and an info.json file recording its size
+    and a description. The info file's mtime is bumped on every use for LRU eviction.
+
+    The build scripts copy the AppDir into a staging directory right after the builder stage (see
+    create_staging_dir()), as the following stages (e.g., linuxdeploy) modify the AppDir. Once the build has succeeded,
+    the staging directory is committed under the key.
+    """
+
+    name = "appdirs"
+
+    _default_max_size = "10G"
+    _default_max_age = "14d"
+
+    _max_size_env_var = "APPIMAGECRAFT_APPDIR_CACHE_MAX_SIZE"
+    _max_age_env_var = "APPIMAGECRAFT_APPDIR_CACHE_MAX_AGE"
+
+    # environment variables which commonly affect the result of a build
+    relevant_env_vars = [
+        "PATH",
+        "CC",
+        "CXX",
+        "CFLAGS",
+        "CXXFLAGS",
+        "CPPFLAGS",
+        "LDFLAGS",
+        "PKG_CONFIG_PATH",
+        "CMAKE_PREFIX_PATH",
+        "QTDIR",
+        "ARCH",
+    ]
+
+    _info_filename = "info.json"
+
+    # staging directories of builds which didn't finish are removed after this time
+    _staging_max_age = 24 * 60 * 60
+
+    @staticmethod
+    def make_key(source_tree_hash: str, scripts: Dict[str, str], env: Dict[str, str]) -> str:
+        """
+        :param scripts: filename -> contents of the scripts run up to and including the builder stage
+        :param env: relevant environment variables
+        """
+
+        data = {
+            "source_tree": source_tree_hash,
+            "scripts": scripts,
+            "env": env,
+        }
+
+        return hashlib.sha256(json.dumps(data, sort_keys=True).encode()).hexdigest()
+
+    def lookup(self, key: str) -> Union[str, None]:
+        """
+        Find cached AppDir. Marks the entry as recently used.
+
+        :return: path to cached AppDir, or None if there is no entry for the key
+        """
+
+        entry_dir = os.path.join(self._path, key)
+
+        try:
+            os.utime(os.path.join(entry_dir, self._info_filename))
+        except FileNotFoundError:
+            return None
+
+        return os.path.join(entry_dir, "AppDir")
+
+    def create_staging_dir(self) -> str:
+        """
+        Create staging directory the AppDir is copied into by the build scripts (as <staging dir>/AppDir).
+        """
+
+        os.makedirs(self._path, exist_ok=True)
+
+        return tempfile.mkdtemp(prefix=".staging-", dir=self._path)
+
+    def discard(self, staging_dir: str):
+        shutil.rmtree(staging_dir, ignore_errors=True)
+
+    def commit(self, key: str, staging_dir: str, description: str):
+        """
+        Add AppDir in staging directory to the cache.
+        """
+
+        size = 0
+
+        for dirpath, dirnames, filenames in os.walk(os.path.join(staging_dir, "AppDir")):
+            for filename in filenames:
+                size += os.lstat(os.path.join(dirpath, filename)).st_blocks * 512
+
+        with open(os.path.join(staging_dir, self._info_filename), "w") as f:
+            json.dump({"description": description, "size": size, "created": int(time.time())}, f)
+
+        try:
+            os.rename(staging_dir, os.path.join(self._path, key))
+        except OSError:
+            # another build has added the same AppDir in the meantime
+            self.discard(staging_dir)
+
+    def entries(self) -> List[CacheEntry]:
+        rv = []
+
+        try:
+            filenames = os.listdir(self._path)
+        except FileNotFoundError:
+            return rv
+
+        for filename in filenames:
+            # skip staging directories
+            if filename.startswith("."):
+                continue
+
+            info_path = os.path.join(self._path, filename, self._info_filename)
+
+            try:
+                with open(info_path) as f:
+                    info = json.load(f)
+
+                last_used = os.path.getmtime(info_path)
+                size = int(info["size"])
+                description = "{} ({})".format(info["description"], filename[:12])
+
+            except (OSError, ValueError, KeyError, TypeError):
+                continue
+
+            rv.append(CacheEntry(filename, os.path.join(self._path, filename), size, last_used, description))
+
+        return rv
+
+    def remove_entry(self, entry: CacheEntry):
+        # the entry disappears at once, even if removing a large AppDir takes a while
+        removing_path = os.path.join(self._path, ".removing-{}".format(entry.key))
+
+        try:
+            os.rename(entry.path, removing_path)
+        except FileNotFoundError:
+            return
+
+        shutil.rmtree(removing_path, ignore_errors=True)
+
+    def _collect_garbage(self):
+        try:
+            filenames = os.listdir(self._path)
+        except FileNotFoundError:
+            return
+
+        for filename in filenames:
+            path = os.path.join(self._path, filename)
+
+            if filename.startswith(".staging-") and time.time() - os.path.getmtime(path) < self._staging_max_age:
+                continue
+
+            # entries without info file are leftovers of interrupted removals
+            if not filename.startswith(".") and os.path.exists(os.path.join(path, self._info_filename)):
+                continue
+
+            self._logger.debug("Removing unreferenced directory {}".format(filename))
+            shutil.rmtree(path, ignore_errors=True)
@@ -0,0 +1,189 @@
+import os
+import shutil
+import time
+from typing import List
+
+from .._util import CACHE_ROOT_SHELL_EXPR
+from .base import CacheBase, CacheEntry
+
+
+class AppImageCache(CacheBase):
+    """
+    Cache for the AppImages built by linuxdeploy, so packaging can be skipped if the AppDir and the packaging inputs
+    (linuxdeploy and its plugins, the command line, relevant environment variables and the system's libraries) are
+    unchanged.
+
+    Every entry is a directory named after the key, which contains the built files in files/ and an info file with
+    their size and a description. The info file's mtime is bumped on every use for LRU eviction. Like the tool cache,
+    the cache is implemented in shell in the generated scripts (see generate_cache_functions()), so builds can use the
+    cache even when the scripts are called without appimagecraft.
+    """
+
+    name = "appimages"
+
+    _default_max_size = "5G"
+    _default_max_age = "14d"
+
+    _max_size_env_var = "APPIMAGECRAFT_APPIMAGE_CACHE_MAX_SIZE"
+    _max_age_env_var = "APPIMAGECRAFT_APPIMAGE_CACHE_MAX_AGE"
+
+    # overrides the appimage.cache setting from the config when the scripts are run (1 or 0)
+    enable_env_var = "APPIMAGECRAFT_APPIMAGE_CACHE"
+
+    # staging directories of builds which didn't finish are removed after this time
+    _staging_max_age = 24 * 60 * 60
+
+    def entries(self) -> List[CacheEntry]:
+        rv = []
+
+        try:
+            filenames = os.listdir(self._path)
+        except FileNotFoundError:
+            return rv
+
+        for filename in filenames:
+            # skip staging directories
+            if filename.startswith("."):
+                continue
+
+            info_path = os.path.join(self._path, filename, "info")
+
+            try:
+                with open(info_path) as f:
+                    size, description = f.read().strip().split(" ", 1)
+
+                size = int(size)
+                last_used = os.path.getmtime(info_path)
+
+            except (OSError, ValueError):
+                continue
+
+            rv.append(
+                CacheEntry(
+                    filename,
+                    os.path.join(self._path, filename),
+                    size,
+                    last_used,
+                    description="{} ({})".format(description, filename[:12]),
+                )
+            )
+
+        return rv
+
+    def remove_entry(self, entry: CacheEntry):
+        removing_path = os.path.join(self._path, ".removing-{}".format(entry.key))
+
+        try:
+            os.rename(entry.path, removing_path)
+        except FileNotFoundError:
+            return
+
+        shutil.rmtree(removing_path, ignore_errors=True)
+
+    def _collect_garbage(self):
+        try:
+            filenames = os.listdir(self._path)
+        except FileNotFoundError:
+            return
+
+        for filename in filenames:
+            path = os.path.join(self._path, filename)
+
+            if not filename.startswith("."):
+                continue
+
+            if filename.startswith(".staging-") and time.time() - os.path.getmtime(path) < self._staging_max_age:
+                continue
+
+            self._logger.debug("Removing unreferenced directory {}".format(filename))
+            shutil.rmtree(path, ignore_errors=True)
+
+    @staticmethod
+    def generate_cache_functions() -> List[str]:
+        """
+        Generate shell functions:
+
+        - appimage_cache_key <AppDir> <env var names> <linuxdeploy command...>: print key for the AppDir's contents,
+          the tools in ./downloads, the command and the files passed to it, the values of the given environment
+          variables (separated by spaces) and the system's libraries, with the paths of the build directory and the
+          project root directory replaced by placeholders, as the build directory's name is random
+        - appimage_cache_restore <key>: copy cached files into the current directory, fails if there is no entry
+        - appimage_cache_store <key> <description>: add the AppImages in the current directory to the cache
+
+        Files are reflinked where possible, and copied otherwise. Hardlinks would allow for modifying the cached files
+        through the artifacts, e.g., when signing them.
+        """
+
+        return [
+            "# reuse AppImages built from the same AppDir and packaging inputs, see appimagecraft's AppImage cache",
+            'appimage_cache_dir="{}/appimages"'.format(CACHE_ROOT_SHELL_EXPR),
+            "",
+            "# replace the build directory's and project root directory's paths (in this order, the build directory",
+            "# usually is inside the project root directory) with placeholders",
+            "appimage_cache_normalize_paths() {",
+            "    awk '",
+            "        function replace(s, old, new,    i, rv) {",
+            '            if (old == "") return s',
+            '            rv = ""',
+            "            while ((i = index(s, old)) > 0) {",
+            "                rv = rv substr(s, 1, i - 1) new",
+            "                s = substr(s, i + length(old))",
+            "            }",
+            "            return rv s",
+            "        }",
+            '        { print replace(replace($0, ENVIRON["BUILD_DIR"], "$BUILD_DIR"), ENVIRON["PROJECT_ROOT"], '
+            '"$PROJECT_ROOT") }',
+            "    '",
+            "}",
+            "",
+            "appimage_cache_key() {",
+            '    local appdir="$1"',
+            '    local env_vars="$2"',
+            "    shift 2",
+            "    local name arg path",
+            "",
+            "    {",
+            "        # type, permissions, path and symlink target of every entry, then the contents of all files",
+            "        (cd \"$appdir\" && find . -mindepth 1 -printf '%y %m %p %l\\n' | LC_ALL=C sort)",
+            '        (cd "$appdir" && find . -type f -print0 | LC_ALL=C sort -z | xargs -0 -r sha256sum)',
+            "        # linuxdeploy and its plugins",
+            "        (cd downloads && find . -type f -print0 | LC_ALL=C sort -z | xargs -0 -r sha256sum)",
+            "        # linuxdeploy bundles libraries from the system, ldconfig updates its cache when they change",
+            "        if [ -f /etc/ld.so.cache ]; then sha256sum /etc/ld.so.cache; fi",
+            "        # files like icons or desktop files can be passed as -i <path> or --icon-file=<path>",
+            '        for arg in "$@"; do',
+            '            echo "arg $arg"',
+            '            for path in "$arg" "${arg#*=}"; do',
+            '                if [ -f "$path" ]; then sha256sum "$path"; fi',
+            "            done",
+            "        done",
+            "        for name in $env_vars; do",
+            '            echo "$name=${!name:-}"',
+            "        done",
+            '    } | appimage_cache_normalize_paths | sha256sum | cut -d" " -f1',
+            "}",
+            "",
+            "appimage_cache_restore() {",
+            '    local entry="$appimage_cache_dir/$1"',
+            '    [[ -f "$entry/info" ]] || return 1',
+            "    # mark entry as recently used",
+            '    touch "$entry/info"',
+            '    cp -a --reflink=auto "$entry"/files/. .',
+            "}",
+            "",
+            "appimage_cache_store() {",
+            '    local entry="$appimage_cache_dir/$1"',
+            '    local description="$2"',
+            "    local tmpdir",
+            "",
+            '    mkdir -p "$appimage_cache_dir"',
+            '    tmpdir="$(mktemp -d "$appimage_cache_dir"/.staging-XXXXXX)"',
+            '    mkdir "$tmpdir"/files',
+            "    find . -path ./downloads -prune -o -iname '*.AppImage*' -type f "
+            "-exec cp -a --reflink=auto '{}' \"$tmpdir\"/files/ ';'",
+            '    echo "$(du -sb "$tmpdir"/files | cut -f1) $description" > "$tmpdir"/info',
+            "    # another build might have added the same entry in the meantime",
+            '    mv -T "$tmpdir" "$entry" 2>/dev/null || rm -rf "$tmpdir"',
+            "}",
+            "",
+        ]
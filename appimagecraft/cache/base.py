@@ -0,0 +1,115 @@
+import os
+import shutil
+import time
+from typing import List
+
+from .._logging import get_logger
+from .._util import get_cache_root, parse_duration, parse_size
+
+
+class CacheEntry:
+    def __init__(self, key: str, path: str, size: int, last_used: float, description: str = None):
+        self.key = key
+        self.path = path
+        self.size = size
+        self.last_used = last_used
+        self.description = description if description is not None else key
+
+    def age(self) -> float:
+        return time.time() - self.last_used
+
+
+class CacheBase:
+    """
+    Base class for appimagecraft's persistent caches. Every cache lives in its own subdirectory of the shared cache
+    root (see get_cache_root()), and provides a list of entries which can be evicted in LRU order.
+
+    Subclasses must implement entries() and remove_entry(). Defaults for eviction can be overridden per cache with the
+    environment variables named in _max_size_env_var and _max_age_env_var.
+    """
+
+    # name of the subdirectory in the cache root, also used in log messages and the cache command
+    name: str = None
+
+    _default_max_size = "1G"
+    _default_max_age = "30d"
+
+    _max_size_env_var: str = None
+    _max_age_env_var: str = None
+
+    def __init__(self, root: str = None):
+        if self.name is None:
+            raise NotImplementedError("cache must define a name")
+
+        if root is None:
+            root = get_cache_root()
+
+        self._path = os.path.join(root, self.name)
+
+        self._logger = get_logger("cache.{}".format(self.name))
+
+    def get_path(self) -> str:
+        return self._path
+
+    def entries(self) -> List[CacheEntry]:
+        raise NotImplementedError
+
+    def remove_entry(self, entry: CacheEntry):
+        raise NotImplementedError
+
+    def _collect_garbage(self):
+        """
+        Hook for subclasses to remove data no longer referenced by any entry after eviction.
+        """
+
+        pass
+
+    def total_size(self) -> int:
+        return sum((e.size for e in self.entries()))
+
+    def default_max_size(self) -> int:
+        return parse_size(os.environ.get(self._max_size_env_var or "", None) or self._default_max_size)
+
+    def default_max_age(self) -> int:
+        return parse_duration(os.environ.get(self._max_age_env_var or "", None) or self._default_max_age)
+
+    def evict(self, max_size: int = None, max_age: int = None) -> List[CacheEntry]:
+        """
+        Remove entries which have not been used for longer than max_age seconds, then remove the least recently used
+        entries until the cache is smaller than max_size bytes.
+
+        :return: evicted entries
+        """
+
+        if max_size is None:
+            max_size = self.default_max_size()
+
+        if max_age is None:
+            max_age = self.default_max_age()
+
+        if not os.path.isdir(self._path):
+            return []
+
+        # least recently used entries first
+        entries = sorted(self.entries(), key=lambda e: e.last_used)
+        total_size = sum((e.size for e in entries))
+
+        evicted = []
+
+        for entry in entries:
+            if entry.age() <= max_age and total_size <= max_size:
+                break
+
+            self._logger.debug("Evicting cache entry {}".format(entry.description))
+
+            self.remove_entry(entry)
+            total_size -= entry.size
+            evicted.append(entry)
+
+        self._collect_garbage()
+
+        return evicted
+
+    def clear(self):
+        if os.path.isdir(self._path):
+            shutil.rmtree(self._path)
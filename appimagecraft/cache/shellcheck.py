@@ -0,0 +1,92 @@
+import hashlib
+import os
+from typing import List
+
+from .base import CacheBase, CacheEntry
+
+
+class ShellCheckResultCache(CacheBase):
+    """
+    Remembers which scripts have passed validation with shellcheck, so that unchanged scripts don't have to be checked
+    again.
+
+    Every entry is a small file named after the hash of the shellcheck version, its options and the script's content.
+    It contains the script's filename for informational purposes only. Failed validations are never cached, so their
+    issues are shown again on the next run.
+    """
+
+    name = "shellcheck"
+
+    _default_max_size = "10M"
+    _default_max_age = "30d"
+
+    _max_size_env_var = "APPIMAGECRAFT_SHELLCHECK_CACHE_MAX_SIZE"
+    _max_age_env_var = "APPIMAGECRAFT_SHELLCHECK_CACHE_MAX_AGE"
+
+    @staticmethod
+    def make_key(content: bytes, shellcheck_version: str, shellcheck_args: List[str]) -> str:
+        hasher = hashlib.sha256()
+
+        hasher.update(shellcheck_version.encode())
+        hasher.update(b"\0")
+        hasher.update(" ".join(shellcheck_args).encode())
+        hasher.update(b"\0")
+        hasher.update(content)
+
+        return hasher.hexdigest()
+
+    def contains(self, key: str) -> bool:
+        """
+        Check whether a script has passed validation before. Marks the entry as recently used.
+        """
+
+        try:
+            os.utime(os.path.join(self._path, key))
+        except FileNotFoundError:
+            return False
+
+        return True
+
+    def add(self, key: str, filename: str):
+        os.makedirs(self._path, exist_ok=True)
+
+        path = os.path.join(self._path, key)
+
+        with open(path + ".tmp", "w") as f:
+            f.write(filename)
+
+        os.rename(path + ".tmp", path)
+
+    def entries(self) -> List[CacheEntry]:
+        rv = []
+
+        try:
+            filenames = os.listdir(self._path)
+        except FileNotFoundError:
+            return rv
+
+        for filename in filenames:
+            # skip temporary files
+            if "." in filename:
+                continue
+
+            path = os.path.join(self._path, filename)
+
+            try:
+                with open(path) as f:
+                    script_name = f.read().strip()
+
+                size = os.path.getsize(path)
+                last_used = os.path.getmtime(path)
+            except OSError:
+                continue
+
+            rv.append(CacheEntry(filename, path, size, last_used, description="{} ({})".format(script_name, filename)))
+
+        return rv
+
+    def remove_entry(self, entry: CacheEntry):
+        try:
+            os.unlink(entry.path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,301 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+from typing import List
+
+from .._build_root import get_directory_size
+from .._util import CACHE_ROOT_SHELL_EXPR
+from .base import CacheBase, CacheEntry
+
+
+class ToolCache(CacheBase):
+    """
+    Content-addressed cache for the tools the generated scripts download (linuxdeploy and its plugins).
+
+    Every downloaded file is stored once in blobs/<sha256 of content>. urls/<sha256 of URL> records which content was
+    last fetched from a URL (and when), and its mtime is bumped on every use for LRU eviction. The generated scripts
+    implement the same layout in shell (see generate_fetch_function()), so builds can use the cache even when the
+    scripts are called without appimagecraft.
+
+    AppImages can be extracted into extracted/<sha256 of content> (see generate_extract_function()), so they can be
+    run without FUSE, and without mounting them on every call. Extracted copies are removed along with their blobs.
+    """
+
+    name = "tools"
+
+    _default_max_size = "1G"
+    _default_max_age = "30d"
+
+    _max_size_env_var = "APPIMAGECRAFT_TOOL_CACHE_MAX_SIZE"
+    _max_age_env_var = "APPIMAGECRAFT_TOOL_CACHE_MAX_AGE"
+
+    # most tools are fetched from "continuous" releases, so we have to refresh them every now and then
+    _default_ttl = 24 * 60 * 60
+
+    def _blobs_dir(self) -> str:
+        return os.path.join(self._path, "blobs")
+
+    def _urls_dir(self) -> str:
+        return os.path.join(self._path, "urls")
+
+    def _extracted_dir(self) -> str:
+        return os.path.join(self._path, "extracted")
+
+    @staticmethod
+    def _hash_url(url: str) -> str:
+        return hashlib.sha256(url.encode()).hexdigest()
+
+    def _read_index(self, path: str):
+        with open(path) as f:
+            digest, fetched_at, url = f.read().strip().split(" ", 2)
+
+        return digest, int(fetched_at), url
+
+    def default_ttl(self) -> int:
+        return int(os.environ.get("APPIMAGECRAFT_TOOL_CACHE_TTL", None) or self._default_ttl)
+
+    def lookup(self, url: str, ttl: int = None):
+        """
+        Find cached copy of a URL's contents.
+
+        :return: path to cached file, or None if there is no sufficiently recent copy
+        """
+
+        if ttl is None:
+            ttl = self.default_ttl()
+
+        index_path = os.path.join(self._urls_dir(), self._hash_url(url))
+
+        try:
+            digest, fetched_at, _ = self._read_index(index_path)
+        except (OSError, ValueError):
+            return None
+
+        blob_path = os.path.join(self._blobs_dir(), digest)
+
+        if not os.path.isfile(blob_path) or time.time() - fetched_at >= ttl:
+            return None
+
+        return blob_path
+
+    def fetch(self, url: str, ttl: int = None) -> str:
+        """
+        Download URL into the cache, unless a sufficiently recent copy is available already.
+
+        :return: path to cached file
+        """
+
+        cached_path = self.lookup(url, ttl)
+
+        if cached_path is not None:
+            self._logger.debug("{} is cached already".format(url))
+
+            # mark entry as recently used
+            os.utime(os.path.join(self._urls_dir(), self._hash_url(url)))
+
+            return cached_path
+
+        os.makedirs(self._blobs_dir(), exist_ok=True)
+        os.makedirs(self._urls_dir(), exist_ok=True)
+
+        self._logger.info("Downloading {}".format(url))
+
+        # importing urllib.request is rather expensive, and most of the time the files are cached already
+        import urllib.request
+
+        fd, tmp_path = tempfile.mkstemp(prefix=".download-", dir=self._blobs_dir())
+
+        try:
+            hasher = hashlib.sha256()
+
+            with os.fdopen(fd, "wb") as f, urllib.request.urlopen(url) as response:
+                for chunk in iter(lambda: response.read(1024 * 1024), b""):
+                    hasher.update(chunk)
+                    f.write(chunk)
+
+            # the tools are executables, and hardlinks share their permissions
+            os.chmod(tmp_path, 0o755)
+
+            blob_path = os.path.join(self._blobs_dir(), hasher.hexdigest())
+            os.rename(tmp_path, blob_path)
+
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+        index_path = os.path.join(self._urls_dir(), self._hash_url(url))
+
+        with open(index_path + ".tmp", "w") as f:
+            f.write("{} {} {}\n".format(hasher.hexdigest(), int(time.time()), url))
+
+        os.rename(index_path + ".tmp", index_path)
+
+        return blob_path
+
+    def entries(self) -> List[CacheEntry]:
+        rv = []
+
+        try:
+            index_files = os.listdir(self._urls_dir())
+        except FileNotFoundError:
+            return rv
+
+        for filename in index_files:
+            # skip temporary files
+            if "." in filename:
+                continue
+
+            index_path = os.path.join(self._urls_dir(), filename)
+
+            try:
+                digest, _, url = self._read_index(index_path)
+                blob_path = os.path.join(self._blobs_dir(), digest)
+                size = os.path.getsize(blob_path) + get_directory_size(os.path.join(self._extracted_dir(), digest))
+                last_used = os.path.getmtime(index_path)
+            except (OSError, ValueError):
+                continue
+
+            rv.append(CacheEntry(filename, blob_path, size, last_used, description=url))
+
+        return rv
+
+    def remove_entry(self, entry: CacheEntry):
+        try:
+            os.unlink(os.path.join(self._urls_dir(), entry.key))
+        except FileNotFoundError:
+            pass
+
+    def _collect_garbage(self):
+        referenced = {e.path for e in self.entries()}
+
+        try:
+            blobs = os.listdir(self._blobs_dir())
+        except FileNotFoundError:
+            return
+
+        for filename in blobs:
+            path = os.path.join(self._blobs_dir(), filename)
+
+            # leftovers of interrupted downloads are removed once they're old enough not to be in use any more
+            if filename.startswith(".download-"):
+                if time.time() - os.path.getmtime(path) < self._default_ttl:
+                    continue
+
+            elif path in referenced:
+                continue
+
+            self._logger.debug("Removing unreferenced blob {}".format(filename))
+            os.unlink(path)
+
+        self._collect_extracted_garbage(referenced)
+
+    def _collect_extracted_garbage(self, referenced: set):
+        referenced_digests = {os.path.basename(path) for path in referenced}
+
+        try:
+            dirnames = os.listdir(self._extracted_dir())
+        except FileNotFoundError:
+            return
+
+        for dirname in dirnames:
+            path = os.path.join(self._extracted_dir(), dirname)
+
+            if dirname.startswith(".extract-"):
+                if time.time() - os.path.getmtime(path) < self._default_ttl:
+                    continue
+
+            elif dirname in referenced_digests:
+                continue
+
+            self._logger.debug("Removing unreferenced extracted AppImage {}".format(dirname))
+            shutil.rmtree(path, ignore_errors=True)
+
+    @staticmethod
+    def generate_fetch_function() -> List[str]:
+        """
+        Generate a shell function fetch_cached <url> <filename> which implements the lookup/fetch logic in bash.
+        Files are hardlinked from the cache (copied if the build dir is on another filesystem).
+        """
+
+        return [
+            "# fetch file from URL, using appimagecraft's shared tool cache",
+            "# the cache can be relocated with $APPIMAGECRAFT_CACHE_DIR",
+            "# $APPIMAGECRAFT_TOOL_CACHE_TTL specifies after how many seconds a cached download is refreshed",
+            "fetch_cached() {",
+            '    local url="$1"',
+            '    local filename="$2"',
+            '    local cache_dir="{}/tools"'.format(CACHE_ROOT_SHELL_EXPR),
+            '    local ttl="${{APPIMAGECRAFT_TOOL_CACHE_TTL:-{}}}"'.format(ToolCache._default_ttl),
+            '    local digest=""',
+            "    local url_hash index fetched_at tmpfile",
+            "",
+            '    url_hash="$(printf "%s" "$url" | sha256sum | cut -d" " -f1)"',
+            '    index="$cache_dir/urls/$url_hash"',
+            '    mkdir -p "$cache_dir"/urls "$cache_dir"/blobs',
+            "",
+            '    if [[ -f "$index" ]]; then',
+            '        read -r digest fetched_at _ < "$index"',
+            '        if [[ -f "$cache_dir/blobs/$digest" ]] && (( $(date +%s) - fetched_at < ttl )); then',
+            "            # mark entry as recently used",
+            '            touch "$index"',
+            "        else",
+            '            digest=""',
+            "        fi",
+            "    fi",
+            "",
+            '    if [[ "$digest" == "" ]]; then',
+            '        tmpfile="$(mktemp "$cache_dir"/blobs/.download-XXXXXX)"',
+            '        if ! wget -nv "$url" -O "$tmpfile"; then',
+            '            rm -f "$tmpfile"',
+            "            return 1",
+            "        fi",
+            '        digest="$(sha256sum "$tmpfile" | cut -d" " -f1)"',
+            '        chmod 0755 "$tmpfile"',
+            '        mv "$tmpfile" "$cache_dir/blobs/$digest"',
+            '        echo "$digest $(date +%s) $url" > "$index.tmp.$$"',
+            '        mv "$index.tmp.$$" "$index"',
+            "    fi",
+            "",
+            '    rm -f "$filename"',
+            '    ln "$cache_dir/blobs/$digest" "$filename" 2>/dev/null || cp "$cache_dir/blobs/$digest" "$filename"',
+            "}",
+            "",
+        ]
+
+    @staticmethod
+    def generate_extract_function() -> List[str]:
+        """
+        Generate a shell function extract_cached <filename> which extracts an AppImage into the cache, unless a copy
+        with the same content has been extracted before, and prints the path to the extracted AppRun.
+        """
+
+        return [
+            "# extract AppImage into the shared tool cache once per content, and print the path to its AppRun",
+            "# the extracted tools can be run without FUSE, and don't have to be mounted on every call",
+            "extract_cached() {",
+            '    local filename="$1"',
+            '    local cache_dir="{}/tools/extracted"'.format(CACHE_ROOT_SHELL_EXPR),
+            "    local path digest dest tmpdir",
+            "",
+            '    path="$(readlink -f "$filename")"',
+            '    digest="$(sha256sum "$path" | cut -d" " -f1)"',
+            '    dest="$cache_dir/$digest"',
+            "",
+            '    if [[ ! -e "$dest/squashfs-root/AppRun" ]]; then',
+            '        mkdir -p "$cache_dir"',
+            '        tmpdir="$(mktemp -d "$cache_dir"/.extract-XXXXXX)"',
+            '        if ! (cd "$tmpdir" && "$path" --appimage-extract > /dev/null); then',
+            '            rm -rf "$tmpdir"',
+            "            return 1",
+            "        fi",
+            "        # another build might have extracted the same AppImage in the meantime",
+            '        mv -T "$tmpdir" "$dest" 2>/dev/null || rm -rf "$tmpdir"',
+            "    fi",
+            "",
+            '    echo "$dest/squashfs-root/AppRun"',
+            "}",
+            "",
+        ]
@@ -1,6 +1,33 @@
-from .base import CommandBase
-from .build_cmd import BuildCommand
-from .genscripts_cmd import GenerateScriptsCommand
+from .._util import make_lazy_getattr
 
+# the commands are imported on first use, so that the CLI only loads what the invoked command needs
+__getattr__ = make_lazy_getattr(
+    __name__,
+    {
+        "CommandBase": ".base",
+        "StandaloneCommandBase": ".base",
+        "BuildCommand": ".build_cmd",
+        "GenerateScriptsCommand": ".genscripts_cmd",
+        "CacheCommand": ".cache_cmd",
+        "MatrixCommand": ".matrix_cmd",
+        "BatchCommand": ".batch_cmd",
+        "GcCommand": ".gc_cmd",
+        "PackCompareCommand": ".pack_compare_cmd",
+        "AnalyzeCommand": ".analyze_cmd",
+        "BenchArtifactCommand": ".bench_artifact_cmd",
+    },
+)
 
-__all__ = ("CommandBase", "GenerateScriptsCommand", "BuildCommand")
+__all__ = (
+    "CommandBase",
+    "StandaloneCommandBase",
+    "GenerateScriptsCommand",
+    "BuildCommand",
+    "CacheCommand",
+    "MatrixCommand",
+    "BatchCommand",
+    "GcCommand",
+    "PackCompareCommand",
+    "AnalyzeCommand",
+    "BenchArtifactCommand",
+)
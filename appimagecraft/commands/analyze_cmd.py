@@ -0,0 +1,273 @@
+import json
+import os
+import re
+import shutil
+import sys
+import tempfile
+from typing import List
+
+from . import StandaloneCommandBase
+from .._appdir_analysis import analyze_appdir, diff_reports
+from .._elf import ElfFile
+from .._squashfs import unpack_image
+from .._util import format_size, get_appdir_path, parse_size, print_table
+from .. import _logging
+
+
+def _format_difference(size: int) -> str:
+    return "+" + format_size(size) if size > 0 else format_size(size)
+
+
+# Reports what an AppDir (or an existing AppImage) consists of, and how it changed compared to a previous analysis
+class AnalyzeCommand(StandaloneCommandBase):
+    # number of rows printed per table, the JSON report contains everything
+    _max_rows = 20
+
+    # only directories up to this depth are printed
+    _max_directory_depth = 3
+
+    def __init__(self, args):
+        super().__init__(args)
+
+        self._logger = _logging.get_logger("analyze")
+
+    def _fail(self, message: str):
+        self._logger.critical(message)
+        sys.exit(1)
+
+    def _extract_appimage(self, path: str, tmpdir: str) -> str:
+        """
+        Extract the squashfs image of a type 2 AppImage, which is appended to the runtime. Running the AppImage with
+        --appimage-extract would work for the host's architecture only.
+        """
+
+        try:
+            with open(path, "rb") as f:
+                offset = ElfFile(f).get_size()
+                f.seek(offset)
+                magic = f.read(4)
+
+        except (OSError, ValueError) as e:
+            self._fail("Could not read {}: {}".format(path, e))
+
+        if magic != b"hsqs":
+            self._fail("{} is not a type 2 AppImage (no squashfs image found at offset {})".format(path, offset))
+
+        if shutil.which("unsquashfs") is None:
+            self._fail("Could not find unsquashfs, which is required to analyze AppImages")
+
+        dest = os.path.join(tmpdir, "squashfs-root")
+
+        self._logger.info("Extracting {}".format(path))
+        unpack_image(path, dest, offset)
+
+        return dest
+
+    def _analyze(self, path: str) -> dict:
+        # build directories contain the AppDir in a well known location
+        if os.path.isdir(path) and not os.path.exists(os.path.join(path, "AppRun")):
+            appdir = get_appdir_path(path)
+
+            if os.path.isdir(appdir):
+                path = appdir
+
+        if os.path.isdir(path):
+            self._logger.info("Analyzing {}".format(path))
+            return analyze_appdir(path)
+
+        if not os.path.isfile(path):
+            self._fail("{} is neither an AppDir nor an AppImage".format(path))
+
+        tmpdir = tempfile.mkdtemp(prefix="appimagecraft-analyze-")
+
+        try:
+            report = analyze_appdir(self._extract_appimage(path, tmpdir))
+
+        finally:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+
+        report["path"] = path
+
+        return report
+
+    def _print_directories(self, report: dict):
+        directories = [
+            (path, info)
+            for path, info in report["directories"].items()
+            if path != "." and path.count("/") < self._max_directory_depth
+        ]
+        directories.sort(key=lambda i: -i[1]["size"])
+
+        rows = [("directory", "size", "share", "est. compressed")]
+
+        for path, info in directories[: self._max_rows]:
+            rows.append(
+                (
+                    path,
+                    format_size(info["size"]),
+                    "{:.1f} %".format(info["size"] / report["total_size"] * 100),
+                    format_size(info["estimated_compressed_size"]),
+                )
+            )
+
+        print_table(rows)
+
+    def _print_files(self, report: dict):
+        files = sorted(report["files"].items(), key=lambda i: -i[1])
+
+        rows = [("file", "size")]
+        rows += [(path, format_size(size)) for path, size in files[: self._max_rows]]
+
+        print_table(rows)
+
+    def _print_libraries(self, report: dict):
+        libraries = sorted(report["libraries"].items(), key=lambda i: -i[1]["size"])
+
+        rows = [("library", "size", "incl. dependencies", "pulled in by")]
+
+        for path, info in libraries[: self._max_rows]:
+            chain = " -> ".join((os.path.basename(i) for i in info["chain"][:-1]))
+
+            rows.append((path, format_size(info["size"]), format_size(info["closure_size"]), chain or "-"))
+
+        print_table(rows)
+
+    def _print_changes(self, changes: List[dict], name: str):
+        rows = [(name, "old size", "new size", "difference")]
+
+        for change in changes[: self._max_rows]:
+            rows.append(
+                (
+                    change["path"],
+                    format_size(change["old_size"]) if change["old_size"] is not None else "-",
+                    format_size(change["new_size"]) if change["new_size"] is not None else "-",
+                    _format_difference(change["difference"]),
+                )
+            )
+
+        print_table(rows)
+
+    def _print_diff(self, diff: dict):
+        print(
+            "Compared to {}: {} -> {} ({})".format(
+                diff["old_path"],
+                format_size(diff["old_total_size"]),
+                format_size(diff["new_total_size"]),
+                _format_difference(diff["difference"]),
+            )
+        )
+
+        directories = [
+            i for i in diff["directories"] if i["path"] != "." and i["path"].count("/") < self._max_directory_depth
+        ]
+
+        if directories:
+            print()
+            self._print_changes(directories, "directory")
+
+        if diff["files"]:
+            print()
+            self._print_changes(diff["files"], "file")
+
+        for libraries, description in [(diff["added_libraries"], "Added"), (diff["removed_libraries"], "Removed")]:
+            if libraries:
+                print()
+                print("{} libraries: {}".format(description, ", ".join(libraries)))
+
+    def _check_growth(self, diff: dict, max_growth: str) -> bool:
+        """
+        :param max_growth: maximum increase of the total size, either in percent (e.g., 5%) or as a size (e.g., 10M)
+        :return: whether the total size grew by more than allowed
+        """
+
+        match = re.match(r"^\s*(\d+(?:\.\d+)?)\s*%\s*$", max_growth)
+
+        try:
+            if match:
+                limit = diff["old_total_size"] * float(match.group(1)) / 100
+            else:
+                limit = parse_size(max_growth)
+
+        except ValueError as e:
+            self._fail("Invalid maximum growth: {}".format(e))
+
+        if diff["difference"] <= limit:
+            return False
+
+        self._logger.error(
+            "Total size grew by {}, which exceeds the maximum of {}".format(
+                format_size(diff["difference"]), max_growth.strip()
+            )
+        )
+
+        return True
+
+    def _print_report(self, report: dict):
+        print(
+            "{}: {} files, {} symlinks, {} ({} estimated compressed size with gzip)".format(
+                report["path"],
+                report["file_count"],
+                report["symlink_count"],
+                format_size(report["total_size"]),
+                format_size(report["estimated_compressed_size"]),
+            )
+        )
+
+        if report["total_size"]:
+            print()
+            self._print_directories(report)
+            print()
+            self._print_files(report)
+
+        if report["libraries"]:
+            print()
+            self._print_libraries(report)
+
+    def _load_previous_report(self, path: str) -> dict:
+        try:
+            with open(path) as f:
+                return json.load(f)
+
+        except (OSError, ValueError) as e:
+            self._fail("Could not read previous report: {}".format(e))
+
+    def run(self):
+        command_args = getattr(self._args, "command_args", None) or []
+
+        if not 1 <= len(command_args) <= 2:
+            self._fail("Usage: analyze <AppDir, build directory or AppImage> [<previous report>]")
+
+        previous_report = self._load_previous_report(command_args[1]) if len(command_args) > 1 else None
+
+        report = self._analyze(os.path.abspath(command_args[0]))
+
+        self._print_report(report)
+
+        max_growth = getattr(self._args, "max_growth", None)
+        exceeded = False
+
+        if previous_report is not None:
+            try:
+                report["diff"] = diff_reports(previous_report, report)
+            except (KeyError, TypeError, AttributeError):
+                self._fail("{} is not a report created by the analyze command".format(command_args[1]))
+
+            print()
+            self._print_diff(report["diff"])
+
+            if max_growth:
+                exceeded = self._check_growth(report["diff"], max_growth)
+
+        elif max_growth:
+            self._logger.warning("--max-growth requires a previous report to compare to")
+
+        report_path = getattr(self._args, "report_path", None)
+
+        if report_path:
+            with open(report_path, "w") as f:
+                json.dump(report, f, indent=4)
+
+            self._logger.info("Wrote report to {}".format(report_path))
+
+        if exceeded:
+            sys.exit(1)
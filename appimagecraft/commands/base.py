@@ -1,3 +1,6 @@
+import argparse
+
+
 class CommandBase:
     def __init__(self, config: dict, project_root_dir: str, build_dir: str, builder_name: str):
         self._config = config
@@ -5,5 +8,27 @@ class CommandBase:
         self._build_dir = build_dir
         self._builder_name = builder_name
 
+    def configure(self, args: argparse.Namespace):
+        """
+        Apply the command line arguments specific to this command.
+
+        :raises ValueError: if an argument is invalid
+        """
+
+        pass
+
+    def run(self):
+        raise NotImplementedError
+
+
+class StandaloneCommandBase:
+    """
+    Base class for commands which do not operate on a single project's build directory (e.g., maintenance commands).
+    These commands receive the parsed command line arguments and are responsible for loading a config themselves.
+    """
+
+    def __init__(self, args: argparse.Namespace):
+        self._args = args
+
     def run(self):
         raise NotImplementedError
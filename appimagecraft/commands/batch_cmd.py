@@ -0,0 +1,240 @@
+import os
+import sys
+from typing import BinaryIO, List, Union
+
+from . import StandaloneCommandBase
+from .build_cmd import BuildCommand
+from ..cache import evict_all_caches
+from ..parsers import AppImageCraftYMLParser
+from .._build_pool import (
+    BuildJob,
+    BuildJobResult,
+    BuildPool,
+    get_default_parallel_builds,
+    print_summary_table,
+    write_report,
+)
+from .._build_root import BuildRootPolicy
+from .._util import get_config_arch, get_incremental_build_dir, make_temporary_build_dir
+from .. import _logging
+
+
+class ProjectBuildJob(BuildJob):
+    """
+    Builds a project with the build command. The scripts are generated within the appimagecraft process from the config
+    which has been parsed already, only the main build script is run in a child process.
+
+    :param command: build command, configured except for the build directory
+    :param build_dir: persistent build directory (e.g., for incremental builds), by default, a temporary build
+        directory is created according to the build root policy
+    """
+
+    def __init__(
+        self,
+        name: str,
+        command: BuildCommand,
+        project_root_dir: str,
+        builder_name: str,
+        artifacts_dir: str,
+        build_root_policy: BuildRootPolicy,
+        build_dir: str = None,
+    ):
+        super().__init__(name, artifacts_dir, project_root_dir)
+
+        self._command = command
+        self._project_root_dir = project_root_dir
+        self._builder_name = builder_name
+        self._build_root_policy = build_root_policy
+        self._build_dir = build_dir
+
+        # environment the build script needs, e.g., for the caches
+        self._env = None
+
+    def _make_build_dir(self) -> str:
+        if self._build_dir is not None:
+            os.makedirs(self._build_dir, exist_ok=True)
+            os.chmod(self._build_dir, 0o755)
+            return self._build_dir
+
+        # an InsufficientSpaceError makes the job fail without affecting other builds
+        build_root = self._build_root_policy.get_build_root(self._project_root_dir, self._builder_name)
+
+        self._command.set_record_build_size(self._build_root_policy.is_auto())
+
+        return make_temporary_build_dir(build_root, self._builder_name)
+
+    def prepare(self) -> List[str]:
+        self._command.set_build_dir(self._make_build_dir())
+
+        try:
+            build_script, self._env = self._command.prepare_build()
+        except BaseException:
+            self._command.finish_build(None)
+            raise
+
+        return [build_script]
+
+    def run(self, command: List[str], env: dict, output: BinaryIO) -> int:
+        # the environment set up by the pool takes precedence
+        env = dict(self._env, **env)
+
+        try:
+            return self._command.run_build_script(command[0], env, output)
+        except BaseException:
+            self._command.finish_build(None)
+            raise
+
+    def finish(self, returncode: int) -> List[str]:
+        artifacts = self._command.finish_build(returncode)
+
+        if returncode == 0 and artifacts is None:
+            raise RuntimeError("could not move artifacts")
+
+        return artifacts or []
+
+
+# Builds all projects found in a directory tree
+class BatchCommand(StandaloneCommandBase):
+    _config_filename = "appimagecraft.yml"
+
+    def __init__(self, args):
+        super().__init__(args)
+
+        self._logger = _logging.get_logger("batch")
+
+    def _find_config_files(self, root_dir: str) -> List[str]:
+        rv = []
+
+        for dirpath, dirnames, filenames in os.walk(root_dir):
+            # skip hidden directories like .git as well as appimagecraft's own build directories
+            dirnames[:] = sorted((d for d in dirnames if not d.startswith(".")))
+
+            if self._config_filename in filenames:
+                rv.append(os.path.join(dirpath, self._config_filename))
+
+        return rv
+
+    def _create_job(self, config_file: str, root_dir: str) -> Union[ProjectBuildJob, BuildJobResult]:
+        """
+        :return: job building the project, or a failed result if the config can't be used
+        """
+
+        project_root_dir = os.path.dirname(config_file)
+        name = os.path.relpath(project_root_dir, root_dir)
+
+        if name == ".":
+            name = os.path.basename(root_dir)
+
+        builder_name = getattr(self._args, "builder_name", None)
+
+        try:
+            config = AppImageCraftYMLParser(config_file).data()
+
+            if builder_name is None:
+                builder_name = list(config["build"].keys())[0]
+
+            # YAML parses an unquoted null: key as None
+            if builder_name is None:
+                builder_name = "null"
+
+            # invalid settings are reported before any build is started
+            build_root_policy = BuildRootPolicy.from_config(
+                config, getattr(self._args, "build_root", None), getattr(self._args, "min_free_space", None)
+            )
+
+            # every project is built with the same options as by the build command
+            command = BuildCommand(config, project_root_dir, None, builder_name)
+            command.configure(self._args)
+
+        except (OSError, ValueError, KeyError, IndexError, AttributeError) as e:
+            self._logger.error("Invalid config {}: {}".format(config_file, e))
+            return BuildJobResult(BuildJob(name, None), 1, 0, [], error=str(e))
+
+        artifacts_root = getattr(self._args, "artifacts_dir", None)
+
+        if artifacts_root is not None:
+            artifacts_dir = os.path.join(os.path.abspath(artifacts_root), name)
+        else:
+            artifacts_dir = project_root_dir
+
+        command.set_artifacts_dir(artifacts_dir)
+
+        # every build writes its own file, named like the one passed on the command line
+        if getattr(self._args, "trace_file", None) is not None:
+            command.set_trace_file(os.path.join(artifacts_dir, os.path.basename(self._args.trace_file)))
+
+        if getattr(self._args, "resource_profile", None) is not None:
+            command.set_resource_profile_file(
+                os.path.join(artifacts_dir, os.path.basename(self._args.resource_profile))
+            )
+
+        build_dir = None
+
+        if getattr(self._args, "incremental", False):
+            build_dir = get_incremental_build_dir(config_file, builder_name, get_config_arch(config))
+
+        return ProjectBuildJob(
+            name, command, project_root_dir, builder_name, artifacts_dir, build_root_policy, build_dir
+        )
+
+    def run(self):
+        command_args = getattr(self._args, "command_args", None) or []
+
+        if len(command_args) > 1:
+            self._logger.critical("Usage: batch [directory]")
+            sys.exit(1)
+
+        root_dir = os.path.abspath(command_args[0] if command_args else ".")
+
+        config_files = self._find_config_files(root_dir)
+
+        if not config_files:
+            self._logger.critical("Could not find any {} in {}".format(self._config_filename, root_dir))
+            sys.exit(1)
+
+        self._logger.info("Found {} projects in {}".format(len(config_files), root_dir))
+
+        jobs = []
+
+        # projects whose config could not be used, reported along with the builds
+        invalid_projects = []
+
+        for config_file in config_files:
+            job = self._create_job(config_file, root_dir)
+
+            if isinstance(job, BuildJobResult):
+                invalid_projects.append(job)
+            else:
+                jobs.append(job)
+
+        fail_fast = getattr(self._args, "fail_fast", False)
+
+        results = list(invalid_projects)
+
+        if invalid_projects and fail_fast:
+            self._logger.critical("Not building any projects due to invalid configs")
+            results += [BuildJobResult(job, None, 0, []) for job in jobs]
+
+        elif jobs:
+            cpu_budget = getattr(self._args, "cpu_budget", None)
+            max_parallel = getattr(self._args, "parallel_builds", None) or get_default_parallel_builds(
+                len(jobs), cpu_budget
+            )
+
+            self._logger.info("Running {} builds, at most {} at a time".format(len(jobs), max_parallel))
+
+            results += BuildPool(max_parallel, cpu_budget=cpu_budget, fail_fast=fail_fast).run(jobs)
+
+        # keep the shared caches from growing indefinitely
+        evict_all_caches()
+
+        print()
+        print_summary_table(results)
+
+        report_path = getattr(self._args, "report_path", None) or os.path.join(root_dir, "appimagecraft-batch.json")
+        write_report(results, report_path)
+
+        self._logger.info("Wrote report to {}".format(report_path))
+
+        if not all((r.succeeded() for r in results)):
+            sys.exit(1)
@@ -0,0 +1,190 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from typing import Dict, List
+
+from . import StandaloneCommandBase
+from .._startup_bench import (
+    LAUNCH_MODES,
+    METRICS,
+    PERCENTILES,
+    AppImageLauncher,
+    SmokeCommandError,
+    StartupRun,
+    evict_from_page_cache,
+    parse_ld_statistics,
+    summarize,
+)
+from .._util import format_size, print_table
+from .. import _logging
+
+
+def _format_metric(metric: str, value: float) -> str:
+    if metric.endswith("_time"):
+        return "{:.1f} ms".format(value * 1000)
+
+    if metric.startswith("bytes_"):
+        return format_size(int(value))
+
+    return "{:.0f}".format(value)
+
+
+# Measures how quickly a built AppImage starts, to judge the effect of packaging changes on the startup latency
+class BenchArtifactCommand(StandaloneCommandBase):
+    default_runs = 10
+    default_launch_mode = "extract-and-run"
+
+    # run if no smoke command is passed on the command line
+    default_smoke_args = ["--version"]
+
+    # maximum duration of a single launch in seconds
+    _timeout = 60
+
+    def __init__(self, args):
+        super().__init__(args)
+
+        self._logger = _logging.get_logger("bench_artifact")
+
+    def _fail(self, message: str):
+        self._logger.critical(message)
+        sys.exit(1)
+
+    def _run_series(self, launcher: AppImageLauncher, runs: int, cold: bool) -> List[StartupRun]:
+        rv = []
+
+        for i in range(runs):
+            self._logger.info("{} run {}/{}".format("Cold" if cold else "Warm", i + 1, runs))
+
+            if cold:
+                for path in launcher.get_cold_paths():
+                    evict_from_page_cache(path)
+
+            rv.append(launcher.run(self._timeout))
+
+        return rv
+
+    def _measure_ld_statistics(self, launcher: AppImageLauncher) -> Dict[str, Dict[str, int]]:
+        """
+        Launch once more with the dynamic linker's statistics enabled (glibc only).
+
+        :return: pid -> statistic -> value for every process which used the dynamic linker
+        """
+
+        tmpdir = tempfile.mkdtemp(prefix="appimagecraft-ld-statistics-")
+
+        try:
+            # the dynamic linker appends the pid to the file name
+            launcher.run(
+                self._timeout,
+                extra_env={"LD_DEBUG": "statistics", "LD_DEBUG_OUTPUT": os.path.join(tmpdir, "ld")},
+            )
+
+            rv = {}
+
+            for filename in sorted(os.listdir(tmpdir)):
+                rv.update(parse_ld_statistics(os.path.join(tmpdir, filename)))
+
+            return rv
+
+        finally:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+
+    @staticmethod
+    def _print_results(results: dict):
+        columns = ["min"] + ["p{}".format(i) for i in PERCENTILES] + ["max"]
+
+        rows = [tuple(["phase", "metric"] + columns)]
+
+        for phase in ["cold", "warm"]:
+            summary = results[phase]["summary"]
+
+            for metric in METRICS:
+                values = [_format_metric(metric, summary[metric][column]) for column in columns]
+                rows.append(tuple([phase, metric.replace("_", " ")] + values))
+
+        print_table(rows)
+
+        ld_statistics = results.get("ld_statistics", None)
+
+        if ld_statistics:
+            totals = {}
+
+            for statistics in ld_statistics.values():
+                for name, value in statistics.items():
+                    totals[name] = totals.get(name, 0) + value
+
+            print()
+            print("Dynamic linker statistics, summed up over all processes ({}):".format(len(ld_statistics)))
+            print_table([("statistic", "value")] + [(name, str(value)) for name, value in totals.items()])
+
+    def _check_launch_mode(self, mode: str):
+        if mode not in LAUNCH_MODES:
+            self._fail("Invalid launch mode: {} (must be one of {})".format(mode, ", ".join(LAUNCH_MODES)))
+
+        if mode == "fuse":
+            if not os.path.exists("/dev/fuse") or not (shutil.which("fusermount") or shutil.which("fusermount3")):
+                self._fail("Launch mode fuse requires FUSE, use extract-and-run or extracted instead")
+
+    def run(self):
+        command_args = getattr(self._args, "command_args", None) or []
+
+        if not command_args:
+            self._fail("Usage: bench-artifact <AppImage> [-- <smoke command arguments...>]")
+
+        appimage = os.path.abspath(command_args[0])
+        smoke_args = command_args[1:] or self.default_smoke_args
+
+        if not os.path.isfile(appimage) or not os.access(appimage, os.X_OK):
+            self._fail("{} is not an executable file".format(appimage))
+
+        runs = getattr(self._args, "bench_runs", None) or self.default_runs
+
+        if runs < 1:
+            self._fail("Invalid number of runs: {}".format(runs))
+
+        mode = getattr(self._args, "launch_mode", None) or self.default_launch_mode
+        self._check_launch_mode(mode)
+
+        self._logger.info("Benchmarking {} {} ({})".format(appimage, " ".join(smoke_args), mode))
+
+        results = {
+            "appimage": appimage,
+            "launch_mode": mode,
+            "smoke_args": smoke_args,
+        }
+
+        try:
+            with AppImageLauncher(appimage, mode, smoke_args) as launcher:
+                cold_runs = self._run_series(launcher, runs, cold=True)
+
+                # the first warm run fills the caches, and isn't measured
+                launcher.run(self._timeout)
+                warm_runs = self._run_series(launcher, runs, cold=False)
+
+                if getattr(self._args, "ld_statistics", False):
+                    results["ld_statistics"] = self._measure_ld_statistics(launcher)
+
+        except subprocess.CalledProcessError as e:
+            self._fail("Could not extract AppImage: {}".format(e))
+
+        except SmokeCommandError as e:
+            self._fail("Smoke command failed: {}".format(e))
+
+        for phase, phase_runs in [("cold", cold_runs), ("warm", warm_runs)]:
+            results[phase] = {
+                "runs": [run.to_dict() for run in phase_runs],
+                "summary": summarize(phase_runs),
+            }
+
+        self._print_results(results)
+
+        report_path = getattr(self._args, "report_path", None)
+
+        if report_path:
+            with open(report_path, "w") as f:
+                json.dump(results, f, indent=4)
+
+            self._logger.info("Wrote report to {}".format(report_path))
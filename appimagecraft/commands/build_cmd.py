@@ -1,12 +1,35 @@
 import glob
 import os
-import shutil
-import subprocess
+import platform
 import sys
+from typing import BinaryIO, List, Tuple, Union
 
 from . import CommandBase
+from ..cache import AppDirCache, AppImageCache, evict_all_caches
 from ..generators import AllBuildScriptsGenerator
+from ..generators.build_scripts import APPDIR_CACHE_RESTORE_ENV_VAR, APPDIR_CACHE_STAGING_ENV_VAR
 from ..validators import ValidationError
+from .._build_log import BuildLog
+from .._build_root import get_directory_size, record_build_size
+from .._source_tree import get_source_tree_hash
+from .._cleanup import BuildDirInUseError, dispose_build_dir, holds_build_dir_lock, lock_build_dir
+from .._artifacts import transfer_artifact, write_checksum_file, write_manifest
+from .._resource_profiler import (
+    ResourceProfiler,
+    format_summary,
+    get_trace_counters,
+    summarize_samples,
+    write_profile,
+)
+from .._trace import (
+    TIMINGS_FILENAME,
+    Span,
+    current_timestamp,
+    format_breakdown,
+    read_spans,
+    record_event,
+    write_trace_events,
+)
 from .. import _logging
 
 
@@ -16,59 +39,469 @@ class BuildCommand(CommandBase):
 
         self._logger = _logging.get_logger("build")
 
+        self._keep_build_dir = False
+
+        # by default, artifacts are moved into the project root directory
+        self._artifacts_dir = project_root_dir
+
+        # if set, the stage timings are written to this file in the Chrome trace event format
+        self._trace_file = None
+
+        # if set, the resource usage of the build is sampled and written to this file along with a per stage summary
+        self._resource_profile_file = None
+        self._resource_profile_interval = None
+        self._resource_profiler = None
+
+        self._record_build_size = False
+
+        self._background_cleanup = True
+
+        # None: use setting from config
+        self._use_appdir_cache = None
+
+        # None: use setting from config (evaluated by the build scripts)
+        self._use_appimage_cache = None
+
+        # set up along with the build scripts
+        self._build_log = None
+
+        # key and staging directory of the AppDir to be added to the cache after a successful build
+        self._appdir_cache_key = None
+        self._appdir_cache_staging_dir = None
+
     def set_build_dir(self, build_dir: str):
         self._build_dir = build_dir
 
+    def set_keep_build_dir(self, keep_build_dir: bool):
+        self._keep_build_dir = keep_build_dir
+
+    def set_artifacts_dir(self, artifacts_dir: str):
+        self._artifacts_dir = artifacts_dir
+
+    def set_trace_file(self, trace_file: str):
+        self._trace_file = trace_file
+
+    def set_resource_profile_file(self, resource_profile_file: str):
+        self._resource_profile_file = resource_profile_file
+
+    def set_resource_profile_interval(self, interval: float):
+        """
+        :param interval: time between two samples in seconds
+        """
+
+        self._resource_profile_interval = interval
+
+    def set_record_build_size(self, record_build_size: bool):
+        self._record_build_size = record_build_size
+
+    def set_background_cleanup(self, background_cleanup: bool):
+        self._background_cleanup = background_cleanup
+
+    def set_use_appdir_cache(self, use_appdir_cache: bool):
+        self._use_appdir_cache = use_appdir_cache
+
+    def set_use_appimage_cache(self, use_appimage_cache: bool):
+        self._use_appimage_cache = use_appimage_cache
+
+    def configure(self, args):
+        self.set_keep_build_dir(args.keep_build_dir or args.incremental)
+        self.set_background_cleanup(not args.sync_cleanup)
+        self.set_use_appdir_cache(args.appdir_cache)
+        self.set_use_appimage_cache(args.appimage_cache)
+
+        if args.artifacts_dir is not None:
+            self.set_artifacts_dir(os.path.abspath(args.artifacts_dir))
+
+        if args.trace_file is not None:
+            self.set_trace_file(os.path.abspath(args.trace_file))
+
+        if args.resource_profile is not None:
+            self.set_resource_profile_file(os.path.abspath(args.resource_profile))
+
+        if args.resource_profile_interval is not None:
+            if args.resource_profile_interval <= 0:
+                raise ValueError("Invalid resource profile interval: {}".format(args.resource_profile_interval))
+
+            self.set_resource_profile_interval(args.resource_profile_interval)
+
     def _get_gen(self) -> AllBuildScriptsGenerator:
         gen = AllBuildScriptsGenerator(self._config, self._project_root_dir, self._builder_name)
 
         return gen
 
-    def run(self):
-        failed = False
+    def generate_scripts(self) -> str:
+        """
+        Generate build scripts in the build directory.
+
+        :return: path to main build script
+        :raises ValidationError: in case the generated scripts are invalid
+        :raises BuildDirInUseError: if another process uses the build directory
+        """
+
+        # keeps appimagecraft gc from removing the directory during the build
+        lock_build_dir(self._build_dir)
+
+        self._logger.info("Generating build scripts in {}".format(self._build_dir))
+
+        # timings of a previous build in the same directory (e.g., incremental builds) must not end up in the report
+        timings_path = os.path.join(self._build_dir, TIMINGS_FILENAME)
+        if os.path.exists(timings_path):
+            os.unlink(timings_path)
+
+        record_event(self._build_dir, "B", "generate scripts")
+
+        gen = self._get_gen()
+
+        rv = gen.generate_all_scripts(self._build_dir)
+
+        record_event(self._build_dir, "E", "generate scripts")
+
+        return rv
+
+    def move_artifacts(self) -> List[str]:
+        """
+        Move artifacts from the build directory into the artifacts directory. A .sha256 file is written next to every
+        artifact, and a manifest listing all artifacts of this build is written into the artifacts directory.
+
+        :return: new paths of the artifacts
+        """
+
+        self._logger.info("Moving artifacts into {}".format(self._artifacts_dir))
+
+        artifact_paths = glob.glob("{}/artifacts/*".format(self._build_dir))
+
+        if not artifact_paths:
+            self._logger.warning("Could not find any artifacts to move to {}".format(self._artifacts_dir))
+            return []
+
+        os.makedirs(self._artifacts_dir, exist_ok=True)
+
+        record_event(self._build_dir, "B", "move artifacts")
+
+        artifacts = []
+
+        for path in sorted(artifact_paths):
+            if os.path.isdir(path):
+                self._logger.warning("Skipping directory {} in artifacts".format(path))
+                continue
+
+            dest = os.path.join(self._artifacts_dir, os.path.basename(path))
+
+            self._logger.debug("Moving artifact {} to {}".format(path, dest))
+
+            # the checksums are calculated while moving, so the files don't have to be read again afterwards
+            artifact = transfer_artifact(path, dest)
+            write_checksum_file(artifact)
+
+            self._logger.info("{}  {}".format(artifact.sha256, os.path.basename(dest)))
+
+            artifacts.append(artifact)
+
+        write_manifest(artifacts, self._artifacts_dir)
+
+        record_event(self._build_dir, "E", "move artifacts")
+
+        return [a.path for a in artifacts]
+
+    def _report_resource_usage(self, spans: List[Span]):
+        samples = self._resource_profiler.get_samples()
+
+        if not samples:
+            self._logger.warning("No resource usage has been sampled")
+            return
+
+        summary = summarize_samples(samples, spans, len(os.sched_getaffinity(0)))
+
+        self._logger.info("Resource usage per stage (sampled using {}):".format(self._resource_profiler.get_method()))
+
+        for line in format_summary(summary):
+            self._logger.info(line)
+
+        write_profile(
+            self._resource_profile_file,
+            self._resource_profiler.get_method(),
+            self._resource_profile_interval or ResourceProfiler.default_interval,
+            samples,
+            summary,
+        )
+
+        self._logger.info("Wrote resource profile to {}".format(self._resource_profile_file))
+
+    def report_timings(self):
+        """
+        Log how much time the build spent in which stage, and write the trace file if requested. If the build has been
+        profiled, the resource usage per stage is reported as well.
+        """
+
+        timings_path = os.path.join(self._build_dir, TIMINGS_FILENAME)
+
+        spans = []
+
+        # stages which did not finish (i.e., the one the build failed in) lasted until now
+        if os.path.exists(timings_path):
+            spans = read_spans(timings_path, end_timestamp=current_timestamp())
+
+        if spans:
+            self._logger.info("Build stage timings:")
+
+            for line in format_breakdown(spans):
+                self._logger.info(line)
+
+        if self._resource_profiler is not None:
+            self._report_resource_usage(spans)
+
+        if spans and self._trace_file is not None:
+            counters = None
+
+            if self._resource_profiler is not None:
+                counters = get_trace_counters(self._resource_profiler.get_samples())
+
+            write_trace_events(spans, self._trace_file, counters)
+            self._logger.info("Wrote trace to {}".format(self._trace_file))
+
+    def _get_source_tree_hash(self, gen: AllBuildScriptsGenerator) -> str:
+        """
+        Hash the project root directory and, if the builder builds from a directory outside of it (e.g., ../src), that
+        directory, too.
+        """
+
+        rv = get_source_tree_hash(self._project_root_dir)
+
+        source_dir = gen.get_source_dir()
+
+        if source_dir is not None:
+            project_root_dir = os.path.realpath(self._project_root_dir)
+            source_dir = os.path.realpath(source_dir)
+
+            if os.path.commonpath([project_root_dir, source_dir]) != project_root_dir:
+                rv = "{} {}".format(rv, get_source_tree_hash(source_dir))
+
+        return rv
+
+    def _get_appdir_cache_key(self) -> str:
+        gen = self._get_gen()
+
+        scripts = {}
+
+        for path in gen.get_appdir_scripts(self._build_dir):
+            with open(path) as f:
+                data = f.read()
+
+            # the build directory's name is random, and the project might be checked out in another location
+            data = data.replace(self._build_dir, "$BUILD_DIR").replace(self._project_root_dir, "$PROJECT_ROOT")
+
+            scripts[os.path.basename(path)] = data
+
+        env = {k: os.environ.get(k, None) for k in AppDirCache.relevant_env_vars}
+        env["machine"] = platform.machine()
+
+        return AppDirCache.make_key(self._get_source_tree_hash(gen), scripts, env)
+
+    def _set_up_appdir_cache(self, env: dict) -> dict:
+        """
+        Look up the AppDir in the cache. On a hit, the build scripts restore the cached AppDir instead of running the
+        builder, otherwise they copy the AppDir into a staging directory after the builder has run.
+
+        :param env: environment the build script's environment is based on
+        :return: environment for the build script
+        """
+
+        env = dict(env)
+
+        use_appdir_cache = self._use_appdir_cache
+
+        if use_appdir_cache is None:
+            use_appdir_cache = bool(self._config.get("appdir_cache", False))
+
+        if not use_appdir_cache or not self._get_gen().get_appdir_scripts(self._build_dir):
+            return env
+
+        cache = AppDirCache()
 
         try:
-            self._logger.info("Generating build scripts in {}".format(self._build_dir))
+            key = self._get_appdir_cache_key()
+            cached_appdir = cache.lookup(key)
+
+            if cached_appdir is not None:
+                self._logger.info("AppDir has been built from the same inputs before, restoring it from the cache")
+                env[APPDIR_CACHE_RESTORE_ENV_VAR] = cached_appdir
+
+            else:
+                self._logger.info("AppDir not found in cache, running builder")
+                self._appdir_cache_key = key
+                self._appdir_cache_staging_dir = cache.create_staging_dir()
+                env[APPDIR_CACHE_STAGING_ENV_VAR] = self._appdir_cache_staging_dir
+
+        # the cache must never break the build
+        except OSError as e:
+            self._logger.warning("Could not use AppDir cache: {}".format(e))
 
-            gen = self._get_gen()
+        return env
 
+    def _finish_appdir_cache(self, success: bool):
+        if self._appdir_cache_staging_dir is None:
+            return
+
+        cache = AppDirCache()
+
+        try:
+            if success and os.path.isdir(os.path.join(self._appdir_cache_staging_dir, "AppDir")):
+                cache.commit(
+                    self._appdir_cache_key,
+                    self._appdir_cache_staging_dir,
+                    "{} ({})".format(self._config["project"]["name"], self._builder_name),
+                )
+                self._logger.info("Added AppDir to cache")
+            else:
+                cache.discard(self._appdir_cache_staging_dir)
+
+        except OSError as e:
+            self._logger.warning("Could not add AppDir to cache: {}".format(e))
+            cache.discard(self._appdir_cache_staging_dir)
+
+        self._appdir_cache_staging_dir = None
+
+    def _report_failure(self, build_log: BuildLog, returncode: int):
+        tail = build_log.tail()
+
+        if tail:
+            self._logger.error("Last {} lines of output:".format(len(tail)))
+
+            for line in tail:
+                self._logger.error("    {}".format(line))
+
+        stage = build_log.current_stage()
+
+        if stage is not None:
+            self._logger.critical("Build script returned non-zero exit status {} in stage {}".format(returncode, stage))
+        else:
+            self._logger.critical("Build script returned non-zero exit status {}".format(returncode))
+
+    def _run_build_script(self, build_script: str, env: dict, output: BinaryIO = None) -> int:
+        if self._resource_profile_file is None:
+            return self._build_log.run([build_script], env=env, output=output)
+
+        self._resource_profiler = ResourceProfiler(self._resource_profile_interval)
+
+        try:
+            return self._build_log.run([build_script], env=env, on_start=self._resource_profiler.start, output=output)
+        finally:
+            self._resource_profiler.stop()
+
+    def clean_up(self):
+        if self._record_build_size:
             try:
-                build_script = gen.generate_all_scripts(self._build_dir)
-            except ValidationError:
-                self._logger.critical("validation of shell scripts failed")
-                sys.exit(1)
+                record_build_size(self._project_root_dir, self._builder_name, get_directory_size(self._build_dir))
+            except OSError as e:
+                self._logger.warning("Could not record build size: {}".format(e))
 
-            self._logger.info("Calling main build script {}".format(build_script))
+        if self._keep_build_dir:
+            self._logger.info("Keeping build directory {}".format(self._build_dir))
+        elif not holds_build_dir_lock(self._build_dir):
+            # the directory might be used by another build, or scripts have not even been generated
+            self._logger.warning("Not removing build directory {} which has not been locked".format(self._build_dir))
+        else:
+            self._logger.info("Cleaning up build directory")
+            dispose_build_dir(self._build_dir, background=self._background_cleanup)
 
-            subprocess.check_call([build_script])
+    def prepare_build(self, env: dict = None) -> Tuple[str, dict]:
+        """
+        Generate the build scripts and set up the caches. finish_build() must be called afterwards in any case.
 
-            self._logger.info("Moving artifacts into project root directory")
+        :param env: environment the build script's environment is based on (default: the current environment)
+        :return: path to main build script, environment to run it with
+        :raises ValidationError: in case the generated scripts are invalid
+        :raises BuildDirInUseError: if another process uses the build directory
+        """
 
-            artifact_paths = glob.glob("{}/artifacts/*".format(self._build_dir))
+        if env is None:
+            env = os.environ
 
-            if not artifact_paths:
-                self._logger.warning("Could not find any artifacts to move to project root dir")
+        build_script = self.generate_scripts()
 
-            else:
-                for path in artifact_paths:
-                    # need to specify absolute destination path, otherwise move will raise and exception
-                    dest = os.path.join(self._project_root_dir, os.path.basename(path))
+        self._build_log = BuildLog.from_config(self._config, self._artifacts_dir)
+
+        env = self._set_up_appdir_cache(env)
+
+        if self._use_appimage_cache is not None:
+            env[AppImageCache.enable_env_var] = "1" if self._use_appimage_cache else "0"
+
+        return build_script, env
+
+    def run_build_script(self, build_script: str, env: dict, output: BinaryIO = None) -> int:
+        """
+        Run the main build script, writing its output into the build log.
+
+        :param output: stream the output is passed through to (default: stdout)
+        :return: exit status of the build script
+        """
+
+        self._logger.info("Calling main build script {}".format(build_script))
 
-                    self._logger.debug("Moving artifact {} to {}".format(path, dest))
+        returncode = self._run_build_script(build_script, env, output)
 
-                    shutil.move(path, dest)
+        self._finish_appdir_cache(returncode == 0)
 
-        except subprocess.CalledProcessError as e:
-            self._logger.critical("Build script returned non-zero exit status {}".format(e.returncode))
-            failed = True
+        if self._build_log.get_path() is not None:
+            self._logger.info("Wrote build log to {}".format(self._build_log.get_path()))
+
+        return returncode
+
+    def finish_build(self, returncode: Union[int, None]) -> Union[List[str], None]:
+        """
+        Move the artifacts of a successful build or report the failure, then report the timings and clean up.
+
+        :param returncode: exit status of the build script, None if it has not been run
+        :return: paths of the artifacts, None if the build failed
+        """
+
+        try:
+            if returncode == 0:
+                return self.move_artifacts()
+
+            if returncode is not None:
+                self._report_failure(self._build_log, returncode)
+
+            return None
 
         except Exception as e:
             self._logger.exception(e)
-            failed = True
+            return None
 
         finally:
-            self._logger.info("Cleaning up build directory")
-            shutil.rmtree(self._build_dir)
+            # discard the staging directory if the build has been interrupted
+            self._finish_appdir_cache(False)
+
+            try:
+                self.report_timings()
+            except Exception as e:
+                self._logger.warning("Could not report build stage timings: {}".format(e))
+
+            self.clean_up()
+
+    def run(self):
+        returncode = None
+
+        try:
+            try:
+                build_script, env = self.prepare_build()
+            except ValidationError:
+                self._logger.critical("validation of shell scripts failed")
+                sys.exit(1)
+
+            returncode = self.run_build_script(build_script, env)
+
+        except BuildDirInUseError as e:
+            self._logger.critical("{}".format(e))
+
+        except Exception as e:
+            self._logger.exception(e)
+
+        finally:
+            artifacts = self.finish_build(returncode)
+
+        # keep the shared caches from growing indefinitely
+        evict_all_caches()
 
-        if failed:
+        if artifacts is None:
             sys.exit(1)
@@ -0,0 +1,87 @@
+import os
+import sys
+import time
+
+from . import StandaloneCommandBase
+from ..cache import ToolCache, get_all_caches
+from ..generators import AppImageBuildScriptGenerator
+from ..parsers import AppImageCraftYMLParser
+from .._util import format_size, parse_duration, parse_size
+from .. import _logging
+
+
+# Maintains appimagecraft's shared caches
+class CacheCommand(StandaloneCommandBase):
+    def __init__(self, args):
+        super().__init__(args)
+
+        self._logger = _logging.get_logger("cache")
+
+    def _list(self):
+        for cache in get_all_caches():
+            entries = sorted(cache.entries(), key=lambda e: e.last_used, reverse=True)
+
+            print(
+                "{} cache ({}): {} entries, {}".format(
+                    cache.name, cache.get_path(), len(entries), format_size(sum((e.size for e in entries)))
+                )
+            )
+
+            for entry in entries:
+                last_used = time.strftime("%Y-%m-%d %H:%M", time.localtime(entry.last_used))
+                print("    {:>10}  {}  {}".format(format_size(entry.size), last_used, entry.description))
+
+    def _prune(self):
+        max_size = getattr(self._args, "max_cache_size", None)
+        max_age = getattr(self._args, "max_cache_age", None)
+
+        try:
+            if max_size is not None:
+                max_size = parse_size(max_size)
+
+            if max_age is not None:
+                max_age = parse_duration(max_age)
+
+        except ValueError as e:
+            self._logger.critical("{}".format(e))
+            sys.exit(1)
+
+        for cache in get_all_caches():
+            evicted = cache.evict(max_size=max_size, max_age=max_age)
+
+            self._logger.info(
+                "Evicted {} entries ({}) from {} cache".format(
+                    len(evicted), format_size(sum((e.size for e in evicted))), cache.name
+                )
+            )
+
+    def _warm(self):
+        config_file = self._args.config_file
+
+        if not os.path.exists(config_file):
+            self._logger.critical(
+                "Config file {} does not exist, cannot determine tools to download".format(config_file)
+            )
+            sys.exit(1)
+
+        config = AppImageCraftYMLParser(config_file).data()
+
+        cache = ToolCache()
+
+        for url in AppImageBuildScriptGenerator(config.get("appimage", None)).get_download_urls():
+            cache.fetch(url)
+
+    def run(self):
+        actions = {
+            "list": self._list,
+            "prune": self._prune,
+            "warm": self._warm,
+        }
+
+        command_args = getattr(self._args, "command_args", None) or ["list"]
+
+        if len(command_args) != 1 or command_args[0] not in actions:
+            self._logger.critical("Usage: cache [{}]".format("|".join(actions.keys())))
+            sys.exit(1)
+
+        actions[command_args[0]]()
@@ -0,0 +1,68 @@
+import os
+import shutil
+
+from . import StandaloneCommandBase
+from ..parsers import AppImageCraftYMLParser
+from .._build_root import BuildRootPolicy, get_auto_build_roots, get_directory_size
+from .._cleanup import find_leftover_build_dirs
+from .._util import format_size
+from .. import _logging
+
+
+# Removes build directories left behind by crashed or interrupted builds, as well as unfinished background removals
+class GcCommand(StandaloneCommandBase):
+    def __init__(self, args):
+        super().__init__(args)
+
+        self._logger = _logging.get_logger("gc")
+
+    def _get_search_dirs(self) -> list:
+        command_args = getattr(self._args, "command_args", None)
+
+        if command_args:
+            return [os.path.abspath(i) for i in command_args]
+
+        config_file = os.path.abspath(self._args.config_file)
+        project_root_dir = os.path.dirname(config_file)
+
+        if os.path.exists(config_file):
+            config = AppImageCraftYMLParser(config_file).data()
+        else:
+            config = {}
+
+        policy = BuildRootPolicy.from_config(config, getattr(self._args, "build_root", None))
+
+        # the auto build roots are shared by all projects, so they're always swept
+        rv = policy.get_search_dirs(project_root_dir) + get_auto_build_roots()
+
+        # remove duplicates, preserving the order
+        return list(dict.fromkeys(rv))
+
+    def run(self):
+        dry_run = getattr(self._args, "dry_run", False)
+
+        total_size = 0
+        count = 0
+
+        for search_dir in self._get_search_dirs():
+            self._logger.debug("Searching for leftover build directories in {}".format(search_dir))
+
+            for path in find_leftover_build_dirs(search_dir):
+                size = get_directory_size(path)
+
+                if dry_run:
+                    self._logger.info("Would remove {} ({})".format(path, format_size(size)))
+                else:
+                    self._logger.info("Removing {} ({})".format(path, format_size(size)))
+
+                    # a background removal might still be working on the same directory
+                    shutil.rmtree(path, ignore_errors=True)
+
+                total_size += size
+                count += 1
+
+        self._logger.info(
+            "{} {} leftover build directories ({})".format(
+                "Found" if dry_run else "Removed", count, format_size(total_size)
+            )
+        )
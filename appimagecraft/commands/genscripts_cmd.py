@@ -13,15 +13,41 @@ class GenerateScriptsCommand(CommandBase):
 
         self._logger = _logging.get_logger("genscripts")
 
+        # if set, the scripts are not generated, but only checked for being up to date
+        self._check_only = False
+
     def set_build_dir(self, build_dir: str):
         self._build_dir = build_dir
 
+    def set_check_only(self, check_only: bool):
+        self._check_only = check_only
+
+    def configure(self, args):
+        self.set_check_only(args.check)
+
     def _get_gen(self) -> AllBuildScriptsGenerator:
         gen = AllBuildScriptsGenerator(self._config, self._project_root_dir, self._builder_name)
 
         return gen
 
+    def _check(self):
+        gen = self._get_gen()
+
+        reasons = gen.check_scripts(self._build_dir)
+
+        if reasons:
+            for reason in reasons:
+                self._logger.error("Build scripts in {} are stale: {}".format(self._build_dir, reason))
+
+            sys.exit(1)
+
+        self._logger.info("Build scripts in {} are up to date".format(self._build_dir))
+
     def run(self):
+        if self._check_only:
+            self._check()
+            return
+
         self._logger.info("Generating build scripts in {}".format(self._build_dir))
 
         gen = self._get_gen()
@@ -0,0 +1,89 @@
+import os
+import sys
+
+from . import StandaloneCommandBase
+from ..generators import AppImageBuildScriptGenerator
+from ..parsers import AppImageCraftYMLParser
+from .._build_pool import (
+    AppImageCraftBuildJob,
+    BuildPool,
+    get_build_args,
+    get_default_parallel_builds,
+    print_summary_table,
+    write_report,
+)
+from .. import _logging
+
+
+# Builds a project with several builders and/or for several architectures concurrently
+class MatrixCommand(StandaloneCommandBase):
+    def __init__(self, args):
+        super().__init__(args)
+
+        self._logger = _logging.get_logger("matrix")
+
+    def run(self):
+        config_file = os.path.abspath(self._args.config_file)
+
+        config = AppImageCraftYMLParser(config_file).data()
+
+        project_root_dir = os.path.dirname(config_file)
+
+        builders = getattr(self._args, "command_args", None) or list((config.get("build", None) or {}).keys())
+
+        # YAML parses an unquoted null: key as None
+        builders = ["null" if b is None else str(b) for b in builders]
+
+        if not builders:
+            self._logger.critical("no builder configured in config file")
+            sys.exit(1)
+
+        # None means: use the arch from the config
+        archs = getattr(self._args, "archs", None) or [None]
+
+        artifacts_root = os.path.abspath(getattr(self._args, "artifacts_dir", None) or project_root_dir)
+
+        jobs = []
+
+        for builder_name in builders:
+            for arch in archs:
+                # name cells after the effective arch, so the summary is meaningful even without overrides
+                appimage_config = dict(config.get("appimage", None) or {})
+
+                if arch is not None:
+                    appimage_config["arch"] = arch
+
+                cell_name = "{}-{}".format(builder_name, AppImageBuildScriptGenerator(appimage_config).get_arch())
+
+                # every cell gets its own artifacts directory, otherwise builds might overwrite each other's AppImages
+                artifacts_dir = os.path.join(artifacts_root, cell_name)
+
+                job_args = ["build", "-f", config_file, "-b", builder_name, "--artifacts-dir", artifacts_dir]
+
+                if arch is not None:
+                    job_args += ["--arch", arch]
+
+                job_args += get_build_args(self._args, artifacts_dir)
+
+                jobs.append(AppImageCraftBuildJob(cell_name, job_args, artifacts_dir, project_root_dir))
+
+        cpu_budget = getattr(self._args, "cpu_budget", None)
+        max_parallel = getattr(self._args, "parallel_builds", None) or get_default_parallel_builds(
+            len(jobs), cpu_budget
+        )
+
+        self._logger.info("Running {} builds, at most {} at a time".format(len(jobs), max_parallel))
+
+        pool = BuildPool(max_parallel, cpu_budget=cpu_budget, fail_fast=getattr(self._args, "fail_fast", False))
+        results = pool.run(jobs)
+
+        print()
+        print_summary_table(results)
+
+        report_path = getattr(self._args, "report_path", None)
+
+        if report_path:
+            write_report(results, report_path)
+
+        if not all((r.succeeded() for r in results)):
+            sys.exit(1)
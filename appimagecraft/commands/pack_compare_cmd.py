@@ -0,0 +1,108 @@
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+from . import StandaloneCommandBase
+from .._build_root import get_directory_size
+from .._squashfs import SquashfsSettings, find_missing_squashfs_tools, measure_unpacking, pack_appdir
+from .._util import format_size, print_table
+from .. import _logging
+
+
+# Packs an AppDir with several squashfs settings, to help choosing between download size and startup latency
+class PackCompareCommand(StandaloneCommandBase):
+    # compared if no settings are passed on the command line
+    default_settings = ["gzip:9", "xz", "zstd:3", "zstd:19", "zstd:19:1M"]
+
+    def __init__(self, args):
+        super().__init__(args)
+
+        self._logger = _logging.get_logger("pack_compare")
+
+    def _measure(self, appdir: str, settings: SquashfsSettings, tmpdir: str) -> dict:
+        image_path = os.path.join(tmpdir, "image.squashfs")
+
+        try:
+            pack_time = pack_appdir(appdir, image_path, settings)
+            size = os.path.getsize(image_path)
+            unpack_time, unpacked_size = measure_unpacking(image_path)
+
+        finally:
+            if os.path.exists(image_path):
+                os.unlink(image_path)
+
+        return {
+            "settings": str(settings),
+            "size": size,
+            "pack_time": pack_time,
+            "unpack_time": unpack_time,
+            "unpack_throughput": unpacked_size / unpack_time if unpack_time > 0 else None,
+        }
+
+    def run(self):
+        command_args = getattr(self._args, "command_args", None) or []
+
+        if not command_args:
+            self._logger.critical(
+                "Usage: pack-compare <AppDir> [<compression>[:<level>[:<block size>[:<processors>]]]...]"
+            )
+            sys.exit(1)
+
+        appdir = os.path.abspath(command_args[0])
+
+        if not os.path.isdir(appdir):
+            self._logger.critical("{} is not a directory".format(appdir))
+            sys.exit(1)
+
+        missing_tools = find_missing_squashfs_tools()
+
+        if missing_tools:
+            self._logger.critical("Could not find required tools: {}".format(", ".join(missing_tools)))
+            sys.exit(1)
+
+        try:
+            all_settings = [SquashfsSettings.parse(spec) for spec in (command_args[1:] or self.default_settings)]
+        except ValueError as e:
+            self._logger.critical("{}".format(e))
+            sys.exit(1)
+
+        appdir_size = get_directory_size(appdir)
+
+        results = []
+
+        tmpdir = tempfile.mkdtemp(prefix="appimagecraft-pack-compare-")
+
+        try:
+            for settings in all_settings:
+                self._logger.info("Packing {} with {}".format(appdir, settings))
+                results.append(self._measure(appdir, settings, tmpdir))
+
+        finally:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+
+        rows = [("settings", "size", "ratio", "pack time", "unpack throughput")]
+
+        for result in results:
+            throughput = result["unpack_throughput"]
+
+            rows.append(
+                (
+                    result["settings"],
+                    format_size(result["size"]),
+                    "{:.1f} %".format(result["size"] / appdir_size * 100) if appdir_size else "-",
+                    "{:.1f} s".format(result["pack_time"]),
+                    "{}/s".format(format_size(throughput)) if throughput is not None else "-",
+                )
+            )
+
+        print_table(rows)
+
+        report_path = getattr(self._args, "report_path", None)
+
+        if report_path:
+            with open(report_path, "w") as f:
+                json.dump({"appdir": appdir, "appdir_size": appdir_size, "results": results}, f, indent=4)
+
+            self._logger.info("Wrote report to {}".format(report_path))
@@ -1,12 +1,25 @@
-from .bash_script import BashScriptBuilder, ProjectAwareBashScriptBuilder
-from .appimage_build_script import AppImageBuildScriptGenerator
-from .pre_post_build_scripts import PrePostBuildScriptsGenerator
-from .build_scripts import AllBuildScriptsGenerator
+from .._util import make_lazy_getattr
+
+# generators are imported on first use to keep the CLI startup fast
+__getattr__ = make_lazy_getattr(
+    __name__,
+    {
+        "BashScriptBuilder": ".bash_script",
+        "ProjectAwareBashScriptBuilder": ".bash_script",
+        "AppImageBuildScriptGenerator": ".appimage_build_script",
+        "AppDirSlimmingScriptGenerator": ".appdir_slimming",
+        "PrePostBuildScriptsGenerator": ".pre_post_build_scripts",
+        "AllBuildScriptsGenerator": ".build_scripts",
+        "GenerationManifest": ".manifest",
+    },
+)
 
 __all__ = (
     "BashScriptBuilder",
     "ProjectAwareBashScriptBuilder",
     "AppImageBuildScriptGenerator",
+    "AppDirSlimmingScriptGenerator",
     "PrePostBuildScriptsGenerator",
     "AllBuildScriptsGenerator",
+    "GenerationManifest",
 )
@@ -0,0 +1,328 @@
+import os
+import re
+import shlex
+from typing import List, Union
+
+from ..builders.jobs import JobPolicy
+from .bash_script import ProjectAwareBashScriptBuilder
+
+
+class AppDirSlimmingScriptGenerator:
+    """
+    Generates a script which slims the AppDir down after the post-build script has run, before it is packaged:
+
+    - remove: glob patterns (relative to the AppDir, ** matches any number of directories) of files which shall not be
+      packaged, e.g., headers or static libraries
+    - strip: strip ELF files (default: true), the files are processed in parallel according to the jobs policy
+    - split_debug: move the debug info into a separate <name>[-<version>]-<arch>.debug.tar.gz artifact, and add a
+      debuglink to the stripped files (default: false)
+    - dedup: replace files with identical contents by links to a single copy (true or hardlink, symlink, default:
+      false), see _generate_dedup_function() for when this is considered safe
+    - jobs: overrides the global jobs policy
+    """
+
+    _valid_keys = {"remove", "strip", "split_debug", "dedup", "jobs"}
+
+    _dedup_modes = ["hardlink", "symlink"]
+
+    # directory in the build dir which collects the debug info
+    _debug_dirname = "appdir-debug"
+
+    # file in the build dir which lists all deduplicated files
+    _dedup_report_filename = "appdir-dedup.txt"
+
+    def __init__(self, appdir_config: dict = None, global_jobs_config=None):
+        if appdir_config is None:
+            appdir_config = dict()
+
+        if not isinstance(appdir_config, dict):
+            raise ValueError("appdir: must be a dict")
+
+        invalid_keys = set(appdir_config.keys()) - self._valid_keys
+        if invalid_keys:
+            raise ValueError("Invalid key in appdir: {}".format(list(invalid_keys)[0]))
+
+        for key in ["strip", "split_debug"]:
+            if not isinstance(appdir_config.get(key, False), bool):
+                raise ValueError("appdir.{}: must be either true or false".format(key))
+
+        dedup = appdir_config.get("dedup", False)
+        if not isinstance(dedup, bool) and dedup not in self._dedup_modes:
+            raise ValueError("appdir.dedup: must be true, false or one of {}".format(", ".join(self._dedup_modes)))
+
+        self._config = appdir_config
+
+        self._job_policy = JobPolicy(appdir_config.get("jobs", global_jobs_config))
+
+    def get_remove_patterns(self) -> List[str]:
+        patterns = self._config.get("remove", None) or []
+
+        if isinstance(patterns, str):
+            patterns = [patterns]
+
+        for pattern in patterns:
+            if not isinstance(pattern, str) or not pattern:
+                raise ValueError("appdir.remove: must be a list of glob patterns")
+
+            # patterns must never match anything outside the AppDir
+            if os.path.isabs(pattern) or ".." in pattern.split("/"):
+                raise ValueError("appdir.remove: patterns must be relative to the AppDir: {}".format(pattern))
+
+        return patterns
+
+    def strip(self) -> bool:
+        return self._config.get("strip", True)
+
+    def split_debug(self) -> bool:
+        return self.strip() and self._config.get("split_debug", False)
+
+    def get_dedup_mode(self) -> Union[str, None]:
+        """
+        :return: hardlink, symlink or None if deduplication is disabled
+        """
+
+        dedup = self._config.get("dedup", False)
+
+        if dedup is True:
+            return "hardlink"
+
+        return dedup or None
+
+    @staticmethod
+    def _quote_glob(pattern: str) -> str:
+        """
+        Quote glob pattern for bash, leaving the wildcards intact.
+        """
+
+        return "".join((i if re.match(r"^[*?]+$", i) else shlex.quote(i) for i in re.split(r"([*?]+)", pattern) if i))
+
+    @staticmethod
+    def _generate_elf_check_function() -> List[str]:
+        return [
+            "appdir_is_elf() {",
+            '    [[ "$(od -An -tx1 -N4 "$1" | tr -d " \\n")" == 7f454c46 ]]',
+            "}",
+            "",
+            "export -f appdir_is_elf",
+            "",
+        ]
+
+    @staticmethod
+    def _generate_strip_function() -> List[str]:
+        return [
+            "# strip ELF file, moving its debug info into the given directory first (if any)",
+            "appdir_strip_file() {",
+            '    local path="$1"',
+            '    local debug_dir="$2"',
+            '    local debug_file=""',
+            "",
+            "    # AppImages are ELF files as well, but stripping them would remove their payload",
+            '    appdir_is_elf "$path" || return 0',
+            '    [[ "$(od -An -tx1 -j8 -N3 "$path" | tr -d " \\n")" != 414902 ]] || return 0',
+            "",
+            '    if [[ -n "$debug_dir" ]]; then',
+            '        debug_file="$debug_dir/${path#AppDir/}.debug"',
+            '        mkdir -p "$(dirname "$debug_file")"',
+            '        if ! objcopy --only-keep-debug "$path" "$debug_file"; then',
+            '            echo "Warning: could not extract debug info from $path" >&2',
+            '            rm -f "$debug_file"',
+            "            return 0",
+            "        fi",
+            "    fi",
+            "",
+            '    if ! strip --strip-unneeded "$path"; then',
+            '        echo "Warning: could not strip $path" >&2',
+            "        return 0",
+            "    fi",
+            "",
+            "    # debuggers find the debug info by the file name and checksum stored in the debuglink",
+            '    if [[ -n "$debug_file" ]] && ! objcopy --add-gnu-debuglink="$debug_file" "$path"; then',
+            '        echo "Warning: could not add debuglink to $path" >&2',
+            "    fi",
+            "}",
+            "",
+            "# the function is called by the processes started by xargs",
+            "export -f appdir_strip_file",
+            "",
+        ]
+
+    @staticmethod
+    def _generate_dedup_function() -> List[str]:
+        """
+        Generate shell function appdir_dedup <mode> <report file>.
+
+        Files are grouped by size first, and only hashed if their size collides with another file's, so the pass stays
+        cheap on large AppDirs. Of every group of identical files, the first one (in sort order) is kept. The others are
+        replaced by links to it where that is safe:
+
+        - ELF files are only replaced by symlinks to copies in the same directory (e.g., libfoo.so.1 and
+          libfoo.so.1.2), as the dynamic loader resolves $ORIGIN relative to the file, and linuxdeploy patches the rpath
+          of every ELF file in place, which would affect all hardlinked copies
+        - executables are hardlinked even in symlink mode, as they may locate their resources relative to their path
+        - files are only hardlinked if their permissions match, as hardlinks share them
+
+        Files which are hardlinked already are left alone. Hashing is done by a single process, as the output of
+        parallel sha256sum processes could interleave.
+        """
+
+        return [
+            "# replace files with identical contents by links to a single copy, see appdir.dedup",
+            "appdir_dedup() {",
+            '    local mode="$1"',
+            '    local report="$2"',
+            "    local candidates record size path hash",
+            '    local prev_size="" prev_path="" prev_hash="" keeper="" keeper_is_elf=""',
+            "    local count=0 saved=0",
+            "    local -A sizes=() permissions=()",
+            "",
+            '    candidates="$(mktemp)"',
+            '    : > "$report"',
+            "",
+            "    # only files whose size collides with another file's are hashed",
+            '    while IFS= read -r -d "" record; do',
+            '        size="${record%% *}"',
+            '        record="${record#* }"',
+            '        path="${record#* }"',
+            '        sizes["$path"]="$size"',
+            '        permissions["$path"]="${record%% *}"',
+            '        if [[ "$size" == "$prev_size" ]]; then',
+            '            if [[ -n "$prev_path" ]]; then printf \'%s\\0\' "$prev_path"; fi',
+            "            printf '%s\\0' \"$path\"",
+            '            prev_path=""',
+            "        else",
+            '            prev_path="$path"',
+            "        fi",
+            '        prev_size="$size"',
+            "    done < <(find AppDir -type f -links 1 ! -empty -printf '%s %m %p\\0' | LC_ALL=C sort -z -n) "
+            '> "$candidates"',
+            "",
+            "    # sorting by hash groups identical files, and sorts each group by path",
+            '    while IFS= read -r -d "" record; do',
+            '        hash="${record%% *}"',
+            '        path="${record#*  }"',
+            "",
+            '        if [[ "$hash" != "$prev_hash" ]]; then',
+            '            prev_hash="$hash"',
+            '            keeper="$path"',
+            '            keeper_is_elf=""',
+            "            continue",
+            "        fi",
+            "",
+            "        # identical files are either all ELF files or none of them is, most files don't have duplicates",
+            '        if [[ -z "$keeper_is_elf" ]]; then',
+            "            keeper_is_elf=0",
+            '            if appdir_is_elf "$keeper"; then keeper_is_elf=1; fi',
+            "        fi",
+            "",
+            '        if [[ "$keeper_is_elf" == 1 ]]; then',
+            '            [[ "${keeper%/*}" == "${path%/*}" ]] || continue',
+            '            ln -sfn "${keeper##*/}" "$path"',
+            '        elif [[ "$mode" == symlink ]] && (( (8#${permissions[$path]} & 8#111) == 0 )); then',
+            '            ln -sfn "$(realpath -s --relative-to="${path%/*}" "$keeper")" "$path"',
+            "        else",
+            '            [[ "${permissions[$keeper]}" == "${permissions[$path]}" ]] || continue',
+            '            ln -f "$keeper" "$path"',
+            "        fi",
+            "",
+            "        count=$(( count + 1 ))",
+            "        saved=$(( saved + sizes[$path] ))",
+            '        printf \'%s\\t%s -> %s\\n\' "${sizes[$path]}" "$path" "$keeper" >> "$report"',
+            '    done < <(xargs -0 -r sha256sum -z < "$candidates" | LC_ALL=C sort -z)',
+            "",
+            '    rm -f "$candidates"',
+            "",
+            '    echo "Deduplicated $count files, saved $(numfmt --to=iec-i --suffix=B "$saved") (see $report)"',
+            "    # awk rather than head, which would make sort fail with SIGPIPE",
+            "    LC_ALL=C sort -t $'\\t' -k1,1 -rn \"$report\" | awk 'NR <= 10' | "
+            "numfmt -d $'\\t' --to=iec-i --suffix=B | sed 's/^/    /'",
+            "}",
+            "",
+        ]
+
+    def build_file(self, path: str, project_root_dir: str, build_dir: str, project_name: str, arch: str):
+        """
+        :param project_name: used to name the debug info artifact, along with $VERSION and the architecture
+        """
+
+        gen = ProjectAwareBashScriptBuilder(path, project_root_dir, build_dir)
+
+        gen.add_lines(
+            [
+                "# the script is run from the build dir",
+                'size_before="$(du -sb AppDir | cut -f1)"',
+                "",
+            ]
+        )
+
+        patterns = self.get_remove_patterns()
+
+        if patterns:
+            gen.add_lines(
+                [
+                    "# remove files which shall not be packaged",
+                    "shopt -s globstar nullglob",
+                    "for path in {}; do".format(" ".join(("AppDir/" + self._quote_glob(p) for p in patterns))),
+                    '    rm -rf "$path"',
+                    "done",
+                    "shopt -u globstar nullglob",
+                    "",
+                ]
+            )
+
+        dedup_mode = self.get_dedup_mode()
+
+        if self.strip() or dedup_mode:
+            gen.add_lines(self._generate_elf_check_function())
+
+        if self.strip():
+            gen.add_lines(self._job_policy.generate_lines(allow_jobserver=False))
+            gen.add_line()
+
+            gen.add_lines(self._generate_strip_function())
+
+            debug_dir = ""
+
+            if self.split_debug():
+                debug_dir = self._debug_dirname
+                gen.add_lines(["rm -rf {0}".format(debug_dir), "mkdir {0}".format(debug_dir), ""])
+
+            gen.add_lines(
+                [
+                    "# only executables and shared libraries can be ELF files",
+                    "# shellcheck disable=SC2016",
+                    "find AppDir -type f \\( -perm -u+x -o -name '*.so' -o -name '*.so.*' \\) -print0 | "
+                    'xargs -0 -r -n 16 -P "$JOBS" bash -c \'for path in "${{@:2}}"; do appdir_strip_file "$path" "$1"; '
+                    "done' _ {}".format(shlex.quote(debug_dir) if debug_dir else '""'),
+                    "",
+                ]
+            )
+
+            if debug_dir:
+                gen.add_lines(
+                    [
+                        "# ship debug info as separate artifact",
+                        'if [[ -n "$(ls -A {})" ]]; then'.format(debug_dir),
+                        '    tar -C {} -czf artifacts/{}"${{VERSION:+-$VERSION}}"-{}.debug.tar.gz .'.format(
+                            debug_dir, shlex.quote(project_name), shlex.quote(arch)
+                        ),
+                        "fi",
+                        "rm -rf {}".format(debug_dir),
+                        "",
+                    ]
+                )
+
+        # stripping may make more files identical, so the AppDir is deduplicated afterwards
+        if dedup_mode:
+            gen.add_lines(self._generate_dedup_function())
+            gen.add_lines(["appdir_dedup {} {}".format(dedup_mode, self._dedup_report_filename), ""])
+
+        gen.add_lines(
+            [
+                'size_after="$(du -sb AppDir | cut -f1)"',
+                'echo "Slimmed AppDir from $(numfmt --to=iec-i --suffix=B "$size_before") to '
+                '$(numfmt --to=iec-i --suffix=B "$size_after"), '
+                'saved $(numfmt --to=iec-i --suffix=B "$(( size_before - size_after ))")"',
+            ]
+        )
+
+        gen.build_file()
@@ -1,14 +1,42 @@
+import os
 import platform
 import re
 import shlex
+from typing import Dict, List, Tuple
 from urllib.parse import urlparse
 
 from appimagecraft._logging import get_logger
 from appimagecraft._util import convert_kv_list_to_dict
+from ..cache import AppImageCache, ToolCache
+from .._squashfs import SquashfsSettings
 from .bash_script import ProjectAwareBashScriptBuilder
 
 
 class AppImageBuildScriptGenerator:
+    # environment variables linuxdeploy and its plugins read, which affect the resulting AppImage
+    _packaging_env_vars = [
+        "ARCH",
+        "VERSION",
+        "LINUXDEPLOY_OUTPUT_VERSION",
+        "OUTPUT",
+        "LDAI_OUTPUT",
+        "UPDATE_INFORMATION",
+        "LDAI_UPDATE_INFORMATION",
+        "SIGN",
+        "LDAI_SIGN",
+        "SIGN_KEY",
+        "LDAI_SIGN_KEY",
+        "NO_APPSTREAM",
+        "LDAI_NO_APPSTREAM",
+        "LDAI_COMP",
+        "NO_STRIP",
+        "LD_LIBRARY_PATH",
+        "QMAKE",
+        "EXTRA_QT_PLUGINS",
+        "EXTRA_PLATFORM_PLUGINS",
+        "DEPLOY_GTK_VERSION",
+    ]
+
     def __init__(self, ld_config: dict = None):
         if ld_config is None:
             ld_config = dict()
@@ -17,9 +45,7 @@ class AppImageBuildScriptGenerator:
 
         self._logger = get_logger("scriptgen")
 
-    def build_file(self, path: str, project_root_dir: str, build_dir: str):
-        gen = ProjectAwareBashScriptBuilder(path, project_root_dir, build_dir)
-
+    def get_arch(self) -> str:
         arch = self._config.get("arch", platform.machine())
 
         valid_archs = ["x86_64", "i386", "aarch64"]
@@ -38,45 +64,30 @@ class AppImageBuildScriptGenerator:
         if arch not in valid_archs:
             raise ValueError("Invalid arch: {}".format(arch))
 
-        url = (
+        return arch
+
+    @staticmethod
+    def get_linuxdeploy_url(arch: str) -> str:
+        return (
             "https://github.com/linuxdeploy/linuxdeploy/releases/download/continuous/"
             "linuxdeploy-{}.AppImage".format(arch)
         )
 
-        # change to custom directory
-        gen.add_lines(
-            [
-                "# switch to separate build dir",
-                "mkdir -p appimage-build",
-                "cd appimage-build",
-                "",
-            ]
+    @staticmethod
+    def get_runtime_url(arch: str) -> str:
+        # the runtime releases use a different name for i386
+        return "https://github.com/AppImage/type2-runtime/releases/download/continuous/runtime-{}".format(
+            {"i386": "i686"}.get(arch, arch)
         )
 
-        # export architecture, might be used by some people
-        gen.add_lines(
-            [
-                "export ARCH={}".format(shlex.quote(arch)),
-                "",
-            ]
-        )
+    def get_squashfs_settings(self) -> SquashfsSettings:
+        return SquashfsSettings.from_config(self._config.get("squashfs", None))
 
-        gen.add_lines(
-            [
-                "# we store all downloaded files in a separate directory so we can easily skip them when moving the artifacts around",
-                "mkdir -p downloads",
-                "pushd downloads",
-                "",
-            ]
-        )
-
-        gen.add_lines(
-            [
-                "# fetch linuxdeploy from GitHub releases",
-                "wget -c {}".format(shlex.quote(url)),
-                "chmod +x linuxdeploy-{}.AppImage".format(arch),
-            ]
-        )
+    @staticmethod
+    def _get_known_plugin_urls() -> Dict[str, str]:
+        """
+        :return: plugin name -> download URL (may contain $ARCH) of the official plugins which can be used by name
+        """
 
         def build_official_plugin_url(name: str, filename: str = None):
             if filename is None:
@@ -109,10 +120,48 @@ class AppImageBuildScriptGenerator:
         for misc_plugin_name in ["gdb", "gettext"]:
             known_plugin_urls[misc_plugin_name] = build_official_misc_plugin_url(plugin_name)
 
-        ld_plugins = {}
+        return known_plugin_urls
+
+    @staticmethod
+    def _parse_plugin_entry(plugin_entry: str, known_plugin_urls: Dict[str, str]) -> Tuple[str, str]:
+        """
+        :param plugin_entry: either the name of a known plugin or an absolute URL
+        :return: plugin name, download URL
+        """
 
         plugin_name_expr = r"^linuxdeploy-plugin-([^\s\.-]+)(?:-[^\.]+)?(?:\..+)?$"
 
+        # check whether the entry is an absolute URL
+        parsed_url = urlparse(plugin_entry)
+        is_url = parsed_url.scheme and parsed_url.netloc and parsed_url.path
+
+        if not is_url:
+            try:
+                return plugin_entry, known_plugin_urls[plugin_entry]
+            except KeyError:
+                raise ValueError("Unknown plugin: {}".format(plugin_entry))
+
+        url = plugin_entry
+        # try to detect plugin name from URL
+        filename = url.split("/")[-1]
+        match = re.match(plugin_name_expr, filename)
+
+        if not match:
+            raise ValueError("Could not detect linuxdeploy plugin name from URL {}".format(url))
+
+        return match.group(1), url
+
+    def get_plugins(self, arch: str) -> Dict[str, str]:
+        """
+        Build map of linuxdeploy plugins configured by the user.
+
+        :return: plugin name -> download URL
+        """
+
+        known_plugin_urls = self._get_known_plugin_urls()
+
+        ld_plugins = {}
+
         try:
             ld_plugins_config = (self._config.get("linuxdeploy", None) or {}).get("plugins", {})
         except KeyError:
@@ -121,82 +170,163 @@ class AppImageBuildScriptGenerator:
             # required check for empty section
             if ld_plugins_config is not None:
                 for plugin_entry in ld_plugins_config:
-                    # check whether the entry is an absolute URL
-                    parsed_url = urlparse(plugin_entry)
-                    is_url = parsed_url.scheme and parsed_url.netloc and parsed_url.path
+                    plugin_name, url = self._parse_plugin_entry(plugin_entry, known_plugin_urls)
 
-                    if is_url:
-                        url = plugin_entry
-                        # try to detect plugin name from URL
-                        filename = url.split("/")[-1]
-                        match = re.match(plugin_name_expr, filename)
+                    # allow for inserting plugin architecture dynamically
+                    ld_plugins[plugin_name] = url.replace("$ARCH", arch)
 
-                        if not match:
-                            raise ValueError("Could not detect linuxdeploy plugin name from URL {}".format(url))
+        return ld_plugins
 
-                        plugin_name = match.group(1)
+    def get_download_urls(self) -> List[str]:
+        """
+        List all files the generated script downloads, e.g., to warm the tool cache.
+        """
 
-                    else:
-                        try:
-                            url = known_plugin_urls[plugin_entry]
-                        except KeyError:
-                            raise ValueError("Unknown plugin: {}".format(plugin_entry))
+        arch = self.get_arch()
 
-                        plugin_name = plugin_entry
+        rv = [self.get_linuxdeploy_url(arch)] + list(self.get_plugins(arch).values())
 
-                    ld_plugins[plugin_name] = url
+        if self.get_squashfs_settings().needs_custom_packing():
+            rv.append(self.get_runtime_url(arch))
 
-        for plugin_name, plugin_url in ld_plugins.items():
-            # allow for inserting plugin architecture dynamically
-            plugin_url = plugin_url.replace("$ARCH", arch)
+        return rv
 
-            gen.add_lines(
-                [
-                    "# fetch {} plugin".format(plugin_name),
-                    "wget -c {}".format(shlex.quote(plugin_url)),
-                    "chmod +x linuxdeploy-plugin-{}*".format(shlex.quote(plugin_name)),
-                ]
-            )
+    @staticmethod
+    def _generate_packing_check_lines(squashfs_settings: SquashfsSettings) -> List[str]:
+        """
+        Generate commands which make sure the host's mksquashfs, which the AppDir is packed with, is available before
+        anything is built.
+        """
 
-        gen.add_line()
+        if not squashfs_settings.needs_custom_packing():
+            return []
 
-        gen.add_lines(["# we're done downloading, let's move back to the root directory", "popd", ""])
+        return [
+            "# the AppDir is packed with the host's mksquashfs, as the squashfs settings require custom packing",
+            "if ! command -v mksquashfs &>/dev/null; then",
+            '    echo "Error: mksquashfs is not available, but is needed to pack the AppImage with the configured '
+            'squashfs settings (install squashfs-tools)" >&2',
+            "    exit 1",
+            "fi",
+            "",
+        ]
 
-        # export environment vars listed in config
-        def try_export_env_vars(key_name, raw=False):
-            try:
-                env_config = (self._config.get("linuxdeploy", None) or {}).get(key_name, {})
-            except KeyError:
-                pass
+    @staticmethod
+    def _generate_packing_lines(arch: str, squashfs_settings: SquashfsSettings) -> List[str]:
+        """
+        Generate commands which pack the AppDir deployed by linuxdeploy into an AppImage, which is named like the
+        AppImage output plugin would name it.
+        """
+
+        runtime_filename = AppImageBuildScriptGenerator.get_runtime_url(arch).split("/")[-1]
+
+        return [
+            "# linuxdeploy's AppImage output plugin can't pass these squashfs settings to mksquashfs",
+            "trace_begin pack",
+            'if [ -n "${LDAI_SIGN:-${SIGN:-}}" ] || [ -n "${LDAI_UPDATE_INFORMATION:-${UPDATE_INFORMATION:-}}" ]; then',
+            '    echo "Error: signing and update information require the AppImage output plugin, which does not '
+            'support the configured squashfs settings" >&2',
+            "    exit 1",
+            "fi",
+            "",
+            'appimage_output="${LDAI_OUTPUT:-${OUTPUT:-}}"',
+            'if [ -z "$appimage_output" ]; then',
+            "    desktop_file=\"$(find ../AppDir -maxdepth 1 -name '*.desktop' | head -n1)\"",
+            '    app_name="$(grep -m1 "^Name=" "$desktop_file" | cut -d= -f2- | tr " " _)"',
+            '    app_version="${LINUXDEPLOY_OUTPUT_VERSION:-${VERSION:-}}"',
+            '    appimage_output="$app_name${app_version:+-$app_version}-$ARCH.AppImage"',
+            "fi",
+            "",
+            'mksquashfs ../AppDir appimage-payload.squashfs -root-owned -noappend "${mksquashfs_opts[@]}"',
+            'cat ./downloads/{} appimage-payload.squashfs > "$appimage_output"'.format(shlex.quote(runtime_filename)),
+            "rm appimage-payload.squashfs",
+            'chmod +x "$appimage_output"',
+            "trace_end pack",
+        ]
+
+    def use_cache(self) -> bool:
+        use_cache = self._config.get("cache", False)
+
+        if not isinstance(use_cache, bool):
+            raise ValueError("appimage.cache: must be either true or false")
+
+        return use_cache
+
+    def get_extract_mode(self) -> str:
+        """
+        :return: whether linuxdeploy and its plugins are extracted and run from the tool cache: 1, 0 or auto (only if
+            FUSE is not available)
+        """
+
+        extract = (self._config.get("linuxdeploy", None) or {}).get("extract", "auto")
+
+        if extract not in (True, False, "auto"):
+            raise ValueError("appimage.linuxdeploy.extract: must be either true, false or auto")
+
+        if extract == "auto":
+            return extract
+
+        return str(int(extract))
+
+    def _generate_extract_tools_lines(self, tool_filenames: List[str]) -> List[str]:
+        """
+        Generate commands which extract linuxdeploy and its plugins into the tool cache if requested (or FUSE is not
+        available), so they can be run without FUSE.
+
+        :param tool_filenames: filenames of linuxdeploy and its plugins in the downloads directory
+        """
+
+        rv = [
+            "# $APPIMAGECRAFT_EXTRACT_TOOLS (1, 0 or auto) overrides appimage.linuxdeploy.extract from the config",
+            'extract_tools="${{APPIMAGECRAFT_EXTRACT_TOOLS:-{}}}"'.format(self.get_extract_mode()),
+            'if [ "$extract_tools" = auto ]; then',
+            "    if [ -c /dev/fuse ] && { command -v fusermount || command -v fusermount3; } > /dev/null; then",
+            "        extract_tools=0",
+            "    else",
+            "        extract_tools=1",
+            "    fi",
+            "fi",
+            "",
+            "# run linuxdeploy and its plugins from their contents extracted into the tool cache",
+            'if [ "$extract_tools" = 1 ]; then',
+            "    trace_begin extract_tools",
+            "    rm -rf extracted",
+            "    mkdir extracted",
+        ]
+
+        # linuxdeploy finds the plugins in $PATH, so the plugins which aren't AppImages are linked as well
+        for filename in tool_filenames:
+            if filename.endswith(".AppImage"):
+                rv += [
+                    '    apprun="$(extract_cached {})"'.format(shlex.quote(filename)),
+                    '    ln -s "$apprun" extracted/{}'.format(shlex.quote(filename)),
+                ]
             else:
-                try:
-                    dict(env_config)
-                except ValueError:
-                    try:
-                        iter(env_config)
-                    except ValueError:
-                        raise ValueError("environment config is in invalid format")
-                    else:
-                        env_config = convert_kv_list_to_dict(env_config)
+                rv.append("    ln -s ../{0} extracted/{0}".format(shlex.quote(filename)))
 
-                gen.add_line("# environment variables from {}".format(key_name))
-                gen.export_env_vars(env_config, raw=raw)
+        rv += [
+            "    trace_end extract_tools",
+            "fi",
+            "",
+        ]
 
-                # add some space between this and the next block
-                gen.add_line()
+        return rv
 
-        try_export_env_vars("environment")
-        try_export_env_vars("raw_environment", raw=True)
+    def _generate_linuxdeploy_command(self, ld_plugins: Dict[str, str], squashfs_settings: SquashfsSettings) -> str:
+        """
+        :return: linuxdeploy command line with the configured plugins and extra arguments
+        """
 
-        # run linuxdeploy with the configured plugins
         ld_command = [
-            "./downloads/linuxdeploy-{}.AppImage".format(arch),
+            '"$linuxdeploy"',
             "--appdir",
             "../AppDir",
-            "--output",
-            "appimage",
         ]
 
+        # otherwise, the AppImage is packed by the generated script
+        if not squashfs_settings.needs_custom_packing():
+            ld_command += ["--output", "appimage"]
+
         for plugin_name in ld_plugins.keys():
             ld_command.append("--plugin")
             ld_command.append(shlex.quote(plugin_name))
@@ -211,7 +341,243 @@ class AppImageBuildScriptGenerator:
             else:
                 raise ValueError("Invalid type for extra_args: {}".format(type(extra_args)))
 
-        gen.add_line(" ".join(ld_command))
+        return " ".join(ld_command)
+
+    def _generate_packaging_lines(
+        self, arch: str, squashfs_settings: SquashfsSettings, env_var_names: List[str], project_name: str
+    ) -> List[str]:
+        """
+        Generate commands which run linuxdeploy (and pack the AppImage if the squashfs settings require it), unless the
+        AppImage can be restored from the AppImage cache. Expects the linuxdeploy command line in $ld_command.
+        """
+
+        # the packing options have to be part of the AppImage cache's key as well
+        key_args = '"${ld_command[@]}"'
+        rv = []
+        packing_lines = []
+
+        if squashfs_settings.needs_custom_packing():
+            rv += [
+                "# options for packing the AppDir",
+                "mksquashfs_opts=({})".format(
+                    " ".join((shlex.quote(i) for i in squashfs_settings.get_mksquashfs_args()))
+                ),
+                "",
+            ]
+
+            key_args += ' "${mksquashfs_opts[@]}"'
+            packing_lines = [""] + [
+                "    " + line if line else "" for line in self._generate_packing_lines(arch, squashfs_settings)
+            ]
+
+        rv += AppImageCache.generate_cache_functions()
+
+        rv += [
+            "# $APPIMAGECRAFT_APPIMAGE_CACHE (1 or 0) overrides appimage.cache from the config",
+            'use_appimage_cache="${{{}:-{}}}"'.format(AppImageCache.enable_env_var, int(self.use_cache())),
+            'appimage_cache_entry=""',
+            "",
+            'if [ "$use_appimage_cache" = 1 ]; then',
+            "    trace_begin appimage_cache_key",
+            '    appimage_cache_entry="$(appimage_cache_key ../AppDir {} {})"'.format(
+                shlex.quote(" ".join(sorted(set(env_var_names)))), key_args
+            ),
+            "    trace_end appimage_cache_key",
+            "fi",
+            "",
+            "# skip linuxdeploy if the AppImage has been built from the same AppDir and inputs before",
+            'if [ -n "$appimage_cache_entry" ] && [ -f "$appimage_cache_dir/$appimage_cache_entry/info" ]; then',
+            '    echo "AppDir and packaging inputs are unchanged, reusing AppImage from cache"',
+            "    trace_begin restore_appimage",
+            '    appimage_cache_restore "$appimage_cache_entry"',
+            "    trace_end restore_appimage",
+            "else",
+            "    trace_begin linuxdeploy",
+            '    "${ld_command[@]}"',
+            "    trace_end linuxdeploy",
+        ]
+
+        rv += packing_lines
+
+        rv += [
+            "",
+            '    if [ -n "$appimage_cache_entry" ]; then',
+            "        trace_begin store_appimage",
+            '        appimage_cache_store "$appimage_cache_entry" {}'.format(shlex.quote(project_name)),
+            "        trace_end store_appimage",
+            "    fi",
+            "fi",
+        ]
+
+        return rv
+
+    def _export_env_vars(
+        self, gen: ProjectAwareBashScriptBuilder, key_name: str, env_var_names: List[str], raw: bool = False
+    ):
+        """
+        Export environment variables from the linuxdeploy section.
+
+        :param env_var_names: names of the exported variables are appended to this list
+        """
+
+        try:
+            env_config = (self._config.get("linuxdeploy", None) or {}).get(key_name, {})
+        except KeyError:
+            pass
+        else:
+            try:
+                dict(env_config)
+            except ValueError:
+                try:
+                    iter(env_config)
+                except ValueError:
+                    raise ValueError("environment config is in invalid format")
+                else:
+                    env_config = convert_kv_list_to_dict(env_config)
+
+            gen.add_line("# environment variables from {}".format(key_name))
+            gen.export_env_vars(env_config, raw=raw)
+
+            env_var_names.extend(env_config.keys())
+
+            # add some space between this and the next block
+            gen.add_line()
+
+    def build_file(
+        self,
+        path: str,
+        project_root_dir: str,
+        build_dir: str,
+        env_var_names: List[str] = None,
+        project_name: str = None,
+    ):
+        """
+        :param env_var_names: names of environment variables exported by the calling script, which might affect
+            linuxdeploy
+        :param project_name: used to describe the AppImage cache's entries (default: project root dir's name)
+        """
+
+        if project_name is None:
+            project_name = os.path.basename(os.path.abspath(project_root_dir))
+
+        gen = ProjectAwareBashScriptBuilder(path, project_root_dir, build_dir)
+
+        if env_var_names is None:
+            env_var_names = []
+
+        # the environment variables set in the linuxdeploy section are added below
+        env_var_names = self._packaging_env_vars + list(env_var_names)
+
+        arch = self.get_arch()
+
+        url = self.get_linuxdeploy_url(arch)
+
+        # change to custom directory
+        gen.add_lines(
+            [
+                "# switch to separate build dir",
+                "mkdir -p appimage-build",
+                "cd appimage-build",
+                "",
+            ]
+        )
+
+        # export architecture, might be used by some people
+        gen.add_lines(
+            [
+                "export ARCH={}".format(shlex.quote(arch)),
+                "",
+            ]
+        )
+
+        squashfs_settings = self.get_squashfs_settings()
+        gen.add_lines(self._generate_packing_check_lines(squashfs_settings))
+
+        gen.add_lines(ToolCache.generate_fetch_function())
+        gen.add_lines(ToolCache.generate_extract_function())
+
+        gen.add_lines(
+            [
+                "# we store all downloaded files in a separate directory so we can easily skip them when moving the artifacts around",
+                "mkdir -p downloads",
+                "pushd downloads",
+                "",
+            ]
+        )
+
+        gen.begin_stage("download")
+
+        gen.add_lines(
+            [
+                "# fetch linuxdeploy from GitHub releases",
+                "fetch_cached {} {}".format(shlex.quote(url), shlex.quote(url.split("/")[-1])),
+                "chmod +x linuxdeploy-{}.AppImage".format(arch),
+            ]
+        )
+
+        ld_plugins = self.get_plugins(arch)
+
+        for plugin_name, plugin_url in ld_plugins.items():
+            gen.add_lines(
+                [
+                    "# fetch {} plugin".format(plugin_name),
+                    "fetch_cached {} {}".format(shlex.quote(plugin_url), shlex.quote(plugin_url.split("/")[-1])),
+                    "chmod +x linuxdeploy-plugin-{}*".format(shlex.quote(plugin_name)),
+                ]
+            )
+
+        if squashfs_settings.needs_custom_packing():
+            runtime_url = self.get_runtime_url(arch)
+
+            gen.add_lines(
+                [
+                    "# fetch AppImage runtime",
+                    "fetch_cached {} {}".format(shlex.quote(runtime_url), shlex.quote(runtime_url.split("/")[-1])),
+                ]
+            )
+
+        gen.end_stage("download")
+        gen.add_line()
+
+        ld_filename = url.split("/")[-1]
+        tool_filenames = [ld_filename] + [plugin_url.split("/")[-1] for plugin_url in ld_plugins.values()]
+
+        gen.add_lines(self._generate_extract_tools_lines(tool_filenames))
+
+        gen.add_lines(["# we're done downloading, let's move back to the root directory", "popd", ""])
+
+        gen.add_lines(
+            [
+                'if [ "$extract_tools" = 1 ]; then',
+                "    linuxdeploy=./downloads/extracted/{}".format(shlex.quote(ld_filename)),
+                '    export PATH="$PWD/downloads/extracted:$PATH"',
+                "else",
+                "    linuxdeploy=./downloads/{}".format(shlex.quote(ld_filename)),
+                "fi",
+                "",
+            ]
+        )
+
+        # can be overridden in the linuxdeploy section's environment
+        if squashfs_settings.compression is not None:
+            gen.add_line("# squashfs compression, used by linuxdeploy's AppImage output plugin")
+            gen.export_env_var("LDAI_COMP", squashfs_settings.compression)
+            gen.add_line()
+
+        # export environment vars listed in config
+        self._export_env_vars(gen, "environment", env_var_names)
+        self._export_env_vars(gen, "raw_environment", env_var_names, raw=True)
+
+        # run linuxdeploy with the configured plugins
+        gen.add_lines(
+            [
+                "# linuxdeploy command line",
+                "ld_command=({})".format(self._generate_linuxdeploy_command(ld_plugins, squashfs_settings)),
+                "",
+            ]
+        )
+
+        gen.add_lines(self._generate_packaging_lines(arch, squashfs_settings, env_var_names, project_name))
 
         gen.add_lines(
             [
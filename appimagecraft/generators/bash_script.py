@@ -3,6 +3,7 @@ import shlex
 from typing import List, TextIO
 
 from .._logging import get_logger
+from .._trace import generate_trace_functions
 
 
 class BashScriptBuilder:
@@ -69,12 +70,33 @@ class BashScriptBuilder:
 
         return rv
 
-    def build_file(self):
-        with open(self._path, "w") as f:
-            f.write(self.build_string())
+    def build_file(self) -> bool:
+        """
+        Write script to file. The file is left untouched if its content is up to date already, which preserves its
+        mtime for tools which rely on it.
+
+        :return: whether the file has been written
+        """
+
+        data = self.build_string()
+
+        try:
+            with open(self._path) as f:
+                up_to_date = f.read() == data
+        except (FileNotFoundError, UnicodeDecodeError):
+            up_to_date = False
+
+        if up_to_date:
+            self._logger.debug("{} is up to date".format(self._path))
+        else:
+            with open(self._path, "w") as f:
+                f.write(data)
 
         # shell scripts are supposed to be executable
-        os.chmod(self._path, 0o755)
+        if os.stat(self._path).st_mode & 0o777 != 0o755:
+            os.chmod(self._path, 0o755)
+
+        return not up_to_date
 
 
 class ProjectAwareBashScriptBuilder(BashScriptBuilder):
@@ -92,3 +114,19 @@ class ProjectAwareBashScriptBuilder(BashScriptBuilder):
         self.export_env_var("PROJECT_ROOT", project_root_dir)
         self.export_env_var("BUILD_DIR", build_dir)
         self.add_line()
+
+        self.add_lines(generate_trace_functions())
+
+    def begin_stage(self, name: str):
+        """
+        Record begin of a build stage in the timings file (see _trace).
+        """
+
+        self.add_line("trace_begin {}".format(shlex.quote(name)))
+
+        return self
+
+    def end_stage(self, name: str):
+        self.add_line("trace_end {}".format(shlex.quote(name)))
+
+        return self
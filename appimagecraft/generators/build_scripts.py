@@ -1,18 +1,33 @@
+import hashlib
+import json
 import os.path
+import platform
 import shlex
+from typing import List, Union
 
-from appimagecraft.validators import ShellCheckValidator, ValidationError
-from ..builders import CMakeBuilder, AutotoolsBuilder, QMakeBuilder, ScriptBuilder
+from ..validators.util import validate_files
+from .. import builders
 from .._logging import get_logger
 from .._util import convert_kv_list_to_dict
 from . import (
     ProjectAwareBashScriptBuilder,
+    AppDirSlimmingScriptGenerator,
     AppImageBuildScriptGenerator,
     PrePostBuildScriptsGenerator,
 )
+from .manifest import GenerationManifest, get_appimagecraft_version, get_code_fingerprint
+
+# set by appimagecraft to the cached AppDir to restore instead of running the builder, see AppDirCache
+APPDIR_CACHE_RESTORE_ENV_VAR = "APPIMAGECRAFT_APPDIR_CACHE_RESTORE"
+
+# set by appimagecraft to the staging directory the AppDir is copied into after the builder has run
+APPDIR_CACHE_STAGING_ENV_VAR = "APPIMAGECRAFT_APPDIR_CACHE_STAGING"
 
 
 class AllBuildScriptsGenerator:
+    _appimage_script_filename = "build-appimage.sh"
+    _slimming_script_filename = "slim-appdir.sh"
+
     def __init__(self, config: dict, project_root_dir: str, builder_name: str):
         self._config = config
 
@@ -21,6 +36,65 @@ class AllBuildScriptsGenerator:
 
         self._logger = get_logger("script_gen")
 
+    def _get_env_var_names(self) -> list:
+        """
+        :return: names of the user specified environment variables exported by the main script
+        """
+
+        build_env_vars = self._config.get("environment") or {}
+
+        if isinstance(build_env_vars, list):
+            build_env_vars = convert_kv_list_to_dict(build_env_vars)
+
+        return list(build_env_vars.keys())
+
+    def _add_packaging_stages(self, main_script_gen: ProjectAwareBashScriptBuilder, build_dir: str):
+        """
+        Generate the AppImage build script (and the AppDir slimming script, if enabled), and add the stages calling them
+        to the main script.
+        """
+
+        project_config = self._config["project"]
+
+        # set up AppImage build script
+        appimage_build_config = self._config.get("appimage", None)
+
+        appimage_script_path = os.path.join(build_dir, self._appimage_script_filename)
+
+        appimage_script_gen = AppImageBuildScriptGenerator(appimage_build_config)
+        appimage_script_gen.build_file(
+            appimage_script_path,
+            self._project_root_dir,
+            build_dir,
+            env_var_names=self._get_env_var_names(),
+            project_name=project_config.get("name"),
+        )
+
+        # slim down AppDir before it's packaged
+        if self._use_slimming():
+            slimming_script_path = os.path.join(build_dir, self._slimming_script_filename)
+
+            slimming_script_gen = AppDirSlimmingScriptGenerator(self._config["appdir"], self._config.get("jobs", None))
+            slimming_script_gen.build_file(
+                slimming_script_path,
+                self._project_root_dir,
+                build_dir,
+                project_config.get("name") or os.path.basename(os.path.abspath(self._project_root_dir)),
+                appimage_script_gen.get_arch(),
+            )
+
+            main_script_gen.add_line("# slim down AppDir")
+            main_script_gen.begin_stage("slim_appdir")
+            main_script_gen.add_line("(source {})".format(shlex.quote(slimming_script_path)))
+            main_script_gen.end_stage("slim_appdir")
+            main_script_gen.add_line()
+
+        # call AppImage build script
+        main_script_gen.add_line("# build AppImage")
+        main_script_gen.begin_stage("appimage")
+        main_script_gen.add_line("(source {})".format(shlex.quote(appimage_script_path)))
+        main_script_gen.end_stage("appimage")
+
     def _generate_main_script(self, build_dir: str, build_scripts: dict) -> str:
         project_config = self._config["project"]
 
@@ -60,8 +134,17 @@ class AllBuildScriptsGenerator:
                 "# create artifacts directory (called scripts shall put their build results into this directory)",
                 "[ ! -d artifacts ] && mkdir artifacts",
                 "",
+                "# remove AppDir left over by a previous build in this directory (e.g., incremental builds)",
+                "# otherwise, files which are no longer installed would end up in the AppImage",
+                "# --one-file-system makes sure we never descend into anything mounted into the AppDir",
+                "[ -d AppDir ] && rm -rf --one-file-system ./AppDir",
+                "",
                 "# call pre-build script (if available)",
-                "[ -f pre_build.sh ] && bash pre_build.sh",
+                "if [ -f pre_build.sh ]; then",
+                "    trace_begin pre_build",
+                "    bash pre_build.sh",
+                "    trace_end pre_build",
+                "fi",
                 "",
                 "# create AppDir so that tools which are sensitive to that won't complain",
                 "mkdir -p AppDir",
@@ -77,7 +160,23 @@ class AllBuildScriptsGenerator:
             main_script_gen.add_lines(
                 [
                     "# call script for main builder {}".format(self._builder_name),
-                    "(source {})".format(build_scripts[self._builder_name]),
+                    "# appimagecraft skips the builder if the AppDir has been built from the same inputs before",
+                    'if [ -n "${{{}:-}}" ]; then'.format(APPDIR_CACHE_RESTORE_ENV_VAR),
+                    "    trace_begin restore_appdir",
+                    '    cp -a --reflink=auto "${}"/. AppDir/'.format(APPDIR_CACHE_RESTORE_ENV_VAR),
+                    "    trace_end restore_appdir",
+                    "else",
+                    "    trace_begin build",
+                    "    (source {})".format(build_scripts[self._builder_name]),
+                    "    trace_end build",
+                    "",
+                    "    # the following stages modify the AppDir, so a copy is stored in the cache",
+                    '    if [ -n "${{{}:-}}" ]; then'.format(APPDIR_CACHE_STAGING_ENV_VAR),
+                    "        trace_begin store_appdir",
+                    '        cp -a --reflink=auto AppDir "${}"/AppDir'.format(APPDIR_CACHE_STAGING_ENV_VAR),
+                    "        trace_end store_appdir",
+                    "    fi",
+                    "fi",
                 ]
             )
 
@@ -108,84 +207,201 @@ class AllBuildScriptsGenerator:
             [
                 "",
                 "# call post-build script (if available)",
-                "[ -f post_build.sh ] && (source post_build.sh)",
+                "if [ -f post_build.sh ]; then",
+                "    trace_begin post_build",
+                "    (source post_build.sh)",
+                "    trace_end post_build",
+                "fi",
                 "",
             ]
         )
 
-        # set up AppImage build script
-        appimage_build_config = self._config.get("appimage", None)
-
-        appimage_script_path = os.path.join(build_dir, "build-appimage.sh")
-
-        appimage_script_gen = AppImageBuildScriptGenerator(appimage_build_config)
-        appimage_script_gen.build_file(appimage_script_path, self._project_root_dir, build_dir)
-
-        # call AppImage build script
-        main_script_gen.add_line("# build AppImage")
-        main_script_gen.add_line("(source {})".format(shlex.quote(appimage_script_path)))
+        self._add_packaging_stages(main_script_gen, build_dir)
 
         # (re-)create script file
         main_script_gen.build_file()
 
         return main_script_path
 
-    def generate_builder_scripts(self, build_dir: str) -> dict:
-        build_config: dict = self._config["build"]
+    def _use_slimming(self) -> bool:
+        # an empty appdir section enables the defaults
+        return "appdir" in self._config
 
-        # generate build configs for every
+    def _create_builder(self, builder_name: str):
+        """
+        :return: builder, or None if there is no builder with the given name
+        """
+
+        # builders are looked up by class name, so only the ones actually configured are imported
         builders_map = {
-            "cmake": CMakeBuilder,
-            "autotools": AutotoolsBuilder,
-            "qmake": QMakeBuilder,
-            "script": ScriptBuilder,
+            "cmake": "CMakeBuilder",
+            "autotools": "AutotoolsBuilder",
+            "qmake": "QMakeBuilder",
+            "script": "ScriptBuilder",
         }
 
+        builder_config = self._config["build"].get(builder_name, None) or {}
+
+        # builders inherit global settings unless they override them
+        for key in ["compiler_cache", "jobs"]:
+            if key in self._config and key not in builder_config:
+                builder_config = dict(builder_config, **{key: self._config[key]})
+
+        try:
+            return getattr(builders, builders_map[builder_name])(builder_config)
+        except KeyError:
+            self._logger.error("No builder named {} available, skipping".format(builder_name))
+            return None
+
+    def generate_builder_scripts(self, build_dir: str) -> dict:
+        build_config: dict = self._config["build"]
+
         build_scripts = {}
 
+        # generate build configs for every builder
         for builder_name in build_config.keys():
             # skip null builder
             if self._is_null_builder(builder_name):
                 get_logger().debug("skipping generation of build script for null builder")
                 continue
 
-            try:
-                builder = builders_map[builder_name](build_config[builder_name])
-            except KeyError:
-                self._logger.error("No builder named {} available, skipping".format(builder_name))
-                continue
-            else:
+            builder = self._create_builder(builder_name)
+
+            if builder is not None:
                 script_filename = builder.generate_build_script(self._project_root_dir, build_dir)
                 build_scripts[builder_name] = script_filename
 
         return build_scripts
 
-    def generate_pre_post_build_scripts(self, build_dir: str):
+    def get_source_dir(self) -> Union[str, None]:
+        """
+        :return: directory the selected builder builds from, or None for the null builder
+        """
+
+        if self._is_null_builder(self._builder_name):
+            return None
+
+        builder = self._create_builder(self._builder_name)
+
+        if builder is None:
+            return None
+
+        return builder.get_source_dir(self._project_root_dir)
+
+    def get_appdir_scripts(self, build_dir: str) -> List[str]:
+        """
+        :return: paths of the scripts which run up to and including the builder stage, i.e., the ones the AppDir
+            produced by the builder depends on
+        """
+
+        if self._is_null_builder(self._builder_name):
+            return []
+
+        # builders name their scripts build-<builder>.sh
+        filenames = ["build.sh", "pre_build.sh", "build-{}.sh".format(self._builder_name)]
+
+        return [os.path.join(build_dir, f) for f in filenames if os.path.exists(os.path.join(build_dir, f))]
+
+    def generate_pre_post_build_scripts(self, build_dir: str) -> list:
         gen = PrePostBuildScriptsGenerator(self._config.get("scripts", None))
-        gen.build_files(self._project_root_dir, build_dir)
+        return gen.build_files(self._project_root_dir, build_dir)
+
+    def get_inputs_hash(self, build_dir: str) -> str:
+        """
+        Calculate hash of everything the generated scripts depend on.
+        """
+
+        inputs = {
+            "config": self._config,
+            "project_root_dir": self._project_root_dir,
+            "build_dir": os.path.abspath(build_dir),
+            "builder_name": self._builder_name,
+            # the AppImage is built for the current machine's architecture unless configured otherwise
+            "machine": platform.machine(),
+            "appimagecraft_version": get_appimagecraft_version(),
+            "code_fingerprint": get_code_fingerprint(),
+        }
+
+        # the order of the config's keys is stable, as it's parsed from the same file (keys can't be sorted anyway, the
+        # null builder's key is None)
+        data = json.dumps(inputs, default=str)
+
+        return hashlib.sha256(data.encode()).hexdigest()
+
+    def check_scripts(self, build_dir: str, inputs_hash: str = None, manifest: GenerationManifest = None) -> List[str]:
+        """
+        Check whether the scripts in the build dir are up to date.
+
+        :param inputs_hash: result of get_inputs_hash(), if available already
+        :param manifest: manifest loaded from the build dir, if available already
+        :return: reasons why the scripts are stale (empty if they are up to date)
+        """
+
+        if inputs_hash is None:
+            inputs_hash = self.get_inputs_hash(build_dir)
+
+        if manifest is None:
+            manifest = GenerationManifest.load(build_dir)
+
+        if manifest is None:
+            return ["no generation manifest found in build dir"]
+
+        if manifest.inputs_hash != inputs_hash:
+            return ["config or appimagecraft changed since scripts were generated"]
+
+        return ["{} is missing or has been modified".format(f) for f in manifest.find_stale_scripts(build_dir)]
 
     def generate_all_scripts(self, build_dir) -> str:
         if build_dir is None:
             raise ValueError("build dir has not been set")
 
-        self.generate_pre_post_build_scripts(build_dir)
+        inputs_hash = self.get_inputs_hash(build_dir)
+        previous_manifest = GenerationManifest.load(build_dir)
+
+        # skip generation entirely if the scripts have been generated from the same inputs before
+        # the manifest is only written once the scripts have passed validation
+        if not self.check_scripts(build_dir, inputs_hash, previous_manifest):
+            self._logger.info("Build scripts are up to date, skipping generation")
+            return os.path.join(build_dir, previous_manifest.main_script)
+
+        script_paths = self.generate_pre_post_build_scripts(build_dir)
 
         build_scripts = self.generate_builder_scripts(build_dir)
+        script_paths += [os.path.join(build_dir, filename) for filename in build_scripts.values()]
 
         main_script_path = self._generate_main_script(build_dir, build_scripts)
+        script_paths += [os.path.join(build_dir, self._appimage_script_filename), main_script_path]
 
-        # validate script(s), if possible
-        if ShellCheckValidator.is_available():
-            self._logger.debug("validating scripts with shellcheck")
-            validator = ShellCheckValidator()
+        if self._use_slimming():
+            script_paths.append(os.path.join(build_dir, self._slimming_script_filename))
 
-            validator.validate(main_script_path)
+        if previous_manifest is not None:
+            self._remove_stale_scripts(build_dir, previous_manifest, script_paths)
 
-        else:
-            self._logger.debug("shellcheck validator not available, skipping validation")
+        # validate all scripts with the available validators (e.g., shellcheck, if installed)
+        validate_files(script_paths)
+
+        manifest = GenerationManifest.from_build_dir(build_dir, main_script_path, script_paths, inputs_hash)
+        manifest.save(build_dir)
 
         return main_script_path
 
+    def _remove_stale_scripts(self, build_dir: str, previous_manifest: GenerationManifest, script_paths: List[str]):
+        """
+        Remove scripts generated for a previous config which the current config doesn't produce anymore. Otherwise,
+        the main script would still call, e.g., a pre-build script which has been removed from the config.
+        """
+
+        current_scripts = {os.path.relpath(path, build_dir) for path in script_paths}
+
+        for filename in sorted(set(previous_manifest.scripts) - current_scripts):
+            self._logger.debug("Removing stale script {}".format(filename))
+
+            try:
+                os.unlink(os.path.join(build_dir, filename))
+            except FileNotFoundError:
+                pass
+
     @staticmethod
     def _is_null_builder(builder_name):
         return builder_name is None or builder_name.lower() == "null"
@@ -0,0 +1,143 @@
+import hashlib
+import json
+import os
+from typing import Dict, List, Union
+
+from .._logging import get_logger
+
+
+def hash_file(path: str) -> str:
+    hasher = hashlib.sha256()
+
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            hasher.update(chunk)
+
+    return hasher.hexdigest()
+
+
+def get_appimagecraft_version() -> str:
+    # importlib.metadata is rather expensive to import, and only needed when generating scripts
+    import importlib.metadata
+
+    try:
+        return importlib.metadata.version("appimagecraft")
+    except importlib.metadata.PackageNotFoundError:
+        return "unknown"
+
+
+def get_code_fingerprint() -> str:
+    """
+    Calculate a fingerprint of appimagecraft's own code, so that scripts are regenerated when appimagecraft is
+    changed, even if its version number stays the same (e.g., during development).
+    """
+
+    package_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+    hasher = hashlib.sha256()
+
+    for dirpath, dirnames, filenames in os.walk(package_dir):
+        dirnames.sort()
+
+        for filename in sorted(filenames):
+            if not filename.endswith(".py"):
+                continue
+
+            path = os.path.join(dirpath, filename)
+            stat = os.stat(path)
+
+            hasher.update(
+                "{} {} {}\n".format(os.path.relpath(path, package_dir), stat.st_size, stat.st_mtime_ns).encode()
+            )
+
+    return hasher.hexdigest()
+
+
+class GenerationManifest:
+    """
+    Records the inputs the scripts in a build directory have been generated from, as well as the hashes of the
+    generated scripts. This allows for skipping the generation entirely if nothing has changed, and for detecting
+    stale scripts.
+
+    :param inputs_hash: hash of everything the generated scripts depend on (config, builder, directories, ...)
+    :param scripts: script filename (relative to the build directory) -> sha256 of its contents
+    """
+
+    filename = "appimagecraft-manifest.json"
+
+    _format_version = 1
+
+    def __init__(self, inputs_hash: str, main_script: str, scripts: Dict[str, str], appimagecraft_version: str = None):
+        self.inputs_hash = inputs_hash
+        self.main_script = main_script
+        self.scripts = scripts
+
+        if appimagecraft_version is None:
+            appimagecraft_version = get_appimagecraft_version()
+
+        self.appimagecraft_version = appimagecraft_version
+
+    @classmethod
+    def from_build_dir(cls, build_dir: str, main_script_path: str, script_paths: List[str], inputs_hash: str):
+        """
+        Create manifest for scripts which have just been generated in the build dir.
+        """
+
+        scripts = {os.path.relpath(path, build_dir): hash_file(path) for path in script_paths}
+
+        return cls(inputs_hash, os.path.relpath(main_script_path, build_dir), scripts)
+
+    @classmethod
+    def load(cls, build_dir: str) -> Union["GenerationManifest", None]:
+        """
+        Load manifest from build dir.
+
+        :return: manifest, or None if there is no (valid) manifest
+        """
+
+        try:
+            with open(os.path.join(build_dir, cls.filename)) as f:
+                data = json.load(f)
+
+            if data["format_version"] != cls._format_version:
+                return None
+
+            return cls(data["inputs_hash"], data["main_script"], data["scripts"], data["appimagecraft_version"])
+
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            get_logger("manifest").debug("could not load manifest from {}: {}".format(build_dir, e))
+            return None
+
+    def save(self, build_dir: str):
+        data = {
+            "format_version": self._format_version,
+            "appimagecraft_version": self.appimagecraft_version,
+            "inputs_hash": self.inputs_hash,
+            "main_script": self.main_script,
+            "scripts": self.scripts,
+        }
+
+        path = os.path.join(build_dir, self.filename)
+
+        with open(path + ".tmp", "w") as f:
+            json.dump(data, f, indent=4, sort_keys=True)
+
+        os.rename(path + ".tmp", path)
+
+    def find_stale_scripts(self, build_dir: str) -> List[str]:
+        """
+        Compare the scripts on disk to the recorded hashes.
+
+        :return: filenames of scripts which are missing or have been modified
+        """
+
+        rv = []
+
+        for filename, digest in self.scripts.items():
+            try:
+                if hash_file(os.path.join(build_dir, filename)) != digest:
+                    rv.append(filename)
+            except FileNotFoundError:
+                rv.append(filename)
+
+        return rv
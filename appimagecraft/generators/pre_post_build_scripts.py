@@ -12,7 +12,11 @@ class PrePostBuildScriptsGenerator:
 
         self._config = scripts_config
 
-    def build_files(self, project_root_dir: str, build_dir: str):
+    def build_files(self, project_root_dir: str, build_dir: str) -> List[str]:
+        """
+        :return: paths of the generated scripts
+        """
+
         def write_build_script(path: str, lines: List[str]):
             gen = ProjectAwareBashScriptBuilder(path, project_root_dir, build_dir)
             gen.add_lines(lines)
@@ -25,10 +29,16 @@ class PrePostBuildScriptsGenerator:
         if invalid_stages:
             raise ValueError("Invalid script stage: {}".format(list(invalid_stages)[0]))
 
+        rv = []
+
         for stage in stages:
             try:
                 script_lines = self._config["{}".format(stage)]
             except KeyError:
                 pass
             else:
-                write_build_script(os.path.join(build_dir, "{}.sh".format(stage)), script_lines)
+                path = os.path.join(build_dir, "{}.sh".format(stage))
+                write_build_script(path, script_lines)
+                rv.append(path)
+
+        return rv
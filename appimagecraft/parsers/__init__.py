@@ -1,4 +1,7 @@
-from appimagecraft.parsers.appimagecraft_yml import AppImageCraftYMLParser
+from .._util import make_lazy_getattr
+
+# the YAML parser is imported on first use, as some commands don't need to parse a config
+__getattr__ = make_lazy_getattr(__name__, {"AppImageCraftYMLParser": ".appimagecraft_yml"})
 
 
 __all__ = ("AppImageCraftYMLParser",)
@@ -1,6 +1,9 @@
 import os.path
 import yaml
 
+# libyaml's loader is a lot faster than the pure Python implementation, but PyYAML might have been built without it
+_SafeLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
 
 class AppImageCraftYMLParser:
     def __init__(self, config_path):
@@ -15,7 +18,7 @@ class AppImageCraftYMLParser:
 
     def _parse(self):
         with open(self._config_path, "r") as f:
-            self._data = yaml.safe_load(f.read())
+            self._data = yaml.load(f, Loader=_SafeLoader)
 
     def data(self):
         return dict(self._data)
@@ -40,7 +43,20 @@ class AppImageCraftYMLParser:
             _assert(data.count(".") > 0, message)
             # TODO: check there's at least one char between periods
 
-        valid_root_keys = {"version", "project", "build", "environment", "appimage", "scripts"}
+        valid_root_keys = {
+            "version",
+            "project",
+            "build",
+            "environment",
+            "appimage",
+            "scripts",
+            "compiler_cache",
+            "jobs",
+            "build_root",
+            "build_log",
+            "appdir_cache",
+            "appdir",
+        }
         required_root_keys = {"version", "project", "build"}
 
         all_root_keys = set(c.keys())
@@ -1,6 +1,14 @@
-from .base import ValidatorBase
-from .shellcheck import ShellCheckValidator
-from .exceptions import ValidationError
+from .._util import make_lazy_getattr
+
+# validators are imported on first use to keep the CLI startup fast
+__getattr__ = make_lazy_getattr(
+    __name__,
+    {
+        "ValidatorBase": ".base",
+        "ShellCheckValidator": ".shellcheck",
+        "ValidationError": ".exceptions",
+    },
+)
 
 
 __all__ = ("ValidatorBase", "ShellCheckValidator", "ValidationError")
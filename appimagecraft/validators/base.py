@@ -1,5 +1,7 @@
 from typing import List
 
+from .exceptions import ValidationError
+
 
 class ValidatorBase:
     def __init__(self):
@@ -38,3 +40,23 @@ class ValidatorBase:
         """
 
         raise NotImplementedError
+
+    def validate_files(self, paths: List[str]):
+        """
+        Validate several files. All files are validated, even if validation of one of them fails. Validators may
+        override this method to validate files more efficiently, e.g., with a single call of an external tool.
+
+        :param paths: paths to files that shall be validated
+        :raises ValidationError: in case validation of any of the files fails, listing all failed files
+        """
+
+        failed = []
+
+        for path in paths:
+            try:
+                self.validate(path)
+            except ValidationError:
+                failed.append(path)
+
+        if failed:
+            raise ValidationError("validation failed for files: {}".format(", ".join(failed)))
@@ -1,16 +1,26 @@
 import os
 import shutil
+import subprocess
+import sys
+from typing import List
 
 from . import ValidatorBase
 from .exceptions import ValidationError
-
-from subprocess import CalledProcessError, check_call
+from ..cache import ShellCheckResultCache
+from .._logging import get_logger
 
 
 class ShellCheckValidator(ValidatorBase):
+    # SC2116 can be ignored safely, it's just about a "useless echo", but we want to test the version_cmd feature with
+    # an echo call
+    # every script is checked on its own, so we don't need shellcheck to follow the files they source (SC1091)
+    _shellcheck_args = ["-e", "SC2116", "-e", "SC1091"]
+
     def __init__(self):
         super().__init__()
 
+        self._logger = get_logger("shellcheck")
+
     @staticmethod
     def _find_shellcheck():
         shellcheck_env = os.environ.get("SHELLCHECK", None)
@@ -28,15 +38,81 @@ class ShellCheckValidator(ValidatorBase):
     def supported_file_types():
         return ["*.sh", "*.bash"]
 
+    @staticmethod
+    def _get_version(shellcheck_path: str) -> str:
+        try:
+            output = subprocess.check_output([shellcheck_path, "--version"], text=True)
+        except (OSError, subprocess.CalledProcessError):
+            raise ValidationError("failed to run shellcheck")
+
+        for line in output.splitlines():
+            if line.startswith("version:"):
+                return line.split(":", 1)[1].strip()
+
+        # in case the format changes, the entire output is good enough to detect updates
+        return output
+
     def validate(self, path: str):
+        self.validate_files([path])
+
+    def validate_files(self, paths: List[str]):
+        """
+        Validate scripts with a single call of shellcheck. Scripts which have passed validation with the same
+        shellcheck version before are skipped.
+        """
+
         shellcheck_path = self._find_shellcheck()
 
         if not shellcheck_path:
             raise ValidationError("could not find shellcheck")
 
-        try:
-            # SC2116 can be ignored safely, it's just about a "useless echo", but we want to test the version_cmd
-            # feature with an echo call
-            check_call([shellcheck_path, "-e", "SC2116", "-e", "SC1091", "-x", path], cwd=os.path.dirname(path))
-        except CalledProcessError:
+        cache = ShellCheckResultCache()
+        version = self._get_version(shellcheck_path)
+
+        # path -> cache key
+        unchecked = {}
+
+        for path in paths:
+            with open(path, "rb") as f:
+                key = cache.make_key(f.read(), version, self._shellcheck_args)
+
+            if cache.contains(key):
+                self._logger.debug("{} has passed validation before, skipping".format(path))
+            else:
+                unchecked[path] = key
+
+        if not unchecked:
+            return
+
+        self._logger.debug("checking {} script(s) with shellcheck {}".format(len(unchecked), version))
+
+        # the gcc format prints one issue per line, prefixed with the path, which allows for telling the failed files
+        # apart
+        proc = subprocess.run(
+            [shellcheck_path, "--format=gcc"] + self._shellcheck_args + list(unchecked.keys()),
+            stdout=subprocess.PIPE,
+            text=True,
+        )
+
+        # exit code 1 means that issues have been found, anything else means shellcheck failed to run
+        if proc.returncode not in (0, 1):
             raise ValidationError("failed to run shellcheck")
+
+        sys.stdout.write(proc.stdout)
+        sys.stdout.flush()
+
+        failed = []
+
+        for path, key in unchecked.items():
+            if any((line.startswith(path + ":") for line in proc.stdout.splitlines())):
+                failed.append(path)
+            else:
+                cache.add(key, os.path.basename(path))
+
+        if proc.returncode != 0 and not failed:
+            raise ValidationError("shellcheck reported issues which could not be assigned to a file")
+
+        if failed:
+            raise ValidationError(
+                "shellcheck found issues in: {}".format(", ".join((os.path.basename(p) for p in failed)))
+            )
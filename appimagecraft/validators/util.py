@@ -3,12 +3,12 @@ import os.path
 
 from typing import List, Type
 
-from . import ValidatorBase, __all__ as _all_validators
+from . import ValidatorBase, ShellCheckValidator, ValidationError
+from .._logging import get_logger
 
 
 def _get_validators_map() -> dict:
-    validators: List[ValidatorBase] = _all_validators
-    validators.remove(ValidatorBase)
+    validators: List[Type[ValidatorBase]] = [ShellCheckValidator]
 
     rv = {v: v.supported_file_types() for v in validators}
     return rv
@@ -36,7 +36,7 @@ def get_validator(path: str) -> Type[ValidatorBase]:
     if len(suitable_validators) > 1:
         raise ValueError("multiple suitable validators found for path {}".format(path))
     elif len(suitable_validators) < 1:
-        raise KeyError("could not find suitable validator for path {}")
+        raise KeyError("could not find suitable validator for path {}".format(path))
 
     return suitable_validators.pop()
 
@@ -54,3 +54,44 @@ def validate_file(path: str):
     validator_class = get_validator(path)
     validator = validator_class()
     validator.validate(path)
+
+
+def validate_files(paths: List[str]):
+    """
+    Validate files with suitable validators. Every validator is called once with all files it supports. Files for which
+    no validator is available are skipped.
+
+    :param paths: paths to files to validate
+    :raises ValueError: if there are multiple suitable validators and we can't decide which one to use (should not
+        happen!)
+    :raises ValidationError: if validation of any file fails (after all files have been validated)
+    """
+
+    logger = get_logger("validators")
+
+    paths_by_validator = {}
+
+    for path in paths:
+        try:
+            validator_class = get_validator(path)
+        except KeyError:
+            logger.debug("no validator for {}, skipping".format(path))
+            continue
+
+        if not validator_class.is_available():
+            logger.debug("validator {} not available, skipping {}".format(validator_class.__name__, path))
+            continue
+
+        paths_by_validator.setdefault(validator_class, []).append(path)
+
+    errors = []
+
+    for validator_class, validator_paths in paths_by_validator.items():
+        try:
+            validator_class().validate_files(validator_paths)
+        except ValidationError as e:
+            logger.error(e.message)
+            errors.append(e.message)
+
+    if errors:
+        raise ValidationError("; ".join(errors))
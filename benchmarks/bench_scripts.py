@@ -0,0 +1,277 @@
+#! /usr/bin/env python3
+
+"""
+Micro-benchmarks for config parsing and script generation.
+
+Every benchmark is run with synthetic configs of growing size (number of environment variables, CMake variables,
+linuxdeploy plugins, script lines, ...). The results can be saved as a baseline, and later runs can be compared
+against it, failing if any benchmark got slower than the allowed threshold. Baselines are only meaningful on the
+machine they have been recorded on.
+
+Usage:
+
+    python benchmarks/bench_scripts.py --save-baseline baseline.json
+    python benchmarks/bench_scripts.py --compare baseline.json --threshold 0.25
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import timeit
+
+import yaml
+
+# allow running the benchmarks from a source checkout without installing appimagecraft
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from appimagecraft.builders import AutotoolsBuilder, CMakeBuilder, QMakeBuilder, ScriptBuilder  # noqa: E402
+from appimagecraft.generators import (  # noqa: E402
+    AllBuildScriptsGenerator,
+    AppImageBuildScriptGenerator,
+    GenerationManifest,
+)
+from appimagecraft.parsers import AppImageCraftYMLParser  # noqa: E402
+from appimagecraft.validators import ShellCheckValidator  # noqa: E402
+
+
+def make_config(size: int) -> dict:
+    """
+    Generate a synthetic config which uses every builder. All lists and dicts in the config grow with size.
+    """
+
+    env_vars = {"VAR_{}".format(i): "value {}".format(i) for i in range(size)}
+
+    plugin_urls = [
+        "https://example.com/plugins/linuxdeploy-plugin-plugin{}-x86_64.AppImage".format(i) for i in range(size)
+    ]
+
+    return {
+        "version": 1,
+        "project": {
+            "name": "org.example.benchmark",
+            "version": "1.0",
+        },
+        "environment": env_vars,
+        "build": {
+            "cmake": {
+                "generator": "Ninja",
+                "environment": env_vars,
+                "extra_variables": ["VAR_{}=value {}".format(i, i) for i in range(size)],
+                "raw_extra_variables": {"RAW_VAR_{}".format(i): "$HOME/{}".format(i) for i in range(size)},
+                "install_components": ["component{}".format(i) for i in range(size)],
+                "compiler_cache": "ccache",
+                "jobs": {"per_core": 0.5, "memory_per_job": "1G", "max": 32},
+                "cpack": {"generators": ["DEB", "RPM", "TGZ"]},
+            },
+            "autotools": {
+                "configure": {"extra_params": ["--enable-feature-{}".format(i) for i in range(size)]},
+                "compiler_cache": {"tool": "sccache", "max_size": "2G"},
+            },
+            "qmake": {
+                "project_file": "benchmark.pro",
+                "environment": env_vars,
+            },
+            "script": {
+                "commands": ['echo "step {}" && test -n "$BUILD_DIR"'.format(i) for i in range(size)],
+            },
+        },
+        "scripts": {
+            "pre_build": ["echo pre-build {}".format(i) for i in range(size)],
+            "post_build": ['cp -r "$BUILD_DIR"/file{} "$BUILD_DIR"/AppDir/'.format(i) for i in range(size)],
+        },
+        "appimage": {
+            "arch": "x86_64",
+            "linuxdeploy": {
+                "plugins": ["qt", "conda"] + plugin_urls,
+                "environment": env_vars,
+                "extra_args": ["--desktop-file", "benchmark.desktop"],
+            },
+        },
+    }
+
+
+class BenchmarkContext:
+    """
+    Temporary project root and build directories shared by the benchmarks of one size.
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self.config = make_config(size)
+
+        self.project_root_dir = tempfile.mkdtemp(prefix="appimagecraft-bench-project-")
+        self.build_dir = tempfile.mkdtemp(prefix="appimagecraft-bench-build-")
+
+        self.config_path = os.path.join(self.project_root_dir, "appimagecraft.yml")
+
+        with open(self.config_path, "w") as f:
+            yaml.safe_dump(self.config, f)
+
+        # the qmake builder requires the project file to exist
+        with open(os.path.join(self.project_root_dir, "benchmark.pro"), "w"):
+            pass
+
+    def clean_up(self):
+        shutil.rmtree(self.project_root_dir)
+        shutil.rmtree(self.build_dir)
+
+    def builder_config(self, builder_name: str) -> dict:
+        return self.config["build"][builder_name]
+
+    def parse(self):
+        AppImageCraftYMLParser(self.config_path).data()
+
+    def generate_builder_script(self, builder_class):
+        builder_name = {
+            CMakeBuilder: "cmake",
+            AutotoolsBuilder: "autotools",
+            QMakeBuilder: "qmake",
+            ScriptBuilder: "script",
+        }[builder_class]
+
+        builder_class(self.builder_config(builder_name)).generate_build_script(self.project_root_dir, self.build_dir)
+
+    def generate_appimage_script(self):
+        gen = AppImageBuildScriptGenerator(self.config["appimage"])
+        gen.build_file(os.path.join(self.build_dir, "build-appimage.sh"), self.project_root_dir, self.build_dir)
+
+    def generate_all_scripts(self):
+        # without the manifest, all scripts are generated again
+        manifest_path = os.path.join(self.build_dir, GenerationManifest.filename)
+
+        if os.path.exists(manifest_path):
+            os.unlink(manifest_path)
+
+        self.generate_all_scripts_up_to_date()
+
+    def generate_all_scripts_up_to_date(self):
+        AllBuildScriptsGenerator(self.config, self.project_root_dir, "cmake").generate_all_scripts(self.build_dir)
+
+
+def get_benchmarks(context: BenchmarkContext) -> dict:
+    """
+    :return: benchmark name -> callable
+    """
+
+    suffix = "[{}]".format(context.size)
+
+    rv = {"parse config" + suffix: context.parse}
+
+    for builder_class in [CMakeBuilder, AutotoolsBuilder, QMakeBuilder, ScriptBuilder]:
+        rv["{} script{}".format(builder_class.__name__, suffix)] = (
+            lambda builder_class=builder_class: context.generate_builder_script(builder_class)
+        )
+
+    rv["linuxdeploy script" + suffix] = context.generate_appimage_script
+    rv["all scripts" + suffix] = context.generate_all_scripts
+    rv["all scripts (up to date)" + suffix] = context.generate_all_scripts_up_to_date
+
+    return rv
+
+
+def run_benchmark(func, repeat: int) -> float:
+    """
+    Run benchmark function often enough to get a stable result.
+
+    :return: best time per call in seconds
+    """
+
+    timer = timeit.Timer(func)
+
+    # calibrate number of calls so that every repetition takes at least 0.2 seconds
+    number, _ = timer.autorange()
+
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    """
+    :return: names of the benchmarks which regressed by more than the threshold
+    """
+
+    rv = []
+
+    for name, duration in results.items():
+        try:
+            baseline_duration = baseline[name]
+        except KeyError:
+            print("{}: not in baseline".format(name))
+            continue
+
+        change = duration / baseline_duration - 1
+
+        if change > threshold:
+            rv.append(name)
+
+        print("{:<40} {:>+8.1f} %{}".format(name, change * 100, "  REGRESSION" if change > threshold else ""))
+
+    return rv
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 10, 100], help="Config sizes to benchmark")
+    parser.add_argument("--repeat", type=int, default=5, help="Number of repetitions, the best one is reported")
+    parser.add_argument("--filter", help="Run only benchmarks whose name contains this string")
+    parser.add_argument("--save-baseline", dest="save_baseline", help="Save results as baseline to this file")
+    parser.add_argument("--compare", help="Compare results to baseline from this file")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.25,
+        help="Maximum allowed slowdown compared to the baseline (default: 0.25, i.e., 25 %%)",
+    )
+
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    # the time spent in the external shellcheck process is not what we want to measure here
+    ShellCheckValidator.is_available = staticmethod(lambda: False)
+
+    results = {}
+
+    for size in args.sizes:
+        context = BenchmarkContext(size)
+
+        try:
+            for name, func in get_benchmarks(context).items():
+                if args.filter and args.filter not in name:
+                    continue
+
+                duration = run_benchmark(func, args.repeat)
+                results[name] = duration
+
+                print("{:<40} {:>12.1f} us".format(name, duration * 1000000))
+
+        finally:
+            context.clean_up()
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(results, f, indent=4)
+
+        print("Saved baseline to {}".format(args.save_baseline))
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+        print()
+        print("Comparison with baseline {} (threshold: {:.0f} %):".format(args.compare, args.threshold * 100))
+
+        regressions = compare(results, baseline, args.threshold)
+
+        if regressions:
+            print("{} benchmark(s) regressed".format(len(regressions)))
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+#! /usr/bin/env python3
+
+"""
+Startup benchmark for the appimagecraft CLI.
+
+Runs typical invocations with python -X importtime and measures the total time spent importing modules. The results
+can be saved as a baseline, and later runs can be compared against it, failing if any scenario got slower than the
+allowed threshold. This catches modules which are accidentally imported eagerly again. Every scenario is run several
+times, the best run is reported. Baselines are only meaningful on the machine they have been recorded on.
+
+The build scenario does not run an actual build (which would require downloading tools), but loads everything the
+build command needs before it calls the main build script.
+
+Usage:
+
+    python benchmarks/bench_startup.py --save-baseline baseline.json
+    python benchmarks/bench_startup.py --compare baseline.json --threshold 0.25
+"""
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+# before making the imports lazy, all scenarios took 200-300 ms
+SCENARIOS = ["--list-commands", "genscripts", "build"]
+
+CONFIG = """
+version: 1
+project:
+  name: org.example.startup
+  version: 1
+build:
+  script:
+    commands:
+      - echo hello
+scripts:
+  post_build:
+    - echo bye
+"""
+
+BUILD_SCENARIO_CODE = """
+from appimagecraft import _cli, _logging, commands, builders
+_logging.setup()
+commands.BuildCommand
+builders.ScriptBuilder
+"""
+
+
+def get_scenario_args(scenario: str, project_dir: str) -> list:
+    if scenario == "--list-commands":
+        return ["-m", "appimagecraft", "--list-commands"]
+
+    if scenario == "genscripts":
+        return ["-m", "appimagecraft", "genscripts", "-d", os.path.join(project_dir, "build")]
+
+    if scenario == "build":
+        return ["-c", BUILD_SCENARIO_CODE]
+
+    raise ValueError("unknown scenario: {}".format(scenario))
+
+
+def parse_importtime(output: str):
+    """
+    Parse output of python -X importtime.
+
+    :return: total import time in seconds, number of imported modules
+    """
+
+    total = 0
+    count = 0
+
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+
+        _, cumulative, name = line.split(":", 1)[1].split("|")
+
+        count += 1
+
+        # nested imports are indented, their time is included in the top-level import's cumulative time
+        if not name.startswith("  "):
+            total += int(cumulative)
+
+    return total / 1000000, count
+
+
+def run_scenario(scenario: str, project_dir: str):
+    """
+    :return: import time in seconds, number of imported modules, wall clock time in seconds
+    """
+
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [REPO_ROOT, env.get("PYTHONPATH", None)]))
+
+    args = [sys.executable, "-X", "importtime"] + get_scenario_args(scenario, project_dir)
+
+    start = time.time()
+    proc = subprocess.run(args, cwd=project_dir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    wall_time = time.time() - start
+
+    if proc.returncode != 0:
+        raise RuntimeError("scenario {} failed:\n{}".format(scenario, proc.stderr))
+
+    import_time, count = parse_importtime(proc.stderr)
+
+    return import_time, count, wall_time
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    """
+    :return: names of the scenarios which regressed by more than the threshold
+    """
+
+    rv = []
+
+    for name, import_time in results.items():
+        try:
+            baseline_import_time = baseline[name]
+        except KeyError:
+            print("{}: not in baseline".format(name))
+            continue
+
+        change = import_time / baseline_import_time - 1
+
+        if change > threshold:
+            rv.append(name)
+
+        print("{:<16} {:>+8.1f} %{}".format(name, change * 100, "  REGRESSION" if change > threshold else ""))
+
+    return rv
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+
+    parser.add_argument("--repeat", type=int, default=5, help="Number of runs per scenario, the best one is reported")
+    parser.add_argument("--save-baseline", dest="save_baseline", help="Save results as baseline to this file")
+    parser.add_argument("--compare", help="Compare results to baseline from this file")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.25,
+        help="Maximum allowed slowdown compared to the baseline (default: 0.25, i.e., 25 %%)",
+    )
+
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    project_dir = tempfile.mkdtemp(prefix="appimagecraft-bench-startup-")
+
+    results = {}
+
+    try:
+        with open(os.path.join(project_dir, "appimagecraft.yml"), "w") as f:
+            f.write(CONFIG)
+
+        print("{:<16} {:>12} {:>8} {:>12}".format("scenario", "import time", "modules", "wall time"))
+
+        for scenario in SCENARIOS:
+            build_dir = os.path.join(project_dir, "build")
+
+            runs = []
+
+            for _ in range(args.repeat):
+                os.makedirs(build_dir, exist_ok=True)
+                runs.append(run_scenario(scenario, project_dir))
+                shutil.rmtree(build_dir)
+
+            import_time, count, wall_time = min(runs)
+
+            results[scenario] = import_time
+
+            print("{:<16} {:>9.1f} ms {:>8} {:>9.1f} ms".format(scenario, import_time * 1000, count, wall_time * 1000))
+
+    finally:
+        shutil.rmtree(project_dir)
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(results, f, indent=4)
+
+        print("Saved baseline to {}".format(args.save_baseline))
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+        print()
+        print("Comparison with baseline {} (threshold: {:.0f} %):".format(args.compare, args.threshold * 100))
+
+        regressions = compare(results, baseline, args.threshold)
+
+        if regressions:
+            print("{} scenario(s) regressed".format(len(regressions)))
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()